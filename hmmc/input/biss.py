@@ -0,0 +1,331 @@
+"""
+BiSS-C / SSI
+============
+
+Synchronous serial absolute encoder interfaces. The master drives the clock line (MA), and the
+encoder shifts its position out on the data line (SLO), MSB first.
+"""
+
+from migen import Module, Signal, FSM, NextState, NextValue, If, Cat
+from migen.genlib.misc import WaitTimer
+from hmmc.math.fixedpoint import FixedPointSignal
+
+
+class BiSSMaster(Module):
+    """BiSS-C (point-to-point) or SSI absolute encoder master
+
+    A BiSS-C frame is made of the acknowledge, start and CDS bits, followed by the position
+    (`resolution` bits), the active-low error and warning bits and an inverted CRC6 (polynomial
+    0x43). The CRC is computed bit-serially while receiving, so the position is available the
+    clock cycle after its last bit has been sampled.
+
+    The round trip delay of the line is compensated: the sampling point is aligned on the
+    acknowledge edge seen by the master, then every bit is sampled in its middle. The measured
+    delay is available on `line_delay`. In SSI mode, there is no acknowledge so the sampling point
+    is set by `delay`.
+
+    A new frame is started on `trigger`, or continuously when `auto` is '1', once the encoder
+    has released the data line.
+
+    :param fclk: clock frequency of the design
+    :type fclk: int
+    :param frequency: default MA clock frequency
+    :type frequency: int
+    :param resolution: number of position bits (single turn and multi turn) in a frame
+    :type resolution: int
+    :param ssi: SSI mode: frames are only made of the position bits
+    :type ssi: bool
+    :param gray: SSI mode: the position is gray encoded
+    :type gray: bool
+    :param divider_resolution: resolution in bits of `divider`
+    :type divider_resolution: int
+    :param idle_time: minimum time in seconds between two frames, for the encoder to latch a new
+      position (BiSS timeout, SSI monoflop time)
+    :type idle_time: float
+    :param timeout: an error is raised when the encoder does not answer for `timeout` seconds
+    :type timeout: float
+
+    :inputs:
+        - **slo** ( :class:`migen.fhdl.structure.Signal` ) - encoder data line (from the line
+          receiver)
+        - **divider** ( :class:`migen.fhdl.structure.Signal` (divider_resolution)) - MA half
+          period in clock cycles, at least 2
+        - **delay** ( :class:`migen.fhdl.structure.Signal` (16)) - SSI mode: line round trip delay
+          in clock cycles, as `line_delay` would measure it in BiSS mode
+        - **trigger** ( :class:`migen.fhdl.structure.Signal` ) - start a new frame
+        - **auto** ( :class:`migen.fhdl.structure.Signal` ) - start new frames continuously
+
+    :outputs:
+        - **ma** ( :class:`migen.fhdl.structure.Signal` ) - encoder clock line (to the line driver)
+        - **position** ( :class:`migen.fhdl.structure.Signal` (resolution)) - position output
+        - **position_valid** ( :class:`migen.fhdl.structure.Signal` ) - position output valid
+        - **error** ( :class:`migen.fhdl.structure.Signal` ) - set to '1' when any error happens
+        - **critical_error** ( :class:`migen.fhdl.structure.Signal` ) - set to '1' on two
+          consecutive errors
+        - **crc_error** ( :class:`migen.fhdl.structure.Signal` ) - '1' when a CRC error is
+          detected
+        - **encoder_error** ( :class:`migen.fhdl.structure.Signal` ) - '1' when the encoder
+          reports an error (nE bit)
+        - **timeout_error** ( :class:`migen.fhdl.structure.Signal` ) - '1' when the encoder does
+          not answer
+        - **warning** ( :class:`migen.fhdl.structure.Signal` ) - the encoder reported a warning
+          (nW bit) in the last valid frame
+        - **line_delay** ( :class:`migen.fhdl.structure.Signal` (16)) - BiSS mode: measured line
+          round trip delay in clock cycles, including the 2 cycles of resynchronization
+        - **idle** ( :class:`migen.fhdl.structure.Signal` ) - '1' when no frame is in progress
+    """
+    crc_polynomial = 0x43
+    crc_bits = 6
+
+    def __init__(self, fclk, frequency=5000000, resolution=24, ssi=False, gray=False,
+                 divider_resolution=8, idle_time=20e-6, timeout=100e-6):
+        default_divider = round(fclk / (2 * frequency))
+        assert 2 <= default_divider < 2**divider_resolution
+        assert gray is False or ssi
+
+        # inputs
+        self.slo = Signal(reset=1)
+        self.divider = Signal(divider_resolution, reset=default_divider)
+        self.delay = Signal(16)
+        self.trigger = Signal()
+        self.auto = Signal(reset=1)
+
+        # outputs
+        self.ma = Signal(reset=1)
+        self.position = Signal(resolution, reset_less=True)
+        self.position_valid = Signal()
+        self.error = Signal()
+        self.critical_error = Signal()
+        self.crc_error = Signal()
+        self.encoder_error = Signal()
+        self.timeout_error = Signal()
+        self.warning = Signal()
+        self.line_delay = Signal(16)
+        self.idle = Signal()
+        self.shaft_position = FixedPointSignal(resolution)
+        self.shaft_position_valid = self.position_valid
+
+        # # #
+
+        self.comb += self.shaft_position.eq(self.position)
+
+        slo_f = Signal(2, reset=0b11)
+        sl = Signal()
+        self.sync += slo_f.eq(Cat(self.slo, slo_f[0]))
+        self.comb += sl.eq(slo_f[1])
+
+        pending = Signal()
+        start = Signal()
+        self.sync += If(self.trigger,
+            pending.eq(1),
+        ).Elif(start,
+            pending.eq(0),
+        )
+
+        # MA clock generation: MA falls `divider` clock cycles after `clocking` is set
+        clocking = Signal()
+        ma_cnt = Signal(divider_resolution)
+        ma_rise = Signal()
+        self.comb += ma_rise.eq(clocking & (ma_cnt == 0) & ~self.ma)
+        self.sync += If(clocking,
+            If(ma_cnt == 0,
+                ma_cnt.eq(self.divider - 1),
+                self.ma.eq(~self.ma),
+            ).Else(
+                ma_cnt.eq(ma_cnt - 1),
+            ),
+        ).Else(
+            ma_cnt.eq(self.divider - 1),
+            self.ma.eq(1),
+        )
+
+        # sampling point, in the middle of each bit once aligned
+        sample_cnt = Signal(max(divider_resolution + 1, 16) + 1)
+        sample = Signal()
+        align = Signal()
+        align_value = Signal.like(sample_cnt)
+        self.comb += sample.eq(sample_cnt == 0)
+        self.sync += If(align,
+            sample_cnt.eq(align_value),
+        ).Elif(sample,
+            sample_cnt.eq(2 * self.divider - 1),
+        ).Else(
+            sample_cnt.eq(sample_cnt - 1),
+        )
+
+        self.submodules.idle_timer = idle_timer = WaitTimer(max(1, int(idle_time * fclk)))
+        self.submodules.watchdog = watchdog = WaitTimer(int(timeout * fclk))
+        watchdog_restart = Signal()
+        self.comb += watchdog.wait.eq(~self.idle & ~watchdog_restart)
+
+        data = Signal(resolution)
+        bit_cnt = Signal(max=max(resolution, self.crc_bits))
+        edges = Signal(2)
+        delay_cnt = Signal(16)
+        crc = Signal(self.crc_bits)
+        crc_next = Signal(self.crc_bits)
+        crc_ok = Signal()
+        n_error = Signal()
+        n_warning = Signal()
+        # x^6 + x + 1, MSB first
+        self.comb += crc_next.eq(Cat(crc[5] ^ sl, crc[0] ^ crc[5] ^ sl, crc[1:5]))
+
+        binary = Signal(resolution)
+        if gray:
+            self.comb += binary[-1].eq(data[-1])
+            for i in range(resolution - 1):
+                self.comb += binary[i].eq(binary[i + 1] ^ data[i])
+        else:
+            self.comb += binary.eq(data)
+
+        frame_ok = Signal()
+        self.comb += frame_ok.eq(crc_ok & n_error)
+
+        no_answer = If(watchdog.done,
+            NextValue(clocking, 0),
+            NextState("WAIT"),
+        )
+
+        self.submodules.fsm = fsm = FSM("IDLE")
+        fsm.act("IDLE",
+            self.idle.eq(1),
+            If((pending | self.auto) & sl,
+                start.eq(1),
+                NextValue(clocking, 1),
+                NextValue(edges, 0),
+                NextValue(delay_cnt, 0),
+                NextValue(crc_ok, 1),
+                NextValue(n_error, 1),
+                NextValue(n_warning, 1),
+                NextValue(bit_cnt, resolution - 1),
+                NextState("SSI_FIRST" if ssi else "ACK"),
+            ),
+        )
+        # BiSS-C
+        fsm.act("ACK",
+            no_answer,
+            If(ma_rise & (edges != 2),
+                NextValue(edges, edges + 1),
+            ),
+            If(edges == 2,
+                # the encoder acknowledges on the second rising edge of MA
+                NextValue(delay_cnt, delay_cnt + 1),
+                If(~sl,
+                    NextValue(self.line_delay, delay_cnt),
+                    align.eq(1),
+                    align_value.eq(self.divider - 1),
+                    NextState("START"),
+                ),
+            ),
+        )
+        fsm.act("START",
+            no_answer,
+            If(sample & sl,
+                NextState("CDS"),
+            ),
+        )
+        fsm.act("CDS",
+            no_answer,
+            If(sample,
+                NextValue(crc, 0),
+                NextState("DATA"),
+            ),
+        )
+        fsm.act("DATA",
+            no_answer,
+            If(sample,
+                NextValue(data, Cat(sl, data[0:-1])),
+                NextValue(crc, crc_next),
+                NextValue(bit_cnt, bit_cnt - 1),
+                If(bit_cnt == 0,
+                    NextState("SSI_END" if ssi else "ERROR_BIT"),
+                ),
+            ),
+        )
+        fsm.act("ERROR_BIT",
+            no_answer,
+            If(sample,
+                NextValue(n_error, sl),
+                NextValue(crc, crc_next),
+                NextState("WARNING_BIT"),
+            ),
+        )
+        fsm.act("WARNING_BIT",
+            no_answer,
+            If(sample,
+                NextValue(n_warning, sl),
+                NextValue(crc, crc_next),
+                NextValue(bit_cnt, self.crc_bits - 1),
+                NextState("CRC"),
+            ),
+        )
+        fsm.act("CRC",
+            no_answer,
+            If(sample,
+                # the CRC is transmitted inverted
+                If(sl == crc[-1],
+                    NextValue(crc_ok, 0),
+                ),
+                NextValue(crc, crc << 1),
+                NextValue(bit_cnt, bit_cnt - 1),
+                If(bit_cnt == 0,
+                    NextValue(clocking, 0),
+                    If(crc_ok & (sl != crc[-1]) & n_error,
+                        NextValue(self.position, binary),
+                    ),
+                    NextState("RESULT"),
+                ),
+            ),
+        )
+        # SSI
+        fsm.act("SSI_FIRST",
+            no_answer,
+            If(ma_rise,
+                # the encoder shifts the first bit out on the first rising edge of MA
+                align.eq(1),
+                align_value.eq(self.delay + self.divider),  # MA rises on the next cycle
+                NextState("DATA"),
+            ),
+        )
+        fsm.act("SSI_END",
+            NextValue(clocking, 0),
+            NextValue(self.position, binary),
+            NextState("RESULT"),
+        )
+        fsm.act("RESULT",
+            If(frame_ok,
+                self.position_valid.eq(1),
+                NextValue(self.warning, ~n_warning),
+            ).Elif(~crc_ok,
+                self.crc_error.eq(1),
+            ).Else(
+                self.encoder_error.eq(1),
+            ),
+            NextState("WAIT"),
+        )
+        fsm.act("WAIT",
+            idle_timer.wait.eq(1),
+            If(idle_timer.done & sl,
+                NextState("IDLE"),
+            ),
+        )
+        # an encoder which does not answer raises an error every `timeout`, until it is released
+        self.comb += If(watchdog.done,
+            self.timeout_error.eq(1),
+            watchdog_restart.eq(1),
+        )
+        self.comb += self.error.eq(self.crc_error | self.encoder_error | self.timeout_error)
+
+        error_cnt = Signal()
+        self.sync += [
+            If(self.error,
+                If(error_cnt == 1,
+                    self.critical_error.eq(1),
+                ).Else(
+                    error_cnt.eq(error_cnt + 1),
+                ),
+            ).Elif(self.position_valid,
+                error_cnt.eq(0),
+                self.critical_error.eq(0),
+            ),
+        ]
@@ -0,0 +1,140 @@
+"""
+Position extrapolation
+======================
+
+Encoder positions are always a bit old when they are used: serial encoders latch the position when
+they receive the request, and an incremental encoder position is only exact at its last edge.
+Using the timestamp attached to each position sample, the position can be projected to the time
+at which it is actually used.
+"""
+
+from migen import Module, Signal, If, Cat, C, Mux
+from hmmc.math.dsp import DivSequential
+
+
+class PositionExtrapolator(Module):
+    """Projects timestamped position samples to a requested time
+
+    The velocity is estimated from the last two samples with a :class:`hmmc.math.dsp.DivSequential`
+    (a new estimation is started on each sample, unless the divider is still busy), then the
+    position is extrapolated linearly from the last sample:
+
+    `output = position + velocity * (target - position_timestamp)`
+
+    The extrapolation time is limited to `horizon`, so that the output does not run away when the
+    samples stop (encoder failure, or incremental encoder at standstill).
+
+    Any module with `position`, `position_valid` and `position_timestamp` outputs can be used as
+    source, such as :class:`hmmc.input.quadrature.QEI` or
+    :class:`hmmc.input.mitsubishi.ECNMEncoder`.
+
+    :param resolution: resolution in bits of the position
+    :type resolution: int
+    :param timestamp_resolution: resolution in bits of the timestamps
+    :type timestamp_resolution: int
+    :param period_resolution: resolution in bits of the time between two samples, and of the
+      extrapolation time. Longer times saturate
+    :type period_resolution: int
+    :param velocity_fraction: number of fractional bits of `velocity`
+    :type velocity_fraction: int
+    :param output_fraction: number of fractional bits of `output`, to interpolate between two
+      increments. At most `velocity_fraction`
+    :type output_fraction: int
+
+    :inputs:
+        - **position** ( :class:`migen.fhdl.structure.Signal` (resolution)) - position sample
+        - **position_valid** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when
+          `position` and `position_timestamp` are updated
+        - **position_timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) -
+          time at which `position` was latched
+        - **target** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) - time to which
+          the position is projected, typically the current timestamp plus the latency of the
+          consumer
+        - **horizon** ( :class:`migen.fhdl.structure.Signal` (period_resolution)) - maximum
+          extrapolation time, in clock cycles
+
+    :outputs:
+        - **velocity** ( :class:`migen.fhdl.structure.Signal` (resolution + velocity_fraction,
+          True)) - estimated velocity in increments per clock cycle, with `velocity_fraction`
+          fractional bits
+        - **velocity_valid** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when
+          `velocity` is updated
+        - **output** ( :class:`migen.fhdl.structure.Signal` (resolution + output_fraction)) -
+          extrapolated position with `output_fraction` fractional bits, `latency` clock cycles
+          after `target`
+    """
+    latency = 3
+
+    def __init__(self, resolution=24, timestamp_resolution=32, period_resolution=16,
+                 velocity_fraction=16, output_fraction=0):
+        assert output_fraction <= velocity_fraction
+
+        # inputs
+        self.position = Signal(resolution)
+        self.position_valid = Signal()
+        self.position_timestamp = Signal(timestamp_resolution)
+        self.target = Signal(timestamp_resolution)
+        self.horizon = Signal(period_resolution, reset=2**period_resolution - 1)
+
+        # outputs
+        self.velocity = Signal((resolution + velocity_fraction, True))
+        self.velocity_valid = Signal()
+        self.output = Signal(resolution + output_fraction)
+
+        # # #
+
+        # velocity estimation
+        self.submodules.div = div = DivSequential(resolution + velocity_fraction,
+            period_resolution)
+        last_position = Signal(resolution)
+        last_timestamp = Signal(timestamp_resolution)
+        primed = Signal()
+        delta = Signal((resolution, True))
+        delta_abs = Signal(resolution)
+        period = Signal(timestamp_resolution)
+        negative = Signal()
+        self.comb += [
+            delta.eq(self.position - last_position),
+            delta_abs.eq(Mux(delta < 0, -delta, delta)),
+            period.eq(self.position_timestamp - last_timestamp),
+            div.dividend.eq(Cat(C(0, velocity_fraction), delta_abs)),
+            div.divisor.eq(Mux(period > 2**period_resolution - 1, 2**period_resolution - 1,
+                period)),
+            div.start.eq(self.position_valid & primed & (period != 0)),
+        ]
+        self.sync += [
+            If(self.position_valid,
+                last_position.eq(self.position),
+                last_timestamp.eq(self.position_timestamp),
+                primed.eq(1),
+            ),
+            If(div.start & ~div.busy,
+                negative.eq(delta < 0),
+            ),
+            self.velocity_valid.eq(div.done),
+            If(div.done,
+                self.velocity.eq(Mux(negative, -div.quotient, div.quotient)),
+            ),
+        ]
+
+        # extrapolation
+        elapsed = Signal(timestamp_resolution)
+        elapsed_clamped = Signal((period_resolution + 1, True))
+        position_1 = Signal(resolution)
+        position_2 = Signal(resolution)
+        product = Signal((resolution + velocity_fraction + period_resolution + 1, True))
+        self.comb += elapsed.eq(self.target - last_timestamp)
+        self.sync += [
+            If(elapsed[-1],  # target is before the last sample
+                elapsed_clamped.eq(0),
+            ).Elif(elapsed > self.horizon,
+                elapsed_clamped.eq(self.horizon),
+            ).Else(
+                elapsed_clamped.eq(elapsed),
+            ),
+            position_1.eq(last_position),
+            product.eq(self.velocity * elapsed_clamped),
+            position_2.eq(position_1),
+            self.output.eq((position_2 << output_fraction)
+                + product[velocity_fraction - output_fraction:velocity_fraction + resolution]),
+        ]
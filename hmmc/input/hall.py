@@ -0,0 +1,232 @@
+"""
+Hall Sensors
+============
+
+Brushless motors are often fitted with 3 Hall sensors, which divide each electrical turn in 6
+sectors of 60°. The sector alone is enough for trapezoidal (6-step) commutation; sinusoidal
+commutation requires an angle, which is interpolated within the sector from the duration of the
+previous one.
+"""
+
+from migen import Module, Signal, If, Case, Array, Cat
+from hmmc.input.quadrature import GlitchFilter
+from hmmc.math.dsp import DivSequential
+
+
+class HallDecoder(Module):
+    """Hall sensors decoder with angle interpolation
+
+    The Hall inputs are resynchronized, filtered by :class:`hmmc.input.quadrature.GlitchFilter` and
+    decoded into a sector:
+
+    ===== ===== ===== ======
+    w     v     u     sector
+    ===== ===== ===== ======
+    0     0     1     0
+    0     1     1     1
+    0     1     0     2
+    1     1     0     3
+    1     0     0     4
+    1     0     1     5
+    ===== ===== ===== ======
+
+    Codes 000 and 111 are invalid. Sector `s` starts at the electrical angle `s` * 60°.
+
+    On each transition between two adjacent sectors, the angle is set to the boundary between the
+    sectors, and the width of the sector which has just been left is divided by its duration to get
+    the angular velocity. The angle is then advanced by this velocity every clock cycle, but never
+    leaves the current sector: if the motor decelerates, the angle waits at the end of the sector
+    for the next transition.
+
+    The velocity is 0, and the angle is not interpolated:
+
+    - at startup, until two transitions in the same direction have been seen. The angle is first set
+      to the middle of the sector
+    - when the direction changes
+    - after a skipped sector. The angle is set to the middle of the new sector
+    - when a sector lasts longer than 2**timer_resolution - 1 clock cycles (`stopped`)
+
+    :param lut_resolution: resolution in bits of `angle`. A full electrical turn is
+      2**lut_resolution
+    :type lut_resolution: int
+    :param fraction: number of fractional bits of the internal angle
+    :type fraction: int
+    :param timer_resolution: resolution in bits of the sector duration timer
+    :type timer_resolution: int
+    :param filter_resolution: resolution in bits of the glitch filter length
+    :type filter_resolution: int
+    :param default_filter: glitch filter length at reset, in clock cycles
+    :type default_filter: int
+
+    :inputs:
+        - **u** ( :class:`migen.fhdl.structure.Signal` ) - Hall sensor u
+        - **v** ( :class:`migen.fhdl.structure.Signal` ) - Hall sensor v
+        - **w** ( :class:`migen.fhdl.structure.Signal` ) - Hall sensor w
+        - **filter_length** ( :class:`migen.fhdl.structure.Signal` (filter_resolution)) - see
+          :class:`hmmc.input.quadrature.GlitchFilter` `length`
+        - **angle_offset** ( :class:`migen.fhdl.structure.Signal` (lut_resolution)) - added to
+          `angle`, to align the sensors with the motor phases
+
+    :outputs:
+        - **angle** ( :class:`migen.fhdl.structure.Signal` (lut_resolution)) - interpolated
+          electrical angle, updated every clock cycle. Can be directly connected to
+          :class:`hmmc.regulator.hyst.LutRegulator` `lut_sel`
+        - **sector** ( :class:`migen.fhdl.structure.Signal` (3)) - current sector, from 0 to 5
+        - **direction** ( :class:`migen.fhdl.structure.Signal` ) - direction of the last
+          transition, '1' when the sector decreases
+        - **period** ( :class:`migen.fhdl.structure.Signal` (timer_resolution)) - duration of the
+          last sector, in clock cycles
+        - **period_valid** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when
+          `period` is updated
+        - **velocity** ( :class:`migen.fhdl.structure.Signal` (lut_resolution + fraction)) -
+          interpolation velocity, in 2**-(lut_resolution + fraction) turn per clock cycle
+        - **stopped** ( :class:`migen.fhdl.structure.Signal` ) - '1' when the current sector lasts
+          too long to be measured
+        - **hall_error** ( :class:`migen.fhdl.structure.Signal` ) - '1' while the code is invalid,
+          or for 1 clk tick when a skipped sector is detected
+    """
+    def __init__(self, lut_resolution=10, fraction=16, timer_resolution=24, filter_resolution=4,
+                 default_filter=0):
+        width = lut_resolution + fraction
+        starts = [round(s * 2**width / 6) for s in range(7)]
+        # 3 bits indexes: pad the tables to 8 entries
+        sector_starts = Array(starts[:6] + [0, 0])
+        sector_widths = Array([starts[s + 1] - starts[s] for s in range(6)] + [0, 0])
+
+        # inputs
+        self.u = Signal()
+        self.v = Signal()
+        self.w = Signal()
+        self.angle_offset = Signal(lut_resolution)
+
+        # outputs
+        self.angle = Signal(lut_resolution)
+        self.sector = Signal(3)
+        self.direction = Signal()
+        self.period = Signal(timer_resolution)
+        self.period_valid = Signal()
+        self.velocity = Signal(width)
+        self.stopped = Signal()
+        self.hall_error = Signal()
+
+        # # #
+
+        # resynchronization and glitch filtering
+        hall_f = [Signal(3) for _ in range(2)]
+        self.sync += [
+            hall_f[0].eq(Cat(self.u, self.v, self.w)),
+            hall_f[1].eq(hall_f[0]),
+        ]
+        filters = [GlitchFilter(filter_resolution, 1, default_filter) for _ in range(3)]
+        self.submodules += filters
+        self.filter_length = filters[0].length
+        code = Signal(3)
+        for i, f in enumerate(filters):
+            self.comb += [
+                f.input.eq(hall_f[1][i]),
+                code[i].eq(f.output),
+            ]
+            if i > 0:
+                self.comb += f.length.eq(filters[0].length)
+
+        # sector decoding
+        new_sector = Signal(3)
+        code_valid = Signal()
+        self.comb += [
+            code_valid.eq(1),
+            Case(code, {
+                0b001: new_sector.eq(0),
+                0b011: new_sector.eq(1),
+                0b010: new_sector.eq(2),
+                0b110: new_sector.eq(3),
+                0b100: new_sector.eq(4),
+                0b101: new_sector.eq(5),
+                "default": code_valid.eq(0),
+            }),
+        ]
+
+        primed = Signal()
+        transition = Signal()
+        forward = Signal()
+        backward = Signal()
+        next_sectors = Array([(s + 1) % 6 for s in range(6)] + [0, 0])
+        prev_sectors = Array([(s - 1) % 6 for s in range(6)] + [0, 0])
+        self.comb += [
+            transition.eq(primed & code_valid & (new_sector != self.sector)),
+            forward.eq(new_sector == next_sectors[self.sector]),
+            backward.eq(new_sector == prev_sectors[self.sector]),
+        ]
+
+        # sector duration and velocity
+        timer = Signal(timer_resolution)
+        tracking = Signal()  # the last transition was a valid step, without timeout since
+        self.submodules.div = div = DivSequential(width, timer_resolution)
+        self.comb += [
+            self.stopped.eq(timer == 2**timer_resolution - 1),
+            div.dividend.eq(sector_widths[self.sector]),
+            div.divisor.eq(timer),
+            div.start.eq(transition & tracking & ~self.stopped
+                & ((forward & ~self.direction) | (backward & self.direction))),
+        ]
+        speed_ok = Signal()  # the pending division is still relevant
+        self.sync += [
+            self.period_valid.eq(transition),
+            If(transition,
+                timer.eq(0),
+                self.period.eq(timer),
+                tracking.eq(forward | backward),
+                speed_ok.eq(div.start),
+                If(~div.start,
+                    self.velocity.eq(0),
+                ),
+            ).Elif(self.stopped,
+                tracking.eq(0),
+                speed_ok.eq(0),
+                self.velocity.eq(0),
+            ).Else(
+                timer.eq(timer + 1),
+            ),
+            If(div.done & speed_ok,
+                self.velocity.eq(div.quotient),
+            ),
+        ]
+
+        # interpolation within the sector
+        sub_angle = Signal(width)
+        self.sync += [
+            self.hall_error.eq(~code_valid | (transition & ~forward & ~backward)),
+            If(code_valid & ~primed,
+                primed.eq(1),
+                self.sector.eq(new_sector),
+                sub_angle.eq(sector_widths[new_sector] >> 1),
+            ).Elif(transition,
+                self.sector.eq(new_sector),
+                If(forward,
+                    self.direction.eq(0),
+                    sub_angle.eq(0),
+                ).Elif(backward,
+                    self.direction.eq(1),
+                    sub_angle.eq(sector_widths[new_sector] - 1),
+                ).Else(
+                    sub_angle.eq(sector_widths[new_sector] >> 1),
+                ),
+            ).Elif(~self.direction,
+                If(sub_angle + self.velocity >= sector_widths[self.sector],
+                    sub_angle.eq(sector_widths[self.sector] - 1),
+                ).Else(
+                    sub_angle.eq(sub_angle + self.velocity),
+                ),
+            ).Else(
+                If(sub_angle < self.velocity,
+                    sub_angle.eq(0),
+                ).Else(
+                    sub_angle.eq(sub_angle - self.velocity),
+                ),
+            ),
+        ]
+
+        angle = Signal(width)
+        self.comb += [
+            angle.eq(sector_starts[self.sector] + sub_angle),
+            self.angle.eq(angle[fraction:] + self.angle_offset),
+        ]
@@ -1,18 +1,33 @@
 """Mitsubishi serial protocol compatible with OBA17-052 encoder found in  HC-MFS23 and alike
 """
 
-from migen import Module, Signal, FSM, NextState, NextValue, If
+from migen import Module, Signal, FSM, NextState, NextValue, If, Array, Memory, Cat
 from migen.genlib.misc import WaitTimer
 from hmmc.math.fixedpoint import FixedPointSignal
+from hmmc.utils.uart import UartRx, UartTx
 
 
 class ECNMEncoder(Module):
     """Mitsubishi serial protocol compatible with OBA17-052 encoder found in  HC-MFS23 and alike.
 
-    This module must be connected to an UART setup to transmit at 2.5Mbps.
+    This module must be connected to an UART setup to transmit at 2.5Mbps. See
+    :class:`ECNMEncoderSerial` for a version with an integrated UART.
+
+    The next request is sent as soon as a frame is received with a valid checksum and the `guard`
+    time has elapsed, so that the encoder has released the RS485 bus. After an error, the module
+    waits for the line to be silent before sending the next request.
 
     :param fclk: clock frequency of the design
     :type fclk: int
+    :param guard_bits: delay between the end of a valid frame and the next request, in bit time
+    :type guard_bits: float
+    :param stats_resolution: resolution of the statistics counters
+    :type stats_resolution: int
+    :param timestamp_resolution: resolution in bits for the timestamp counter
+    :type timestamp_resolution: int
+    :param timestamp: if not None, use this signal as timestamp instead of an internal counter, so
+      that it can be shared with other modules
+    :type timestamp: :class:`migen.fhdl.structure.Signal`
 
     :inputs:
         - **rx** ( :class:`migen.fhdl.structure.Signal` (8))) - serial receive data (from UART)
@@ -36,12 +51,29 @@ class ECNMEncoder(Module):
           consecutive errors
         - **cs_error** ( :class:`migen.fhdl.structure.Signal` ) - '1' when a checksum error is
           detected
+        - **update_period** ( :class:`migen.fhdl.structure.Signal` (32)) - clock cycles between the
+          last two `position_valid`
+        - **latency** ( :class:`migen.fhdl.structure.Signal` (32)) - clock cycles between the last
+          request and its `position_valid`
+        - **error_count** ( :class:`migen.fhdl.structure.Signal` (stats_resolution)) - saturating
+          count of errors
+        - **cs_error_count** ( :class:`migen.fhdl.structure.Signal` (stats_resolution)) -
+          saturating count of checksum errors
+        - **timeout_count** ( :class:`migen.fhdl.structure.Signal` (stats_resolution)) -
+          saturating count of incomplete or missing responses
+        - **timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) - free
+          running cycle counter
+        - **position_timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) -
+          timestamp of the end of the request of `position`, when the encoder latched it. Updated
+          with `position`
     """
 
     baudrate = 2500000
     cmd = 0x32
+    frame_length = 9  # bytes, including the command echo and the checksum
 
-    def __init__(self, fclk):
+    def __init__(self, fclk, guard_bits=2, stats_resolution=16, timestamp_resolution=32,
+                 timestamp=None):
         # inputs
         self.rx = Signal(8)
         self.rx_valid = Signal()
@@ -59,6 +91,18 @@ class ECNMEncoder(Module):
         self.critical_error = Signal()
         self.shaft_position = FixedPointSignal(24)
         self.shaft_position_valid = self.position_valid
+        self.update_period = Signal(32)
+        self.latency = Signal(32)
+        self.error_count = Signal(stats_resolution)
+        self.cs_error_count = Signal(stats_resolution)
+        self.timeout_count = Signal(stats_resolution)
+        if timestamp is None:
+            self.timestamp = Signal(timestamp_resolution)
+            self.sync += self.timestamp.eq(self.timestamp + 1)
+        else:
+            self.timestamp = timestamp
+            timestamp_resolution = timestamp.nbits
+        self.position_timestamp = Signal(timestamp_resolution)
 
         # # #
 
@@ -70,15 +114,25 @@ class ECNMEncoder(Module):
             timeout.wait.eq(~self.rx_valid & ~timeout.done),
         ]
 
+        # after a valid frame, we only wait for the encoder to release the bus
+        self.submodules.guard = guard = WaitTimer(1 + int(guard_bits * fclk / self.baudrate))
+        frame_ok = Signal()
+
+        request_timestamp = Signal(timestamp_resolution)
         cs = Signal(8, reset_less=True)
+        byte_cnt = Signal(max=self.frame_length)
         error = Signal()
+        timeout_error = Signal()
         self.submodules.fsm = fsm = FSM("IDLE")
         fsm.act("IDLE",
-            NextValue(self.txe, 1),
-            If(timeout.done,
+            guard.wait.eq(1),
+            If(timeout.done | (frame_ok & guard.done),
                 NextState("SEND_CMD"),
+                NextValue(self.txe, 1),
                 timeout.wait.eq(0),  # reset timer
                 NextValue(cs, 0),  # reset checksum
+                NextValue(byte_cnt, 0),
+                NextValue(frame_ok, 0),
             ),
         )
         fsm.act("SEND_CMD",
@@ -90,12 +144,14 @@ class ECNMEncoder(Module):
         fsm.act("RECEIVE_CMD",
             If(~self.tx_idle,
                 timeout.wait.eq(0),  # reset the counter while sending the command
+                NextValue(request_timestamp, self.timestamp),
             ).Else(
                 NextValue(self.txe, 0),
             ),
             If(timeout.done,
                 NextState("RECOVERY"),
                 error.eq(1),
+                timeout_error.eq(1),
             ),
             self.rx_ready.eq(self.tx_idle),
             If(self.rx_valid & self.rx_ready,
@@ -112,6 +168,7 @@ class ECNMEncoder(Module):
             If(timeout.done,
                 NextState("RECOVERY"),
                 error.eq(1),
+                timeout_error.eq(1),
             ),
             self.rx_ready.eq(1),
             If(self.rx_valid,
@@ -123,6 +180,7 @@ class ECNMEncoder(Module):
             If(timeout.done,
                 NextState("RECOVERY"),
                 error.eq(1),
+                timeout_error.eq(1),
             ),
             self.rx_ready.eq(1),
             If(self.rx_valid,
@@ -135,6 +193,7 @@ class ECNMEncoder(Module):
             If(timeout.done,
                 NextState("RECOVERY"),
                 error.eq(1),
+                timeout_error.eq(1),
             ),
             self.rx_ready.eq(1),
             If(self.rx_valid,
@@ -147,28 +206,37 @@ class ECNMEncoder(Module):
             If(timeout.done,
                 NextState("RECOVERY"),
                 error.eq(1),
+                timeout_error.eq(1),
             ),
             self.rx_ready.eq(1),
             If(self.rx_valid,
                 NextState("RECEIVE_END"),
                 NextValue(cs, cs ^ self.rx),
                 NextValue(self.position[16:], self.rx),
+                NextValue(self.position_timestamp, request_timestamp),
             ),
         )
         fsm.act("RECEIVE_END",
-            # TODO: check that we received the correct amount of bytes?
             If(timeout.done,
-                If(cs == 0,  # cs should be 0 if we xor data plus checksum
-                    self.position_valid.eq(1),
-                ).Else(
-                    self.cs_error.eq(1),
-                    error.eq(1),
-                ),
-                NextState("IDLE"),
+                NextState("RECOVERY"),
+                error.eq(1),
+                timeout_error.eq(1),
             ),
             self.rx_ready.eq(1),
             If(self.rx_valid,
                 NextValue(cs, cs ^ self.rx),
+                NextValue(byte_cnt, byte_cnt + 1),
+                If(byte_cnt == self.frame_length - 6,  # last byte: checksum
+                    If((cs ^ self.rx) == 0,  # cs should be 0 if we xor data plus checksum
+                        self.position_valid.eq(1),
+                        NextValue(frame_ok, 1),
+                        NextState("IDLE"),
+                    ).Else(
+                        self.cs_error.eq(1),
+                        error.eq(1),
+                        NextState("RECOVERY"),
+                    ),
+                ),
             ),
         )
         fsm.act("RECOVERY",
@@ -178,6 +246,29 @@ class ECNMEncoder(Module):
             ),
         )
 
+        # statistics
+        since_valid = Signal(32)
+        since_request = Signal(32)
+        self.sync += [
+            If(self.position_valid,
+                since_valid.eq(1),
+                self.update_period.eq(since_valid),
+                self.latency.eq(since_request),
+            ).Elif(since_valid != 2**32 - 1,
+                since_valid.eq(since_valid + 1),
+            ),
+            If(fsm.ongoing("SEND_CMD") & self.tx_idle,
+                since_request.eq(1),
+            ).Elif(since_request != 2**32 - 1,
+                since_request.eq(since_request + 1),
+            ),
+        ]
+        for event, counter in [(error, self.error_count), (self.cs_error, self.cs_error_count),
+                               (timeout_error, self.timeout_count)]:
+            self.sync += If(event & (counter != 2**stats_resolution - 1),
+                counter.eq(counter + 1),
+            )
+
         error_cnt = Signal()
         self.sync += [
             If(error,
@@ -191,3 +282,313 @@ class ECNMEncoder(Module):
                 self.critical_error.eq(0),
             ),
         ]
+
+
+class ECNMEncoderSerial(Module):
+    """:class:`ECNMEncoder` with an integrated 2.5Mbps UART
+
+    The :class:`hmmc.utils.uart.UartTx` controls the RS485 driver enable, so `serial_rx`,
+    `serial_tx` and `serial_txe` can be directly connected to a RS485 transceiver.
+
+    :param fclk: clock frequency of the design. At least 10MHz, 20MHz+ recommended
+    :type fclk: int
+    :param encoder_parameters: pass additional parameters when instanciating the
+                               :class:`ECNMEncoder`
+
+    :inputs:
+        - **serial_rx** ( :class:`migen.fhdl.structure.Signal` ) - RS485 receiver output
+
+    :outputs:
+        - **serial_tx** ( :class:`migen.fhdl.structure.Signal` ) - RS485 driver input
+        - **serial_txe** ( :class:`migen.fhdl.structure.Signal` ) - RS485 driver enable
+        - **encoder** ( :class:`ECNMEncoder` ) - the protocol engine. Its position, error and
+          statistics outputs are also available directly on this module
+    """
+    def __init__(self, fclk, **encoder_parameters):
+        self.submodules.encoder = encoder = ECNMEncoder(fclk, **encoder_parameters)
+        self.submodules.uart_rx = uart_rx = UartRx(fclk, encoder.baudrate)
+        self.submodules.uart_tx = uart_tx = UartTx(fclk, encoder.baudrate)
+
+        # inputs
+        self.serial_rx = uart_rx.rx
+
+        # outputs
+        self.serial_tx = uart_tx.tx
+        self.serial_txe = uart_tx.txe
+        for name in ["position", "position_valid", "shaft_position", "shaft_position_valid",
+                     "error", "critical_error", "cs_error", "update_period", "latency",
+                     "error_count", "cs_error_count", "timeout_count", "timestamp",
+                     "position_timestamp"]:
+            setattr(self, name, getattr(encoder, name))
+
+        # # #
+
+        self.comb += [
+            uart_tx.data.eq(encoder.tx),
+            uart_tx.valid.eq(encoder.tx_valid),
+            encoder.tx_idle.eq(uart_tx.idle),
+            encoder.rx.eq(uart_rx.data),
+            encoder.rx_valid.eq(uart_rx.valid),
+        ]
+
+
+class ECNMEncoderBank(Module):
+    """Multiple Mitsubishi encoders sharing a single protocol engine
+
+    Each axis has its own :class:`hmmc.utils.uart.UartRx` and :class:`hmmc.utils.uart.UartTx`
+    (with RS485 driver enable control), but the frame decoding and checksum verification is done
+    by a single engine which serves the axes in a round-robin fashion, one axis per clock cycle.
+    The state of each axis (frame decoding progress, checksum, position and timeout reference) is
+    kept in a register file.
+    Requests are sent by the serializers independently of the engine, so that broadcast requests
+    start during the same clock cycle on all axes.
+
+    Axes are polled either:
+
+    - staggered (`broadcast` = '0'): one axis every `stagger` + 1 clock cycles, in turn
+    - simultaneously (`broadcast` = '1'): all axes at once, each time `trigger` is '1'
+
+    Each position comes with the timestamp of its request, which is when the encoder latched it.
+    When all axes have either been updated or failed since the last vector, `vector_valid` is
+    set, so that all positions can be read as a coherent vector.
+
+    :param n: number of encoders
+    :type n: int
+    :param fclk: clock frequency of the design
+    :type fclk: int
+    :param timestamp_resolution: resolution in bits for the timestamp counter
+    :type timestamp_resolution: int
+    :param stagger_resolution: resolution in bits of `stagger`
+    :type stagger_resolution: int
+
+    :inputs:
+        - **serial_rx** (*list(Signal())*) - RS485 receivers outputs
+        - **broadcast** ( :class:`migen.fhdl.structure.Signal` ) - polling mode
+        - **trigger** ( :class:`migen.fhdl.structure.Signal` ) - poll all axes, in broadcast mode
+        - **stagger** ( :class:`migen.fhdl.structure.Signal` (stagger_resolution)) - clock cycles
+          between two polls, in staggered mode
+
+    :outputs:
+        - **serial_tx** (*list(Signal())*) - RS485 drivers inputs
+        - **serial_txe** (*list(Signal())*) - RS485 drivers enable
+        - **position** (*list(Signal(24))*) - positions
+        - **position_valid** (*list(Signal())*) - '1' for 1 clk tick when `position` is updated
+        - **position_timestamp** (*list(Signal(timestamp_resolution))*) - timestamp of the request
+          of `position`
+        - **error** (*list(Signal())*) - '1' for 1 clk tick when a checksum error, an unexpected
+          byte, an overrun or a timeout happens
+        - **vector_valid** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when all
+          axes have been updated (or failed) since the last vector
+        - **vector_error** ( :class:`migen.fhdl.structure.Signal` (n)) - axes which failed since
+          the last vector. Valid when `vector_valid` is '1'
+        - **timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) - free
+          running cycle counter
+    """
+    baudrate = ECNMEncoder.baudrate
+    cmd = ECNMEncoder.cmd
+    frame_length = ECNMEncoder.frame_length
+
+    def __init__(self, n, fclk, timestamp_resolution=32, stagger_resolution=16):
+        bit_time = int(fclk / self.baudrate)
+        # the engine must visit each axis at least once per received byte
+        assert n < 10 * bit_time
+
+        # inputs
+        self.broadcast = Signal()
+        self.trigger = Signal()
+        self.stagger = Signal(stagger_resolution, reset=2**stagger_resolution - 1)
+
+        # outputs
+        self.position = [Signal(24) for _ in range(n)]
+        self.position_valid = [Signal() for _ in range(n)]
+        self.position_timestamp = [Signal(timestamp_resolution) for _ in range(n)]
+        self.error = [Signal() for _ in range(n)]
+        self.vector_valid = Signal()
+        self.vector_error = Signal(n)
+        self.timestamp = timestamp = Signal(timestamp_resolution)
+
+        # # #
+
+        self.sync += timestamp.eq(timestamp + 1)
+
+        # serializers / deserializers
+        uarts_rx = []
+        uarts_tx = []
+        rx_data = []
+        rx_pending = []
+        rx_overrun = []
+        for i in range(n):
+            uart_rx = UartRx(fclk, self.baudrate)
+            uart_tx = UartTx(fclk, self.baudrate)
+            setattr(self.submodules, f"uart_rx_{i}", uart_rx)
+            setattr(self.submodules, f"uart_tx_{i}", uart_tx)
+            uarts_rx.append(uart_rx)
+            uarts_tx.append(uart_tx)
+            rx_data.append(Signal(8))
+            rx_pending.append(Signal())
+            rx_overrun.append(Signal())
+            self.comb += uart_tx.data.eq(self.cmd)
+        self.serial_rx = [uart.rx for uart in uarts_rx]
+        self.serial_tx = [uart.tx for uart in uarts_tx]
+        self.serial_txe = [uart.txe for uart in uarts_tx]
+
+        # poll scheduler
+        poll_request = [Signal() for _ in range(n)]
+        poll_ack = [Signal() for _ in range(n)]
+        stagger_cnt = Signal(stagger_resolution)
+        stagger_axis = Signal(max=max(n, 2))
+        stagger_tick = Signal()
+        self.comb += stagger_tick.eq(stagger_cnt >= self.stagger)  # takes `stagger` changes now
+        self.sync += [
+            If(stagger_tick,
+                stagger_cnt.eq(0),
+                If(stagger_axis == n - 1,
+                    stagger_axis.eq(0),
+                ).Else(
+                    stagger_axis.eq(stagger_axis + 1),
+                ),
+            ).Else(
+                stagger_cnt.eq(stagger_cnt + 1),
+            ),
+        ]
+        for i in range(n):
+            self.sync += [
+                If(self.broadcast & self.trigger,
+                    poll_request[i].eq(1),
+                ).Elif(~self.broadcast & stagger_tick & (stagger_axis == i),
+                    poll_request[i].eq(1),
+                ).Elif(poll_ack[i],
+                    poll_request[i].eq(0),
+                ),
+            ]
+
+        # register file: phase, checksum, position, timeout reference
+        # phase 0: idle, phase p: waiting for byte p - 1 of the frame
+        phase_bits = (self.frame_length + 1).bit_length()
+        fields = [phase_bits, 8, 24, timestamp_resolution]
+        self.specials.regfile = regfile = Memory(sum(fields), n)
+        self.specials.port = port = regfile.get_port(write_capable=True, async_read=True)
+        phase = Signal(phase_bits)
+        cs = Signal(8)
+        position = Signal(24)
+        last = Signal(timestamp_resolution)
+        phase_next = Signal(phase_bits)
+        cs_next = Signal(8)
+        position_next = Signal(24)
+        last_next = Signal(timestamp_resolution)
+
+        # engine: serves one axis per clock cycle
+        sel = Signal(max=max(n, 2))
+        self.sync += If(sel == n - 1, sel.eq(0)).Else(sel.eq(sel + 1))
+        timeout = 1 + 13 * bit_time
+
+        byte = Signal(8)
+        byte_valid = Signal()
+        elapsed = Signal(timestamp_resolution)
+        overrun = Signal()
+        tx_idle = Signal()
+        busy = [Signal() for _ in range(n)]  # a request was sent, the engine must process it
+        request_timestamp = [Signal(timestamp_resolution) for _ in range(n)]
+        done = Signal()
+        failed = Signal()
+        self.comb += [
+            port.adr.eq(sel),
+            Cat(phase, cs, position, last).eq(port.dat_r),
+            port.dat_w.eq(Cat(phase_next, cs_next, position_next, last_next)),
+            port.we.eq(1),
+            byte.eq(Array(rx_data)[sel]),
+            byte_valid.eq(Array(rx_pending)[sel]),
+            overrun.eq(Array(rx_overrun)[sel]),
+            tx_idle.eq(Array([uart.idle for uart in uarts_tx])[sel]),
+            elapsed.eq(timestamp - last),
+
+            phase_next.eq(phase),
+            cs_next.eq(cs),
+            position_next.eq(position),
+            last_next.eq(last),
+            If(phase == 0,
+                If(Array(busy)[sel],
+                    # a request was sent
+                    phase_next.eq(1),
+                    cs_next.eq(0),
+                    last_next.eq(timestamp),
+                ),
+            ).Elif(~tx_idle,
+                last_next.eq(timestamp),  # request being sent
+            ).Elif(overrun | (~byte_valid & (elapsed > timeout)),
+                failed.eq(1),
+                phase_next.eq(0),
+            ).Elif(byte_valid,
+                cs_next.eq(cs ^ byte),
+                last_next.eq(timestamp),
+                phase_next.eq(phase + 1),
+                If(phase == 1,
+                    If(byte != self.cmd,
+                        failed.eq(1),
+                        phase_next.eq(0),
+                    ),
+                ).Elif(phase == 3,
+                    position_next[0:8].eq(byte),
+                ).Elif(phase == 4,
+                    position_next[8:16].eq(byte),
+                ).Elif(phase == 5,
+                    position_next[16:24].eq(byte),
+                ).Elif(phase == self.frame_length,
+                    phase_next.eq(0),
+                    If((cs ^ byte) == 0,
+                        done.eq(1),
+                    ).Else(
+                        failed.eq(1),
+                    ),
+                ),
+            ),
+        ]
+
+        updated = Signal(n)
+        failures = Signal(n)
+        self.comb += self.vector_valid.eq(updated == 2**n - 1)
+        self.sync += If(self.vector_valid,
+            updated.eq(0),
+            failures.eq(0),
+        )
+        for i in range(n):
+            start = Signal()
+            consume = Signal()
+            self.comb += [
+                start.eq(poll_request[i] & ~busy[i] & uarts_tx[i].idle),
+                # bytes received while the engine is idle are dropped
+                consume.eq((sel == i) & tx_idle & (phase != 0) | (~busy[i] & ~start)),
+                uarts_tx[i].valid.eq(start),
+                poll_ack[i].eq(start),
+                self.position_valid[i].eq((sel == i) & done),
+                self.error[i].eq((sel == i) & failed),
+            ]
+            self.sync += [
+                If(uarts_rx[i].valid & uarts_tx[i].idle,  # ignore our own echo
+                    rx_data[i].eq(uarts_rx[i].data),
+                    rx_pending[i].eq(1),
+                    If(rx_pending[i] & ~consume,
+                        rx_overrun[i].eq(1),
+                    ),
+                ).Elif(consume,
+                    rx_pending[i].eq(0),
+                    rx_overrun[i].eq(0),
+                ),
+                If(start,
+                    busy[i].eq(1),
+                    request_timestamp[i].eq(timestamp),
+                ).Elif(self.position_valid[i] | self.error[i],
+                    busy[i].eq(0),
+                ),
+                If(self.position_valid[i],
+                    self.position[i].eq(position_next),
+                    self.position_timestamp[i].eq(request_timestamp[i]),
+                ),
+                If(self.position_valid[i] | self.error[i],
+                    updated[i].eq(1),
+                ),
+                If(self.error[i],
+                    failures[i].eq(1),
+                ),
+            ]
+        self.comb += self.vector_error.eq(failures)
@@ -0,0 +1,251 @@
+"""
+PWM Capture
+===========
+
+Measures the high time, the period and the duty cycle of PWM signals, such as the command of a
+legacy controller or the output of some sensors.
+"""
+
+from math import log2
+from migen import Module, Signal, If, Cat, Array
+from hmmc.input.quadrature import GlitchFilter
+from hmmc.math.dsp import DivSequential
+
+
+class PwmCapture(Module):
+    """PWM input capture
+
+    The input is resynchronized and filtered by a :class:`hmmc.input.quadrature.GlitchFilter`, then
+    the timestamps of its edges give the high time and the period, at clock resolution. The period
+    is measured between rising edges.
+
+    The measurements are summed over 2**`average` periods before being published, and the duty
+    cycle is computed by a :class:`hmmc.math.dsp.DivSequential` from these sums, so that the
+    averaging also improves its resolution. The division takes `resolution` + log2(`max_average`) +
+    `duty_fraction` clock cycles, and averaging windows ending while it is busy are dropped.
+
+    When no edge is seen for more than `timeout` clock cycles, `timeout_error` is set and the duty
+    cycle is set to 0 or 1.0, depending on the input level (0% and 100% PWM). The averaging restarts
+    after the first complete period.
+
+    :param resolution: resolution in bits of the high time and period
+    :type resolution: int
+    :param duty_fraction: number of fractional bits of `duty`
+    :type duty_fraction: int
+    :param max_average: maximum number of periods averaged. Must be a power of 2
+    :type max_average: int
+    :param filter_resolution: resolution in bits of the glitch filter length
+    :type filter_resolution: int
+    :param default_filter: glitch filter length at reset, in samples
+    :type default_filter: int
+    :param timestamp_resolution: resolution in bits for the timestamp counter
+    :type timestamp_resolution: int
+    :param timestamp: if not None, use this signal as timestamp instead of an internal counter.
+                      This allows multiple captures to share the same timebase
+    :type timestamp: :class:`migen.fhdl.structure.Signal`
+
+    :inputs:
+        - **input** ( :class:`migen.fhdl.structure.Signal` ) - PWM input
+        - **filter_length** ( :class:`migen.fhdl.structure.Signal` (filter_resolution)) - see
+          :class:`hmmc.input.quadrature.GlitchFilter` `length`
+        - **average** ( :class:`migen.fhdl.structure.Signal` ) - 2**`average` periods are averaged,
+          up to `max_average`. 0 at reset
+        - **timeout** ( :class:`migen.fhdl.structure.Signal` (resolution)) - maximum time without
+          edge, in clock cycles. Maximum value at reset
+
+    :outputs:
+        - **high_time** ( :class:`migen.fhdl.structure.Signal` (resolution)) - average high time,
+          in clock cycles
+        - **period** ( :class:`migen.fhdl.structure.Signal` (resolution)) - average period, in
+          clock cycles
+        - **duty** ( :class:`migen.fhdl.structure.Signal` (duty_fraction + 1)) - duty cycle, with
+          `duty_fraction` fractional bits
+        - **valid** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when the outputs
+          are updated
+        - **timeout_error** ( :class:`migen.fhdl.structure.Signal` ) - '1' while no edge is seen
+          for more than `timeout` clock cycles
+        - **edge_timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) -
+          timestamp of the last rising edge
+    """
+    def __init__(self, resolution=24, duty_fraction=16, max_average=16, filter_resolution=4,
+                 default_filter=0, timestamp_resolution=32, timestamp=None):
+        assert max_average & (max_average - 1) == 0
+        average_bits = int(log2(max_average))
+        sum_resolution = resolution + average_bits
+
+        # inputs
+        self.input = Signal()
+        self.average = Signal(max=average_bits + 1)
+        self.timeout = Signal(resolution, reset=2**resolution - 1)
+
+        # outputs
+        self.high_time = Signal(resolution)
+        self.period = Signal(resolution)
+        self.duty = Signal(duty_fraction + 1)
+        self.valid = Signal()
+        self.timeout_error = Signal()
+        if timestamp is None:
+            timestamp = Signal(timestamp_resolution)
+            self.sync += timestamp.eq(timestamp + 1)
+        self.edge_timestamp = Signal(timestamp.nbits)
+
+        # # #
+
+        # resynchronization and glitch filtering
+        input_f = Signal(2)
+        self.sync += input_f.eq(Cat(self.input, input_f[0]))
+        self.submodules.filter = glitch_filter = GlitchFilter(filter_resolution, 1,
+            default_filter)
+        self.filter_length = glitch_filter.length
+        self.comb += glitch_filter.input.eq(input_f[1])
+
+        level = Signal()
+        rise = Signal()
+        fall = Signal()
+        self.sync += level.eq(glitch_filter.output)
+        self.comb += [
+            rise.eq(glitch_filter.output & ~level),
+            fall.eq(~glitch_filter.output & level),
+        ]
+
+        # measurement
+        fall_timestamp = Signal(timestamp.nbits)
+        period = Signal(timestamp.nbits)
+        high_time = Signal(timestamp.nbits)
+        primed = Signal()  # edge_timestamp and fall_timestamp belong to the current signal
+        idle_cnt = Signal(resolution)
+        measure = Signal()
+        self.comb += [
+            period.eq(timestamp - self.edge_timestamp),
+            high_time.eq(fall_timestamp - self.edge_timestamp),
+            measure.eq(rise & primed),
+        ]
+        self.sync += [
+            If(rise | fall,
+                idle_cnt.eq(0),
+                self.timeout_error.eq(0),
+            ).Elif(idle_cnt >= self.timeout,
+                self.timeout_error.eq(1),
+                primed.eq(0),
+            ).Else(
+                idle_cnt.eq(idle_cnt + 1),
+            ),
+            If(rise,
+                self.edge_timestamp.eq(timestamp),
+                primed.eq(1),
+            ),
+            If(fall,
+                fall_timestamp.eq(timestamp),
+            ),
+        ]
+
+        # averaging
+        high_sum = Signal(sum_resolution)
+        period_sum = Signal(sum_resolution)
+        high_clamped = Signal(resolution)
+        period_clamped = Signal(resolution)
+        periods = Signal(average_bits + 1)
+        window_lengths = Array([2**n for n in range(average_bits + 1)])
+        window_end = Signal()
+        self.comb += [
+            If(period > 2**resolution - 1,
+                period_clamped.eq(2**resolution - 1),
+            ).Else(
+                period_clamped.eq(period),
+            ),
+            If(high_time > period_clamped,
+                high_clamped.eq(period_clamped),
+            ).Else(
+                high_clamped.eq(high_time),
+            ),
+            window_end.eq(measure & (periods + 1 >= window_lengths[self.average])),
+        ]
+        self.sync += [
+            If(self.timeout_error,
+                periods.eq(0),
+                high_sum.eq(0),
+                period_sum.eq(0),
+            ).Elif(window_end,
+                periods.eq(0),
+                high_sum.eq(0),
+                period_sum.eq(0),
+            ).Elif(measure,
+                periods.eq(periods + 1),
+                high_sum.eq(high_sum + high_clamped),
+                period_sum.eq(period_sum + period_clamped),
+            ),
+        ]
+
+        # duty cycle
+        self.submodules.div = div = DivSequential(sum_resolution + duty_fraction, sum_resolution)
+        high_avg = Signal(resolution)
+        period_avg = Signal(resolution)
+        self.comb += [
+            div.dividend.eq((high_sum + high_clamped) << duty_fraction),
+            div.divisor.eq(period_sum + period_clamped),
+            div.start.eq(window_end),
+        ]
+        self.sync += [
+            If(div.start & ~div.busy,
+                high_avg.eq((high_sum + high_clamped) >> self.average),
+                period_avg.eq((period_sum + period_clamped) >> self.average),
+            ),
+            self.valid.eq(div.done),
+            If(div.done,
+                self.high_time.eq(high_avg),
+                self.period.eq(period_avg),
+                self.duty.eq(div.quotient),
+            ).Elif(self.timeout_error,
+                self.duty.eq(level << duty_fraction),
+            ),
+        ]
+
+
+class PwmCaptureBank(Module):
+    """Multiple PWM captures with a shared timebase
+
+    All the :class:`PwmCapture` share the same timestamp counter, so that their `edge_timestamp`
+    can be compared.
+
+    :param n_channels: number of channels
+    :type n_channels: int
+    :param timestamp_resolution: resolution in bits for the timestamp counter
+    :type timestamp_resolution: int
+    :param capture_parameters: pass additional parameters when instanciating the
+      :class:`PwmCapture`
+
+    :inputs:
+        - **input** (*list(Signal())*) - PWM inputs
+        - **timeout** (*list(Signal(resolution))*) - see :class:`PwmCapture` `timeout`
+
+    :outputs:
+        - **high_time** (*list(Signal(resolution))*) - average high times
+        - **period** (*list(Signal(resolution))*) - average periods
+        - **duty** (*list(Signal(duty_fraction + 1))*) - duty cycles
+        - **valid** (*list(Signal())*) - '1' for 1 clk tick when the outputs of a channel are
+          updated
+        - **timeout_error** (*list(Signal())*) - '1' while no edge is seen on a channel
+        - **timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) - free
+          running cycle counter
+        - **channels** (*list(PwmCapture)*) - the PwmCapture instances, to access their other
+          inputs and outputs
+    """
+    def __init__(self, n_channels, timestamp_resolution=32, **capture_parameters):
+        self.timestamp = Signal(timestamp_resolution)
+        self.sync += self.timestamp.eq(self.timestamp + 1)
+
+        # # #
+
+        self.channels = []
+        for n in range(n_channels):
+            capture = PwmCapture(timestamp=self.timestamp, **capture_parameters)
+            setattr(self.submodules, f"capture_{n}", capture)
+            self.channels.append(capture)
+
+        self.input = [capture.input for capture in self.channels]
+        self.timeout = [capture.timeout for capture in self.channels]
+        self.high_time = [capture.high_time for capture in self.channels]
+        self.period = [capture.period for capture in self.channels]
+        self.duty = [capture.duty for capture in self.channels]
+        self.valid = [capture.valid for capture in self.channels]
+        self.timeout_error = [capture.timeout_error for capture in self.channels]
@@ -1,31 +1,237 @@
 from migen import Module, Signal, Cat, If, Case
 
 
+class MTVelocity(Module):
+    """M/T velocity estimator
+
+    Combines the edge count M over a measurement window with the time T elapsed between the first
+    and the last edge of that window. The estimated velocity is `count / period` increments per
+    clock cycle.
+    The last edge of a window is used as the first edge of the next one, so no interval between
+    edges is ever lost. If no edge is seen during a window, `count` and `period` are both 0.
+    `count` is sized for a full window of `window` + 1 clock cycles with a `delta` of ±2 on each
+    cycle, the maximum rate of a DDR input, so it never wraps.
+
+    :param window_resolution: resolution in bits of the window length
+    :type window_resolution: int
+    :param timestamp_resolution: resolution in bits of the timestamp counter
+    :type timestamp_resolution: int
+    :param default_window: window length at reset, in clock cycles
+    :type default_window: int
+
+    :inputs:
+        - **delta** ( :class:`migen.fhdl.structure.Signal` ((3, True))) - signed position
+          increment for this clock cycle
+        - **timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) - free
+          running cycle counter
+        - **window** ( :class:`migen.fhdl.structure.Signal` (window_resolution)) - length of the
+          measurement window is `window` + 1 clock cycles
+        - **trigger** ( :class:`migen.fhdl.structure.Signal` ) - when '1', close the current window
+          immediately. Can be connected to a control loop strobe, such as `Pwm.cycle_update`
+
+    :outputs:
+        - **count** ( :class:`migen.fhdl.structure.Signal` ((window_resolution + 3, True))) -
+          signed edge count between the first and last edge of the window
+        - **period** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) - clock cycles
+          between the first and last edge of the window
+        - **valid** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when `count` and
+          `period` are updated
+    """
+    def __init__(self, window_resolution=16, timestamp_resolution=32,
+                 default_window=2**16 - 1):
+        # inputs
+        self.delta = Signal((3, True))
+        self.timestamp = Signal(timestamp_resolution)
+        self.window = Signal(window_resolution, reset=default_window)
+        self.trigger = Signal()
+
+        # outputs
+        self.count = Signal((window_resolution + 3, True))
+        self.period = Signal(timestamp_resolution)
+        self.valid = Signal()
+
+        # # #
+
+        window_cnt = Signal(window_resolution)
+        close = Signal()
+        edge = Signal()
+        seen = Signal()  # an edge was seen since reset
+        edges = Signal((window_resolution + 3, True))
+        first_ts = Signal(timestamp_resolution)
+        last_ts = Signal(timestamp_resolution)
+
+        self.comb += [
+            close.eq((window_cnt == 0) | self.trigger),
+            edge.eq(self.delta != 0),
+        ]
+
+        self.sync += [
+            self.valid.eq(close),
+            If(close,
+                window_cnt.eq(self.window),
+                self.count.eq(edges),
+                self.period.eq(last_ts - first_ts),
+                # the last edge of this window is the first edge of the next one
+                first_ts.eq(last_ts),
+                edges.eq(0),
+            ).Else(
+                window_cnt.eq(window_cnt - 1),
+            ),
+            If(edge,
+                last_ts.eq(self.timestamp),
+                If(seen,
+                    If(close,
+                        edges.eq(self.delta),
+                    ).Else(
+                        edges.eq(edges + self.delta),
+                    ),
+                ).Else(
+                    seen.eq(1),
+                    first_ts.eq(self.timestamp),
+                ),
+            ),
+        ]
+
+
+class GlitchFilter(Module):
+    """Digital glitch filter
+
+    The output only changes state once the input has been stable at the new state for `length`
+    consecutive samples. Pulses shorter than `length` samples are ignored.
+    Multiple samples can be processed per clock cycle, for instance from a DDR input.
+
+    :param resolution: resolution in bits of the filter length
+    :type resolution: int
+    :param width: number of samples per clock cycle. `input[0]` is the oldest sample
+    :type width: int
+    :param default_length: filter length at reset
+    :type default_length: int
+
+    :inputs:
+        - **input** ( :class:`migen.fhdl.structure.Signal` (width)) - samples to filter
+        - **length** ( :class:`migen.fhdl.structure.Signal` (resolution)) - number of consecutive
+          samples required to change the output state. 0 and 1 disable the filter
+
+    :outputs:
+        - **output** ( :class:`migen.fhdl.structure.Signal` (width)) - filtered samples
+    """
+    def __init__(self, resolution=4, width=1, default_length=0):
+        self.input = Signal(width)
+        self.length = Signal(resolution, reset=default_length)
+        self.output = Signal(width)
+
+        # # #
+
+        level = Signal()
+        cnt = Signal(resolution)  # consecutive samples different from level
+        levels = [level] + [Signal() for _ in range(width)]
+        cnts = [cnt] + [Signal(resolution) for _ in range(width)]
+
+        for i in range(width):
+            self.comb += [
+                If(self.input[i] == levels[i],
+                    levels[i + 1].eq(levels[i]),
+                    cnts[i + 1].eq(0),
+                ).Elif(cnts[i] + 1 >= self.length,
+                    levels[i + 1].eq(self.input[i]),
+                    cnts[i + 1].eq(0),
+                ).Else(
+                    levels[i + 1].eq(levels[i]),
+                    cnts[i + 1].eq(cnts[i] + 1),
+                ),
+                self.output[i].eq(levels[i + 1]),
+            ]
+
+        self.sync += [
+            level.eq(levels[-1]),
+            cnt.eq(cnts[-1]),
+        ]
+
+
 class QEI(Module):
     """Quadrature Ecoder Interface
     reads the A, B outputs of a quadrature encoder, and cound position.
     Optionally, can also montitor an Index input and copy the position value when the index postion
     is reached.
 
+    The inputs are resynchronized then filtered by a :class:`GlitchFilter` of programmable length.
+    In DDR mode, `a` and `b` carry two samples per clock cycle (typically from a DDR input
+    primitive, or an input sampled by a 2x clock), and up to two transitions are decoded per clock
+    cycle.
+    Transitions on both A and B at the same time are illegal: they are not counted but are reported
+    as a signal integrity metric.
+
+    Every decoded edge is timestamped against a free-running cycle counter. Optionally, a
+    :class:`MTVelocity` estimator can be added to provide a velocity measurement.
+
     :param resolution: resolution in bits for the position counter
     :type resolution: int
     :param used_index: is True, use the i input to capture index position
     :type used_index: bool
+    :param timestamp_resolution: resolution in bits for the timestamp counter
+    :type timestamp_resolution: int
+    :param velocity: if True, add a :class:`MTVelocity` estimator
+    :type velocity: bool
+    :param window_resolution: resolution in bits of the velocity window length
+    :type window_resolution: int
+    :param ddr: if True, `a` and `b` are 2 samples wide
+    :type ddr: bool
+    :param filter_resolution: resolution in bits of the glitch filter length
+    :type filter_resolution: int
+    :param default_filter: glitch filter length at reset, in samples
+    :type default_filter: int
+    :param illegal_resolution: resolution in bits of the illegal transitions counter
+    :type illegal_resolution: int
+    :param timestamp: if not None, use this signal as timestamp instead of an internal counter.
+                      This allows multiple QEI to share the same timebase
+    :type timestamp: :class:`migen.fhdl.structure.Signal`
 
     :inputs:
-        - **a** ( :class:`migen.fhdl.structure.Signal` ) - quadrature input a
-        - **b** ( :class:`migen.fhdl.structure.Signal` ) - quadrature input b
+        - **a** ( :class:`migen.fhdl.structure.Signal` (1 or 2)) - quadrature input a. In DDR
+          mode, a[0] is the oldest sample
+        - **b** ( :class:`migen.fhdl.structure.Signal` (1 or 2)) - quadrature input b. In DDR
+          mode, b[0] is the oldest sample
         - **i** ( :class:`migen.fhdl.structure.Signal` ) - index input, used is use_index is True
+        - **filter_length** ( :class:`migen.fhdl.structure.Signal` (filter_resolution)) - see
+          :class:`GlitchFilter` `length`
+        - **illegal_clear** ( :class:`migen.fhdl.structure.Signal` ) - when '1', reset
+          `illegal_count`
+        - **velocity_window** ( :class:`migen.fhdl.structure.Signal` (window_resolution)) - see
+          :class:`MTVelocity` `window`. Only if velocity is True
+        - **velocity_trigger** ( :class:`migen.fhdl.structure.Signal` ) - see
+          :class:`MTVelocity` `trigger`. Only if velocity is True
 
     :outputs:
         - **position** ( :class:`migen.fhdl.structure.Signal` (resolution))) - position retreived
           from the quadrature input
         - **index_position** ( :class:`migen.fhdl.structure.Signal` (resolution))) - captured
           position at last index mark
-        - **index_capture** ( :class:`migen.fhdl.structure.Signal` ) - '1' when the encoder is at
-          the index mark
+        - **index_capture** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when the
+          encoder reaches the index mark, and `index_position` is updated
+        - **timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) - free
+          running cycle counter
+        - **edge** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when an edge is
+          decoded. `position` is updated on the next clock cycle
+        - **edge_timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) -
+          timestamp of the last decoded edge
+        - **position_timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) -
+          same as `edge_timestamp`: the time at which `position` was exact
+        - **position_valid** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when
+          `position` and `position_timestamp` have been updated
+        - **illegal** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when an
+          illegal transition is detected
+        - **illegal_count** ( :class:`migen.fhdl.structure.Signal` (illegal_resolution)) -
+          saturating count of illegal transitions
+        - **velocity_count** ( :class:`migen.fhdl.structure.Signal` ) - see :class:`MTVelocity`
+          `count`. Only if velocity is True
+        - **velocity_period** ( :class:`migen.fhdl.structure.Signal` ) - see :class:`MTVelocity`
+          `period`. Only if velocity is True
+        - **velocity_valid** ( :class:`migen.fhdl.structure.Signal` ) - see :class:`MTVelocity`
+          `valid`. Only if velocity is True
     """
-    def __init__(self, resolution: int, used_index=False):
+    def __init__(self, resolution: int, used_index=False, timestamp_resolution=32, velocity=False,
+                 window_resolution=16, ddr=False, filter_resolution=4, default_filter=0,
+                 illegal_resolution=16, timestamp=None):
         """Construct a :obj:`QEI` object.
 
         Arguments
@@ -33,60 +239,234 @@ class QEI(Module):
 
         resolution (:obj:`int`): resolution in bits for the position counter
         used_index (:obj:`bool`): is True, use the i input to capture index position
+        timestamp_resolution (:obj:`int`): resolution in bits for the timestamp counter
+        velocity (:obj:`bool`): if True, add a :class:`MTVelocity` estimator
+        window_resolution (:obj:`int`): resolution in bits of the velocity window length
+        ddr (:obj:`bool`): if True, `a` and `b` are 2 samples wide
+        filter_resolution (:obj:`int`): resolution in bits of the glitch filter length
+        default_filter (:obj:`int`): glitch filter length at reset, in samples
+        illegal_resolution (:obj:`int`): resolution in bits of the illegal transitions counter
+        timestamp (:obj:`Signal`): if not None, use this signal as timestamp
         """
-        self.a = Signal()
-        self.b = Signal()
+        width = 2 if ddr else 1
+        self.a = Signal(width)
+        self.b = Signal(width)
         self.i = Signal()
         self.position = cnt = Signal(resolution, reset_less=True)
         self.index_position = Signal(resolution)
+        self.index_capture = Signal()
+        if timestamp is None:
+            self.timestamp = Signal(timestamp_resolution)
+            self.sync += self.timestamp.eq(self.timestamp + 1)
+        else:
+            self.timestamp = timestamp
+            timestamp_resolution = timestamp.nbits
+        self.edge = Signal()
+        self.edge_timestamp = Signal(timestamp_resolution)
+        self.position_timestamp = self.edge_timestamp
+        self.position_valid = Signal()
+        self.illegal = Signal()
+        self.illegal_count = Signal(illegal_resolution)
+        self.illegal_clear = Signal()
 
         # # #
 
         next_cnt = Signal(resolution)
 
-        a_f = Signal(3)
-        b_f = Signal(3)
-        a = Signal()
-        b = Signal()
+        # resynchronization
+        a_f = [Signal(width) for _ in range(2)]
+        b_f = [Signal(width) for _ in range(2)]
+        self.sync += [
+            a_f[0].eq(self.a),
+            a_f[1].eq(a_f[0]),
+            b_f[0].eq(self.b),
+            b_f[1].eq(b_f[0]),
+        ]
+
+        # glitch filtering
+        self.submodules.filter_a = filter_a = GlitchFilter(filter_resolution, width,
+            default_filter)
+        self.submodules.filter_b = filter_b = GlitchFilter(filter_resolution, width,
+            default_filter)
+        self.filter_length = filter_a.length
         self.comb += [
-            a.eq(a_f[0]),
-            b.eq(b_f[0]),
+            filter_b.length.eq(filter_a.length),
+            filter_a.input.eq(a_f[1]),
+            filter_b.input.eq(b_f[1]),
         ]
+
+        # decoding: compare each filtered sample to the previous one
+        a = Signal()  # last filtered samples
+        b = Signal()
         self.sync += [
-            a_f.eq(Cat(a_f[1:], self.a)),
-            b_f.eq(Cat(b_f[1:], self.b)),
+            a.eq(filter_a.output[-1]),
+            b.eq(filter_b.output[-1]),
         ]
+        a_samples = [a] + [filter_a.output[i] for i in range(width)]
+        b_samples = [b] + [filter_b.output[i] for i in range(width)]
+        ups = Signal(width)
+        downs = Signal(width)
+        illegals = Signal(width)
+        for i in range(width):
+            self.comb += [
+                Case(Cat(b_samples[i], b_samples[i + 1], a_samples[i], a_samples[i + 1]), {
+                    0b1000: ups[i].eq(1),
+                    0b1110: ups[i].eq(1),
+                    0b0111: ups[i].eq(1),
+                    0b0001: ups[i].eq(1),
+                    0b0010: downs[i].eq(1),
+                    0b1011: downs[i].eq(1),
+                    0b1101: downs[i].eq(1),
+                    0b0100: downs[i].eq(1),
+                    0b1010: illegals[i].eq(1),
+                    0b1001: illegals[i].eq(1),
+                    0b0110: illegals[i].eq(1),
+                    0b0101: illegals[i].eq(1)}
+                ),
+            ]
 
-        self.sync += [
-            Case(Cat(b_f[0:2], a_f[0:2]), {
-                0b1000: next_cnt.eq(cnt + 1),
-                0b1110: next_cnt.eq(cnt + 1),
-                0b0111: next_cnt.eq(cnt + 1),
-                0b0001: next_cnt.eq(cnt + 1),
-                0b0010: next_cnt.eq(cnt - 1),
-                0b1011: next_cnt.eq(cnt - 1),
-                0b1101: next_cnt.eq(cnt - 1),
-                0b0100: next_cnt.eq(cnt - 1)}
-            )
+        delta = Signal((3, True))
+        illegal_count_next = Signal(illegal_resolution + 1)
+        self.comb += [
+            delta.eq(sum(ups[i] for i in range(width)) - sum(downs[i] for i in range(width))),
+            self.edge.eq((ups != 0) | (downs != 0)),
+            self.illegal.eq(illegals != 0),
+            illegal_count_next.eq(self.illegal_count + sum(illegals[i] for i in range(width))),
+            next_cnt.eq(cnt + delta),
         ]
 
         self.sync += [
             cnt.eq(next_cnt),
+            If(self.edge,
+                self.edge_timestamp.eq(self.timestamp),
+            ),
+            self.position_valid.eq(self.edge),
+            If(self.illegal_clear,
+                self.illegal_count.eq(0),
+            ).Elif(self.illegal,
+                If(illegal_count_next[-1],  # saturate
+                    self.illegal_count.eq(2**illegal_resolution - 1),
+                ).Else(
+                    self.illegal_count.eq(illegal_count_next),
+                ),
+            ),
         ]
 
+        if velocity:
+            self.submodules.mt = mt = MTVelocity(window_resolution, timestamp_resolution)
+            self.velocity_window = mt.window
+            self.velocity_trigger = mt.trigger
+            self.velocity_count = mt.count
+            self.velocity_period = mt.period
+            self.velocity_valid = mt.valid
+            self.comb += [
+                mt.delta.eq(delta),
+                mt.timestamp.eq(self.timestamp),
+            ]
+
         if used_index:
-            i_f = Signal(3)
-            i = Signal()
+            i_f = Signal(2)
+            index = Signal()
+            index_prev = Signal()
             self.sync += [
-                i_f.eq(Cat(self.i, i_f[0:-1])),
+                i_f.eq(Cat(self.i, i_f[0])),
+                index_prev.eq(index),
+                self.index_capture.eq(index & ~index_prev),
+                If(index & ~index_prev,
+                    self.index_position.eq(next_cnt),
+                ),
             ]
             self.comb += [
-                i.eq(i_f[0]),
+                index.eq(i_f[1] & a & b),
             ]
 
+
+class QEIBank(Module):
+    """Multiple Quadrature Encoder Interfaces with a simultaneous snapshot
+
+    All the :class:`QEI` share the same timestamp counter. On a snapshot request, the position,
+    index position and last edge timestamp of every axis are latched during the same clock cycle, so
+    that a CPU can read coherent samples of all the axes in a single burst, regardless of the bus
+    latency.
+
+    :param n_axes: number of QEI
+    :type n_axes: int
+    :param resolution: resolution in bits for the position counters
+    :type resolution: int
+    :param used_index: is True, use the i inputs to capture index positions
+    :type used_index: bool
+    :param timestamp_resolution: resolution in bits for the timestamp counter
+    :type timestamp_resolution: int
+    :param qei_parameters: pass additional parameters when instanciating the :class:`QEI`
+
+    :inputs:
+        - **a** (*list(Signal())*) - quadrature inputs a
+        - **b** (*list(Signal())*) - quadrature inputs b
+        - **i** (*list(Signal())*) - index inputs, used is use_index is True
+        - **snapshot** ( :class:`migen.fhdl.structure.Signal` ) - software snapshot request
+        - **snapshot_trigger** ( :class:`migen.fhdl.structure.Signal` ) - hardware snapshot request,
+          for instance when a PWM counter reaches its center
+
+    :outputs:
+        - **position** (*list(Signal(resolution))*) - latched positions
+        - **index_position** (*list(Signal(resolution))*) - latched index positions
+        - **index_captured** (*list(Signal())*) - '1' if an index mark was reached since the
+          previous snapshot
+        - **edge_timestamp** (*list(Signal(timestamp_resolution))*) - latched timestamps of the last
+          edge
+        - **snapshot_timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) -
+          timestamp of the snapshot
+        - **snapshot_valid** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when the
+          latched values are updated
+        - **axes** (*list(QEI)*) - the QEI instances, to access their other inputs and outputs
+    """
+    def __init__(self, n_axes, resolution, used_index=False, timestamp_resolution=32,
+                 **qei_parameters):
+        # inputs
+        self.snapshot = Signal()
+        self.snapshot_trigger = Signal()
+
+        # outputs
+        self.position = [Signal(resolution) for _ in range(n_axes)]
+        self.index_position = [Signal(resolution) for _ in range(n_axes)]
+        self.index_captured = [Signal() for _ in range(n_axes)]
+        self.edge_timestamp = [Signal(timestamp_resolution) for _ in range(n_axes)]
+        self.snapshot_timestamp = Signal(timestamp_resolution)
+        self.snapshot_valid = Signal()
+
+        # # #
+
+        timestamp = Signal(timestamp_resolution)
+        snapshot = Signal()
+        self.comb += snapshot.eq(self.snapshot | self.snapshot_trigger)
+        self.sync += [
+            timestamp.eq(timestamp + 1),
+            self.snapshot_valid.eq(snapshot),
+            If(snapshot,
+                self.snapshot_timestamp.eq(timestamp),
+            ),
+        ]
+
+        self.axes = []
+        for n in range(n_axes):
+            qei = QEI(resolution, used_index, timestamp=timestamp, **qei_parameters)
+            setattr(self.submodules, f"qei_{n}", qei)
+            self.axes.append(qei)
+
+            index_seen = Signal()
             self.sync += [
-                If(i & a & b,
-                    self.index_position.eq(next_cnt),
-                    self.index_capture.eq(1),
+                If(snapshot,
+                    self.position[n].eq(qei.position),
+                    self.index_position[n].eq(qei.index_position),
+                    # index_position is updated with index_capture, so it is latched already
+                    self.index_captured[n].eq(index_seen | qei.index_capture),
+                    self.edge_timestamp[n].eq(qei.edge_timestamp),
+                    index_seen.eq(0),
+                ).Elif(qei.index_capture,
+                    index_seen.eq(1),
                 ),
             ]
+
+        self.a = [qei.a for qei in self.axes]
+        self.b = [qei.b for qei in self.axes]
+        self.i = [qei.i for qei in self.axes]
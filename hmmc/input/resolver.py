@@ -0,0 +1,234 @@
+"""
+Resolver
+========
+
+A resolver is a rotary transformer: the rotor winding is excited with a sinusoidal carrier, and
+the two stator windings output this carrier modulated by the sin and cos of the shaft angle.
+"""
+
+from math import sin, pi, ceil, log2
+from migen import Module, Signal, FSM, NextState, NextValue, If, Mux
+from hmmc.math.fixedpoint import FloatFixedConverter
+from hmmc.math.lut import LookupTableFixedPoint
+from hmmc.math.dsp import MulFixedPoint
+from hmmc.output.deltasigma import DeltaSigma
+
+
+class ResolverRDC(Module):
+    """Resolver to digital converter
+
+    - the excitation carrier is generated from a sine LUT and a :class:`hmmc.output.deltasigma.
+      DeltaSigma` modulator, which only needs an external low-pass filter and amplifier
+    - the sin and cos windings outputs, typically sampled with
+      :class:`hmmc.input.sigmadelta.SigmaDelta` channels, are synchronously demodulated over each
+      carrier period. `carrier_delay` compensates the phase shift of the excitation and
+      acquisition chains
+    - a type-II tracking loop updates the angle and velocity estimations once per carrier period:
+      the error sin(θ)cos(φ) - cos(θ)sin(φ) goes through a PI corrector (`kp`, `ki`) which drives
+      the velocity integrator, followed by the angle integrator. At constant velocity, the
+      tracking lag is 0. See :meth:`loop_gains` to set the loop bandwidth
+
+    :param fclk: clock frequency of the design
+    :type fclk: int
+    :param carrier_frequency: frequency of the excitation carrier, which is also the update rate
+    :type carrier_frequency: float
+    :param resolution: resolution in bits of the sin/cos samples
+    :type resolution: int
+    :param angle_resolution: resolution in bits of `angle`
+    :type angle_resolution: int
+    :param lut_resolution: resolution in bits of the sine LUT address
+    :type lut_resolution: int
+    :param lut_width: resolution in bits of the sine LUT values
+    :type lut_width: int
+    :param gain_resolution: resolution in bits of `kp` and `ki`
+    :type gain_resolution: int
+
+    :inputs:
+        - **sin** ( :class:`migen.fhdl.structure.Signal` (resolution)) - sin winding sample,
+          offset binary (mid-scale is 0)
+        - **cos** ( :class:`migen.fhdl.structure.Signal` (resolution)) - cos winding sample,
+          offset binary
+        - **input_valid** ( :class:`migen.fhdl.structure.Signal` ) - sin and cos are valid
+        - **carrier_delay** ( :class:`migen.fhdl.structure.Signal` (lut_resolution)) - phase delay
+          of the demodulation reference relative to the carrier, 2**lut_resolution per period
+        - **kp** ( :class:`migen.fhdl.structure.Signal` (gain_resolution, True)) - proportional
+          gain of the tracking loop
+        - **ki** ( :class:`migen.fhdl.structure.Signal` (gain_resolution, True)) - integral gain
+          of the tracking loop
+
+    :outputs:
+        - **excitation** ( :class:`migen.fhdl.structure.Signal` ) - pulse density modulated
+          carrier
+        - **carrier** ( :class:`migen.fhdl.structure.Signal` (lut_width, True)) - carrier value
+        - **sin_demod** ( :class:`migen.fhdl.structure.Signal` (resolution + 2, True)) -
+          demodulated sin winding amplitude
+        - **cos_demod** ( :class:`migen.fhdl.structure.Signal` (resolution + 2, True)) -
+          demodulated cos winding amplitude
+        - **angle** ( :class:`migen.fhdl.structure.Signal` (angle_resolution)) - estimated angle
+        - **velocity** ( :class:`migen.fhdl.structure.Signal` (32, True)) - estimated velocity,
+          in 2**-32 turn per update
+        - **angle_valid** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when
+          `angle` and `velocity` are updated
+    """
+    kp_shift = 2
+    ki_shift = 8
+
+    def __init__(self, fclk, carrier_frequency=10e3, resolution=16, angle_resolution=16,
+                 lut_resolution=10, lut_width=16, gain_resolution=24):
+        self.fclk = fclk
+        phase_increment = round(carrier_frequency / fclk * 2**32)
+        self.update_rate = phase_increment * fclk / 2**32
+        samples = ceil(fclk / carrier_frequency) + 1
+
+        # inputs
+        self.sin = Signal(resolution)
+        self.cos = Signal(resolution)
+        self.input_valid = Signal()
+        self.carrier_delay = Signal(lut_resolution)
+        self.kp = Signal((gain_resolution, True))
+        self.ki = Signal((gain_resolution, True))
+
+        # outputs
+        self.excitation = Signal()
+        self.carrier = Signal((lut_width, True))
+        self.sin_demod = Signal((resolution + 2, True))
+        self.cos_demod = Signal((resolution + 2, True))
+        self.angle = Signal(angle_resolution)
+        self.velocity = Signal((32, True))
+        self.angle_valid = Signal()
+
+        # # #
+
+        converter = FloatFixedConverter(lut_width, lut_width - 1, signed=True, saturate=True)
+        table = converter.convert_float(
+            [sin(2 * pi * n / 2**lut_resolution) for n in range(2**lut_resolution)])
+
+        # carrier
+        carrier_phase = Signal(32)
+        carrier_phase_next = Signal(33)
+        period_end = Signal()
+        self.comb += [
+            carrier_phase_next.eq(carrier_phase + phase_increment),
+            period_end.eq(carrier_phase_next[-1]),
+        ]
+        self.sync += carrier_phase.eq(carrier_phase_next)
+        self.submodules.carrier_lut = carrier_lut = LookupTableFixedPoint(table, lut_width, True)
+        self.submodules.modulator = modulator = DeltaSigma(lut_width)
+        self.comb += [
+            carrier_lut.sel.eq(carrier_phase[-lut_resolution:]),
+            self.carrier.eq(carrier_lut.output),
+            modulator.input.eq(self.carrier + 2**(lut_width - 1)),
+            self.excitation.eq(modulator.output),
+        ]
+
+        # synchronous demodulation: accumulate the samples rectified by the carrier reference
+        acc_resolution = resolution + ceil(log2(samples)) + 1
+        shift = acc_resolution - (resolution + 2)
+        reference_phase = Signal(lut_resolution)
+        negative = Signal()
+        sin_acc = Signal((acc_resolution, True))
+        cos_acc = Signal((acc_resolution, True))
+        sin_sample = Signal((resolution + 1, True))
+        cos_sample = Signal((resolution + 1, True))
+        demod_valid = Signal()
+        self.comb += [
+            reference_phase.eq(carrier_phase[-lut_resolution:] - self.carrier_delay),
+            negative.eq(reference_phase[-1]),
+            sin_sample.eq(Mux(negative, 2**(resolution - 1) - self.sin,
+                self.sin - 2**(resolution - 1))),
+            cos_sample.eq(Mux(negative, 2**(resolution - 1) - self.cos,
+                self.cos - 2**(resolution - 1))),
+        ]
+        self.sync += [
+            demod_valid.eq(period_end),
+            If(period_end,
+                self.sin_demod.eq(sin_acc >> shift),
+                self.cos_demod.eq(cos_acc >> shift),
+                sin_acc.eq(0),
+                cos_acc.eq(0),
+            ).Elif(self.input_valid,
+                sin_acc.eq(sin_acc + sin_sample),
+                cos_acc.eq(cos_acc + cos_sample),
+            ),
+        ]
+
+        # tracking loop
+        angle_acc = Signal(32)
+        phi = Signal(lut_resolution)
+        sin_phi = Signal((lut_width, True))
+        cos_phi = Signal((lut_width, True))
+        error = Signal((resolution + 3, True))
+        self.submodules.loop_lut = loop_lut = LookupTableFixedPoint(table, lut_width, True)
+        self.submodules.mul_sin = mul_sin = MulFixedPoint((resolution + 2, True),
+            (lut_width, True))
+        self.submodules.mul_cos = mul_cos = MulFixedPoint((resolution + 2, True),
+            (lut_width, True))
+        self.submodules.mul_p = mul_p = MulFixedPoint((resolution + 3, True),
+            (gain_resolution, True))
+        self.submodules.mul_i = mul_i = MulFixedPoint((resolution + 3, True),
+            (gain_resolution, True))
+        self.comb += [
+            phi.eq(angle_acc[-lut_resolution:]),
+            Signal.eq(mul_sin.A, self.sin_demod),
+            Signal.eq(mul_sin.B, cos_phi),
+            Signal.eq(mul_cos.A, self.cos_demod),
+            Signal.eq(mul_cos.B, sin_phi),
+            Signal.eq(mul_p.A, error),
+            Signal.eq(mul_p.B, self.kp),
+            Signal.eq(mul_i.A, error),
+            Signal.eq(mul_i.B, self.ki),
+            self.angle.eq(angle_acc[-angle_resolution:]),
+        ]
+
+        self.submodules.fsm = fsm = FSM("IDLE")
+        fsm.act("IDLE",
+            loop_lut.sel.eq(phi),
+            If(demod_valid,
+                NextState("SIN"),
+            ),
+        )
+        fsm.act("SIN",
+            NextValue(sin_phi, loop_lut.output),
+            loop_lut.sel.eq(phi + 2**(lut_resolution - 2)),
+            NextState("COS"),
+        )
+        fsm.act("COS",
+            NextValue(cos_phi, loop_lut.output),
+            NextState("PRODUCT"),
+        )
+        fsm.act("PRODUCT",
+            NextState("ERROR"),
+        )
+        fsm.act("ERROR",
+            NextValue(error, (mul_sin.C - mul_cos.C) >> (lut_width - 1)),
+            NextState("GAIN"),
+        )
+        fsm.act("GAIN",
+            NextState("UPDATE"),
+        )
+        fsm.act("UPDATE",
+            NextValue(self.velocity, self.velocity + (mul_i.C >> self.ki_shift)),
+            NextValue(angle_acc, angle_acc + self.velocity + (mul_p.C >> self.kp_shift)),
+            self.angle_valid.eq(1),
+            NextState("IDLE"),
+        )
+
+    def loop_gains(self, bandwidth, amplitude, damping=1.0):
+        """Compute the tracking loop gains
+
+        :param bandwidth: natural frequency of the loop, in Hz. Should be lower than a tenth of the
+          carrier frequency
+        :type bandwidth: float
+        :param amplitude: amplitude of the demodulated signals, sqrt(sin_demod² + cos_demod²)
+        :type amplitude: float
+        :param damping: damping ratio of the loop
+        :type damping: float
+        :returns: `kp` and `ki` values
+        :rtype: tuple(int, int)
+        """
+        omega = 2 * pi * bandwidth / self.update_rate  # rad per update
+        # error = amplitude * angle error (rad), angle unit is 2**-32 turn
+        scale = 2**32 / (2 * pi * amplitude)
+        kp = round(2 * damping * omega * scale * 2**self.kp_shift)
+        ki = round(omega**2 * scale * 2**self.ki_shift)
+        return kp, ki
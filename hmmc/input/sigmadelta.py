@@ -94,6 +94,11 @@ class SigmaDelta(Module):
     Each of the channels' 1-bit input signal is sampled from `input` on `clk_out` falling edge.
     Each of the channels' `resolution`-bits output data is present in list `input`.
 
+    `clk_sync` restarts the clock generator, so that the modulator clock can be phase-locked to
+    another timebase, for instance the `bottom` output of a :class:`hmmc.output.pwm.Pwm`. The
+    interval between two `clk_sync` pulses should be a multiple of the `clk_out` period, so that
+    the clock is not disturbed.
+
     :param channels: channel count
     :type channels: int
     :param fout:
@@ -109,6 +114,8 @@ class SigmaDelta(Module):
 
     :inputs:
         - **input** (*list(Signal())*) - all the different inputs
+        - **clk_sync** ( :class:`migen.fhdl.structure.Signal` ) - when '1', restart `clk_out` from
+          the start of its low half-period
 
     :outputs:
         - **clk_out** ( :class:`migen.fhdl.structure.Signal` ) - clock driving the sigma delta
@@ -137,6 +144,7 @@ class SigmaDelta(Module):
         self.output = [Signal(resolution) for i in range(channels)]
         self.output_valid = [Signal() for i in range(channels)]
         self.input_valid = Signal()
+        self.clk_sync = Signal()
 
         # # #
 
@@ -145,7 +153,10 @@ class SigmaDelta(Module):
         input_valid = self.input_valid
         div = Signal(max=f_ratio + 1, reset=0)
         self.sync += [
-            If(div == 0,
+            If(self.clk_sync,
+                div.eq(f_ratio),
+                self.clk_out.eq(0)
+            ).Elif(div == 0,
                 div.eq(f_ratio),
                 self.clk_out.eq(~self.clk_out)
             ).Else(
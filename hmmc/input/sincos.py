@@ -0,0 +1,161 @@
+"""
+Sin/Cos Encoder
+===============
+
+Analog encoders output two sinusoidal signals in quadrature per period (line) of the encoder. The
+angle within the period is computed with atan2(sin, cos), and the periods are counted to get the
+position.
+"""
+
+from migen import Module, Signal, If, Cat
+from hmmc.math.cordic import Atan2Cordic
+
+
+class SinCosInterpolator(Module):
+    """Sin/Cos encoder interpolator
+
+    The sin and cos samples, typically from two :class:`hmmc.input.sigmadelta.SigmaDelta`
+    channels, go through a correction stage:
+
+    - offset: `sin_offset` and `cos_offset` are removed from the samples, after removing the
+      mid-scale
+    - gain: the samples are multiplied by `sin_gain` and `cos_gain`
+    - phase: `phase` * sin is removed from cos. If the cos channel is actually cos(θ + φ),
+      `phase` should be set to -sin(φ), and `cos_gain` multiplied by 1/cos(φ)
+
+    Then the angle within the period is computed by a pipelined
+    :class:`hmmc.math.cordic.Atan2Cordic` and the periods are counted by detecting the wrapping of
+    this angle. This requires at least 4 samples per period.
+
+    :param resolution: resolution in bits of the sin/cos samples
+    :type resolution: int
+    :param angle_resolution: resolution in bits of the angle within a period
+    :type angle_resolution: int
+    :param period_resolution: resolution in bits of the period counter
+    :type period_resolution: int
+    :param gain_fraction: fractional bits of `sin_gain`, `cos_gain` and `phase`
+    :type gain_fraction: int
+
+    :inputs:
+        - **sin** ( :class:`migen.fhdl.structure.Signal` (resolution)) - sin sample, offset binary
+          (mid-scale is 0)
+        - **cos** ( :class:`migen.fhdl.structure.Signal` (resolution)) - cos sample, offset binary
+        - **input_valid** ( :class:`migen.fhdl.structure.Signal` ) - sin and cos are valid
+        - **sin_offset** ( :class:`migen.fhdl.structure.Signal` (resolution, True)) - sin offset
+        - **cos_offset** ( :class:`migen.fhdl.structure.Signal` (resolution, True)) - cos offset
+        - **sin_gain** ( :class:`migen.fhdl.structure.Signal` (gain_fraction + 2)) - sin gain,
+          1.0 at reset
+        - **cos_gain** ( :class:`migen.fhdl.structure.Signal` (gain_fraction + 2)) - cos gain,
+          1.0 at reset
+        - **phase** ( :class:`migen.fhdl.structure.Signal` (gain_fraction + 1, True)) - phase
+          correction coefficient, 0 at reset
+        - **min_magnitude** ( :class:`migen.fhdl.structure.Signal` (resolution + 2)) -
+          `signal_error` is raised when the magnitude of the corrected signals is lower
+
+    :outputs:
+        - **angle** ( :class:`migen.fhdl.structure.Signal` (angle_resolution)) - angle within the
+          period
+        - **periods** ( :class:`migen.fhdl.structure.Signal` (period_resolution)) - period counter
+        - **position** ( :class:`migen.fhdl.structure.Signal` (period_resolution +
+          angle_resolution)) - interpolated position, `Cat(angle, periods)`
+        - **position_valid** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when
+          the position is updated
+        - **magnitude** ( :class:`migen.fhdl.structure.Signal` (resolution + 2)) - magnitude of
+          the corrected signals, see :class:`hmmc.math.cordic.Atan2Cordic`
+        - **signal_error** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when
+          the position is updated from signals which are too weak
+    """
+    def __init__(self, resolution=16, angle_resolution=16, period_resolution=16,
+                 gain_fraction=14):
+        # inputs
+        self.sin = Signal(resolution)
+        self.cos = Signal(resolution)
+        self.input_valid = Signal()
+        self.sin_offset = Signal((resolution, True))
+        self.cos_offset = Signal((resolution, True))
+        self.sin_gain = Signal(gain_fraction + 2, reset=2**gain_fraction)
+        self.cos_gain = Signal(gain_fraction + 2, reset=2**gain_fraction)
+        self.phase = Signal((gain_fraction + 1, True))
+        self.min_magnitude = Signal(resolution + 2)
+
+        # outputs
+        self.angle = Signal(angle_resolution)
+        self.periods = Signal(period_resolution)
+        self.position = Signal(period_resolution + angle_resolution)
+        self.position_valid = Signal()
+        self.magnitude = Signal(resolution + 2)
+        self.signal_error = Signal()
+
+        # # #
+
+        # corrected samples are 1 bit larger than the inputs, to give room for the gain
+        width = resolution + 1
+        self.submodules.cordic = cordic = Atan2Cordic(width, angle_resolution)
+
+        def saturate(target, value):
+            return If(value > 2**(width - 1) - 1,
+                target.eq(2**(width - 1) - 1),
+            ).Elif(value < -2**(width - 1),
+                target.eq(-2**(width - 1)),
+            ).Else(
+                target.eq(value),
+            )
+
+        # offset
+        sin_1 = Signal((resolution + 2, True))
+        cos_1 = Signal((resolution + 2, True))
+        valid_1 = Signal()
+        self.sync += [
+            sin_1.eq(self.sin - 2**(resolution - 1) - self.sin_offset),
+            cos_1.eq(self.cos - 2**(resolution - 1) - self.cos_offset),
+            valid_1.eq(self.input_valid),
+        ]
+
+        # gain
+        sin_2 = Signal((width, True))
+        cos_2 = Signal((width, True))
+        valid_2 = Signal()
+        sin_gained = Signal((resolution + gain_fraction + 5, True))
+        cos_gained = Signal((resolution + gain_fraction + 5, True))
+        self.comb += [
+            sin_gained.eq(sin_1 * self.sin_gain),
+            cos_gained.eq(cos_1 * self.cos_gain),
+        ]
+        self.sync += [
+            saturate(sin_2, sin_gained >> gain_fraction),
+            saturate(cos_2, cos_gained >> gain_fraction),
+            valid_2.eq(valid_1),
+        ]
+
+        # phase
+        cos_corrected = Signal((width + gain_fraction + 2, True))
+        self.comb += cos_corrected.eq((cos_2 << gain_fraction) - sin_2 * self.phase)
+        self.sync += [
+            cordic.y.eq(sin_2),
+            saturate(cordic.x, cos_corrected >> gain_fraction),
+            cordic.input_valid.eq(valid_2),
+        ]
+
+        # period counter
+        quadrant = Signal(2)
+        new_quadrant = Signal(2)
+        primed = Signal()
+        self.comb += new_quadrant.eq(cordic.angle[-2:])
+        self.sync += [
+            self.position_valid.eq(cordic.output_valid),
+            self.signal_error.eq(cordic.output_valid & (cordic.magnitude < self.min_magnitude)),
+            If(cordic.output_valid,
+                self.angle.eq(cordic.angle),
+                self.magnitude.eq(cordic.magnitude),
+                quadrant.eq(new_quadrant),
+                primed.eq(1),
+                If(~primed,
+                    # first sample: nothing to compare with
+                ).Elif((quadrant == 3) & (new_quadrant == 0),
+                    self.periods.eq(self.periods + 1),
+                ).Elif((quadrant == 0) & (new_quadrant == 3),
+                    self.periods.eq(self.periods - 1),
+                ),
+            ),
+        ]
+        self.comb += self.position.eq(Cat(self.angle, self.periods))
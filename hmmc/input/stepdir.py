@@ -0,0 +1,234 @@
+from migen import Module, Signal, If, Mux, Cat
+from hmmc.input.quadrature import GlitchFilter, MTVelocity
+
+
+class StepDirDecoder(Module):
+    """Step/Dir input
+
+    Receives the Step/Dir commands of an external motion controller, such as the ones generated by
+    :class:`hmmc.output.stepdir.StepDir`. A step is counted on each rising edge of `step`, in the
+    direction given by `dir` ('1' counts up).
+
+    Both inputs are resynchronized and filtered by identical :class:`GlitchFilter`, so that their
+    relative timing is preserved. Two timing violations are detected, and counted in `lost_count`:
+
+    - a step pulse shorter than the filter length is rejected by the filter, and the step is lost
+    - a step edge less than `dir_setup` clock cycles after a `dir` change: the receiver latched the
+      direction before the change, so the step is counted with the previous direction, as a driver
+      would do
+
+    With `gearing`, each step moves `position` by `gear` / 2**gear_fraction increments. The
+    fractional part is kept internally, so that no increment is lost over several steps.
+
+    The step rate is measured by a :class:`hmmc.input.quadrature.MTVelocity` estimator.
+
+    :param resolution: resolution in bits of the position counter
+    :type resolution: int
+    :param filter_resolution: resolution in bits of the glitch filter length
+    :type filter_resolution: int
+    :param default_filter: glitch filter length at reset, in samples
+    :type default_filter: int
+    :param setup_resolution: resolution in bits of `dir_setup`
+    :type setup_resolution: int
+    :param default_setup: `dir_setup` at reset
+    :type default_setup: int
+    :param gearing: if True, add the electronic gearing ratio `gear`
+    :type gearing: bool
+    :param gear_resolution: resolution in bits of `gear`
+    :type gear_resolution: int
+    :param gear_fraction: number of fractional bits of `gear`
+    :type gear_fraction: int
+    :param lost_resolution: resolution in bits of the lost steps counter
+    :type lost_resolution: int
+    :param window_resolution: resolution in bits of the step rate window length
+    :type window_resolution: int
+    :param timestamp_resolution: resolution in bits for the timestamp counter
+    :type timestamp_resolution: int
+    :param timestamp: if not None, use this signal as timestamp instead of an internal counter
+    :type timestamp: :class:`migen.fhdl.structure.Signal`
+
+    :inputs:
+        - **step** ( :class:`migen.fhdl.structure.Signal` ) - step input
+        - **dir** ( :class:`migen.fhdl.structure.Signal` ) - direction input
+        - **filter_length** ( :class:`migen.fhdl.structure.Signal` (filter_resolution)) - see
+          :class:`hmmc.input.quadrature.GlitchFilter` `length`
+        - **dir_setup** ( :class:`migen.fhdl.structure.Signal` (setup_resolution)) - minimum
+          number of clock cycles between a `dir` change and a step edge
+        - **gear** ( :class:`migen.fhdl.structure.Signal` ((gear_resolution, True))) - position
+          increment per step, with `gear_fraction` fractional bits. 1.0 at reset. Only if gearing
+          is True
+        - **lost_clear** ( :class:`migen.fhdl.structure.Signal` ) - when '1', reset `lost_count`
+        - **rate_window** ( :class:`migen.fhdl.structure.Signal` (window_resolution)) - see
+          :class:`hmmc.input.quadrature.MTVelocity` `window`
+        - **rate_trigger** ( :class:`migen.fhdl.structure.Signal` ) - see
+          :class:`hmmc.input.quadrature.MTVelocity` `trigger`
+
+    :outputs:
+        - **position** ( :class:`migen.fhdl.structure.Signal` (resolution)) - position counter
+        - **up** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when a step up is
+          received
+        - **down** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when a step down
+          is received
+        - **timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) - free
+          running cycle counter
+        - **step_timestamp** ( :class:`migen.fhdl.structure.Signal` (timestamp_resolution)) -
+          timestamp of the last step
+        - **glitch** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when a step
+          pulse is rejected by the filter
+        - **setup_violation** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when a
+          step violates the `dir_setup` time
+        - **lost_count** ( :class:`migen.fhdl.structure.Signal` (lost_resolution)) - saturating
+          count of the timing violations
+        - **rate_count** ( :class:`migen.fhdl.structure.Signal` ) - see
+          :class:`hmmc.input.quadrature.MTVelocity` `count`
+        - **rate_period** ( :class:`migen.fhdl.structure.Signal` ) - see
+          :class:`hmmc.input.quadrature.MTVelocity` `period`
+        - **rate_valid** ( :class:`migen.fhdl.structure.Signal` ) - see
+          :class:`hmmc.input.quadrature.MTVelocity` `valid`
+    """
+    def __init__(self, resolution=32, filter_resolution=4, default_filter=0, setup_resolution=8,
+                 default_setup=0, gearing=False, gear_resolution=16, gear_fraction=8,
+                 lost_resolution=16, window_resolution=16, timestamp_resolution=32,
+                 timestamp=None):
+        # inputs
+        self.step = Signal()
+        self.dir = Signal()
+        self.dir_setup = Signal(setup_resolution, reset=default_setup)
+        self.lost_clear = Signal()
+
+        # outputs
+        self.position = Signal(resolution)
+        self.up = Signal()
+        self.down = Signal()
+        if timestamp is None:
+            self.timestamp = Signal(timestamp_resolution)
+            self.sync += self.timestamp.eq(self.timestamp + 1)
+        else:
+            self.timestamp = timestamp
+            timestamp_resolution = timestamp.nbits
+        self.step_timestamp = Signal(timestamp_resolution)
+        self.glitch = Signal()
+        self.setup_violation = Signal()
+        self.lost_count = Signal(lost_resolution)
+
+        # # #
+
+        # resynchronization
+        step_f = Signal(2)
+        dir_f = Signal(2)
+        self.sync += [
+            step_f.eq(Cat(self.step, step_f[0])),
+            dir_f.eq(Cat(self.dir, dir_f[0])),
+        ]
+
+        # glitch filtering
+        self.submodules.filter_step = filter_step = GlitchFilter(filter_resolution, 1,
+            default_filter)
+        self.submodules.filter_dir = filter_dir = GlitchFilter(filter_resolution, 1,
+            default_filter)
+        self.filter_length = filter_step.length
+        self.comb += [
+            filter_dir.length.eq(filter_step.length),
+            filter_step.input.eq(step_f[1]),
+            filter_dir.input.eq(dir_f[1]),
+        ]
+
+        # a glitch is a pending change of the step input which is abandoned before being accepted
+        step = Signal()
+        direction = Signal()
+        pending = Signal()
+        pending_prev = Signal()
+        self.comb += pending.eq(filter_step.input != filter_step.output)
+        self.sync += [
+            step.eq(filter_step.output),
+            direction.eq(filter_dir.output),
+            pending_prev.eq(pending),
+        ]
+        self.comb += self.glitch.eq(pending_prev & ~pending & (filter_step.output == step)
+            & ~step)
+
+        # dir setup time
+        setup_cnt = Signal(setup_resolution, reset=2**setup_resolution - 1)
+        setup_time = Signal(setup_resolution)  # clock cycles since the last dir change
+        dir_change = Signal()
+        prev_direction = Signal()  # direction before the last dir change
+        step_direction = Signal()
+        edge = Signal()
+        self.comb += [
+            edge.eq(filter_step.output & ~step),
+            dir_change.eq(filter_dir.output != direction),
+            setup_time.eq(Mux(dir_change, 0, setup_cnt)),
+            self.setup_violation.eq(edge & (setup_time < self.dir_setup)),
+            If(~self.setup_violation,
+                step_direction.eq(filter_dir.output),
+            ).Elif(dir_change,
+                step_direction.eq(direction),
+            ).Else(
+                step_direction.eq(prev_direction),
+            ),
+            self.up.eq(edge & step_direction),
+            self.down.eq(edge & ~step_direction),
+        ]
+        self.sync += [
+            If(dir_change,
+                setup_cnt.eq(1),
+                prev_direction.eq(direction),
+            ).Elif(setup_cnt != 2**setup_resolution - 1,
+                setup_cnt.eq(setup_cnt + 1),
+            ),
+        ]
+
+        # lost steps
+        lost_count_next = Signal(lost_resolution + 1)
+        self.comb += lost_count_next.eq(self.lost_count + self.glitch + self.setup_violation)
+        self.sync += [
+            If(self.lost_clear,
+                self.lost_count.eq(0),
+            ).Elif(lost_count_next[-1],  # saturate
+                self.lost_count.eq(2**lost_resolution - 1),
+            ).Else(
+                self.lost_count.eq(lost_count_next),
+            ),
+        ]
+
+        # position
+        if gearing:
+            self.gear = Signal((gear_resolution, True), reset=2**gear_fraction)
+            acc = Signal(resolution + gear_fraction)
+            self.sync += [
+                If(self.up,
+                    acc.eq(acc + self.gear),
+                ).Elif(self.down,
+                    acc.eq(acc - self.gear),
+                ),
+            ]
+            self.comb += self.position.eq(acc[gear_fraction:])
+        else:
+            self.sync += [
+                If(self.up,
+                    self.position.eq(self.position + 1),
+                ).Elif(self.down,
+                    self.position.eq(self.position - 1),
+                ),
+            ]
+        self.sync += [
+            If(edge,
+                self.step_timestamp.eq(self.timestamp),
+            ),
+        ]
+
+        # step rate
+        self.submodules.mt = mt = MTVelocity(window_resolution, timestamp_resolution)
+        self.rate_window = mt.window
+        self.rate_trigger = mt.trigger
+        self.rate_count = mt.count
+        self.rate_period = mt.period
+        self.rate_valid = mt.valid
+        self.comb += [
+            If(self.up,
+                mt.delta.eq(1),
+            ).Elif(self.down,
+                mt.delta.eq(-1),
+            ),
+            mt.timestamp.eq(self.timestamp),
+        ]
@@ -0,0 +1,98 @@
+from math import atan, pi
+from migen import Module, Signal, If
+
+
+class Atan2Cordic(Module):
+    """Pipelined atan2 and magnitude, using CORDIC in vectoring mode
+
+    The vector is first folded in the right half plane, then each stage rotates it by
+    ±atan(2^-i) towards the x axis while accumulating the rotation angle. One sample can be
+    processed every clock cycle, with a latency of `latency` clock cycles.
+
+    Each stage adds about one bit of angle precision, so `stages` should be close to
+    `angle_resolution`.
+
+    :param resolution: resolution in bits of the inputs
+    :type resolution: int
+    :param angle_resolution: resolution in bits of the angle. A full turn is 2**angle_resolution
+    :type angle_resolution: int
+    :param stages: number of CORDIC iterations. Defaults to `angle_resolution`
+    :type stages: int
+
+    :inputs:
+        - **x** ( :class:`migen.fhdl.structure.Signal` (resolution, True)) - x coordinate (cos)
+        - **y** ( :class:`migen.fhdl.structure.Signal` (resolution, True)) - y coordinate (sin)
+        - **input_valid** ( :class:`migen.fhdl.structure.Signal` ) - x and y are valid
+
+    :outputs:
+        - **angle** ( :class:`migen.fhdl.structure.Signal` (angle_resolution)) - atan2(y, x),
+          in [0; 2pi[
+        - **magnitude** ( :class:`migen.fhdl.structure.Signal` (resolution + 1)) - magnitude of
+          the vector, multiplied by the CORDIC gain (about 1.647)
+        - **output_valid** ( :class:`migen.fhdl.structure.Signal` ) - angle and magnitude are
+          valid
+    """
+    gain = 1.6467602581210654
+    guard_bits = 4
+
+    def __init__(self, resolution=16, angle_resolution=16, stages=None):
+        if stages is None:
+            stages = angle_resolution
+        self.latency = stages + 1
+
+        # inputs
+        self.x = Signal((resolution, True))
+        self.y = Signal((resolution, True))
+        self.input_valid = Signal()
+
+        # outputs
+        self.angle = Signal(angle_resolution)
+        self.magnitude = Signal(resolution + 1)
+        self.output_valid = Signal()
+
+        # # #
+
+        # 1 bit for the folding, 1 bit for the CORDIC gain, guard bits for the truncations
+        width = resolution + 2 + self.guard_bits
+        z_width = angle_resolution + self.guard_bits
+        x = [Signal((width, True)) for _ in range(stages + 1)]
+        y = [Signal((width, True)) for _ in range(stages + 1)]
+        z = [Signal(z_width) for _ in range(stages + 1)]
+        valid = [Signal() for _ in range(stages + 1)]
+
+        # fold in the right half plane
+        self.sync += [
+            valid[0].eq(self.input_valid),
+            If(self.x < 0,
+                x[0].eq(-self.x << self.guard_bits),
+                y[0].eq(-self.y << self.guard_bits),
+                z[0].eq(2**(z_width - 1)),
+            ).Else(
+                x[0].eq(self.x << self.guard_bits),
+                y[0].eq(self.y << self.guard_bits),
+                z[0].eq(0),
+            ),
+        ]
+
+        for i in range(stages):
+            step = round(atan(2**-i) / (2 * pi) * 2**z_width)
+            self.sync += [
+                valid[i + 1].eq(valid[i]),
+                If(y[i] < 0,
+                    x[i + 1].eq(x[i] - (y[i] >> i)),
+                    y[i + 1].eq(y[i] + (x[i] >> i)),
+                    z[i + 1].eq(z[i] - step),
+                ).Else(
+                    x[i + 1].eq(x[i] + (y[i] >> i)),
+                    y[i + 1].eq(y[i] - (x[i] >> i)),
+                    z[i + 1].eq(z[i] + step),
+                ),
+            ]
+
+        rounded = Signal(z_width)
+        self.comb += [
+            rounded.eq(z[-1] + 2**(self.guard_bits - 1)),
+            self.angle.eq(rounded[self.guard_bits:]),
+            self.magnitude.eq(x[-1] >> self.guard_bits),
+            self.output_valid.eq(valid[-1]),
+        ]
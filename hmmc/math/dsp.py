@@ -1,4 +1,4 @@
-from migen import Module, Signal, Cat, C, value_bits_sign
+from migen import Module, Signal, Cat, C, If, value_bits_sign
 from hmmc.math.fixedpoint import FixedPointSignal
 
 
@@ -63,3 +63,78 @@ class MulFixedPoint(Module):
             self.C = FixedPointSignal((bits_a + bits_b, signed), radix_nbits=radix_nbits,
                 reset_less=True)
             self.comb += Signal.eq(self.C, mul)
+
+
+class DivSequential(Module):
+    """Unsigned sequential divider
+
+    Restoring division, one quotient bit per clock cycle: the result is available `resolution`
+    clock cycles after `start`. A division by 0 gives a quotient with all bits set.
+
+    :param resolution: resolution in bits of the dividend and quotient
+    :type resolution: int
+    :param divisor_resolution: resolution in bits of the divisor and remainder. Defaults to
+      `resolution`
+    :type divisor_resolution: int
+
+    :inputs:
+        - **dividend** ( :class:`migen.fhdl.structure.Signal` (resolution)) - dividend
+        - **divisor** ( :class:`migen.fhdl.structure.Signal` (divisor_resolution)) - divisor
+        - **start** ( :class:`migen.fhdl.structure.Signal` ) - start a division. Ignored when
+          `busy` is '1'
+
+    :outputs:
+        - **quotient** ( :class:`migen.fhdl.structure.Signal` (resolution)) - quotient
+        - **remainder** ( :class:`migen.fhdl.structure.Signal` (divisor_resolution)) - remainder
+        - **busy** ( :class:`migen.fhdl.structure.Signal` ) - '1' while dividing
+        - **done** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when `quotient`
+          and `remainder` are valid
+    """
+    def __init__(self, resolution, divisor_resolution=None):
+        if divisor_resolution is None:
+            divisor_resolution = resolution
+
+        # inputs
+        self.dividend = Signal(resolution)
+        self.divisor = Signal(divisor_resolution)
+        self.start = Signal()
+
+        # outputs
+        self.quotient = Signal(resolution)
+        self.remainder = Signal(divisor_resolution)
+        self.busy = Signal()
+        self.done = Signal()
+
+        # # #
+
+        divisor = Signal(divisor_resolution)
+        cnt = Signal(max=resolution + 1)
+        shifted = Signal(divisor_resolution + 1)
+        diff = Signal(divisor_resolution + 2)
+        self.comb += [
+            shifted.eq(Cat(self.quotient[-1], self.remainder)),
+            diff.eq(shifted - divisor),
+        ]
+        self.sync += [
+            self.done.eq(0),
+            If(self.busy,
+                If(diff[-1],  # shifted < divisor
+                    self.remainder.eq(shifted),
+                    self.quotient.eq(Cat(0, self.quotient[0:-1])),
+                ).Else(
+                    self.remainder.eq(diff),
+                    self.quotient.eq(Cat(1, self.quotient[0:-1])),
+                ),
+                cnt.eq(cnt - 1),
+                If(cnt == 1,
+                    self.busy.eq(0),
+                    self.done.eq(1),
+                ),
+            ).Elif(self.start,
+                divisor.eq(self.divisor),
+                self.quotient.eq(self.dividend),
+                self.remainder.eq(0),
+                cnt.eq(resolution),
+                self.busy.eq(1),
+            ),
+        ]
@@ -0,0 +1,171 @@
+from migen import Module, Signal, If, Cat
+from hmmc.math.fixedpoint import FixedPointSignal
+
+
+class SlewRateLimiter(Module):
+    """Fixed point slew rate limiter
+
+    On each `update` strobe, such as the `cycle_update` of a :class:`hmmc.output.pwm.Pwm` or the
+    `valid` of a measurement, `output` moves towards `setpoint` by at most `rise_step` when
+    increasing, and `fall_step` when decreasing. The setpoint is reached after
+    ceil(\\|`setpoint` - `output`\\| / step) updates.
+
+    The setpoint is saturated to [`minimum`, `maximum`]. If the bounds are changed, the output is
+    saturated immediately, without slew rate limitation.
+
+    :param bits_sign: size and sign of the setpoint and output, see
+                      :class:`hmmc.math.fixedpoint.FixedPointSignal`
+    :type bits_sign: int or tuple(int, bool)
+    :param radix_nbits: number of fractional bits of the setpoint and output, see
+                        :class:`hmmc.math.fixedpoint.FixedPointSignal`
+    :type radix_nbits: int
+    :param step_resolution: resolution in bits of the steps. Defaults to the setpoint resolution
+    :type step_resolution: int
+
+    :inputs:
+        - **setpoint** ( :class:`hmmc.math.fixedpoint.FixedPointSignal` (bits_sign)) - target value
+        - **update** ( :class:`migen.fhdl.structure.Signal` ) - when '1', `output` moves one step
+          towards `setpoint`
+        - **rise_step** ( :class:`migen.fhdl.structure.Signal` (step_resolution)) - maximum
+          increase per update, in LSB of `output`. 1 at reset
+        - **fall_step** ( :class:`migen.fhdl.structure.Signal` (step_resolution)) - maximum
+          decrease per update, in LSB of `output`. 1 at reset
+        - **minimum** ( :class:`hmmc.math.fixedpoint.FixedPointSignal` (bits_sign)) - lower bound.
+          Lowest value at reset
+        - **maximum** ( :class:`hmmc.math.fixedpoint.FixedPointSignal` (bits_sign)) - upper bound.
+          Highest value at reset
+        - **load** ( :class:`migen.fhdl.structure.Signal` ) - when '1', `output` is set to the
+          saturated `setpoint` immediately
+
+    :outputs:
+        - **output** ( :class:`hmmc.math.fixedpoint.FixedPointSignal` (bits_sign)) - limited value
+        - **done** ( :class:`migen.fhdl.structure.Signal` ) - '1' when `output` is equal to the
+          saturated `setpoint`
+    """
+    def __init__(self, bits_sign=16, radix_nbits=None, step_resolution=None):
+        self.setpoint = FixedPointSignal(bits_sign, radix_nbits)
+        nbits, signed = self.setpoint.nbits, self.setpoint.signed
+        if step_resolution is None:
+            step_resolution = nbits
+        low, high = (-2**(nbits - 1), 2**(nbits - 1) - 1) if signed else (0, 2**nbits - 1)
+
+        # inputs
+        self.update = Signal()
+        self.rise_step = Signal(step_resolution, reset=1)
+        self.fall_step = Signal(step_resolution, reset=1)
+        self.minimum = FixedPointSignal(bits_sign, radix_nbits, reset=low)
+        self.maximum = FixedPointSignal(bits_sign, radix_nbits, reset=high)
+        self.load = Signal()
+
+        # outputs
+        self.output = FixedPointSignal(bits_sign, radix_nbits)
+        self.done = Signal()
+
+        # # #
+
+        # internal computations on plain signed signals, wide enough for the steps
+        width = max(nbits, step_resolution) + 2
+        value = Signal((nbits, signed))
+        target = Signal((width, True))
+        rise = Signal((width, True))
+        fall = Signal((width, True))
+        self.comb += [
+            Signal.eq(self.output, value),
+            If(self.setpoint > self.maximum,
+                target.eq(self.maximum),
+            ).Elif(self.setpoint < self.minimum,
+                target.eq(self.minimum),
+            ).Else(
+                target.eq(self.setpoint),
+            ),
+            rise.eq(value + self.rise_step),
+            fall.eq(value - self.fall_step),
+            self.done.eq(value == target),
+        ]
+        self.sync += [
+            If(self.load,
+                value.eq(target),
+            ).Elif(value > self.maximum,
+                value.eq(self.maximum),
+            ).Elif(value < self.minimum,
+                value.eq(self.minimum),
+            ).Elif(self.update,
+                If(value < target,
+                    If(rise > target,
+                        value.eq(target),
+                    ).Else(
+                        value.eq(rise),
+                    ),
+                ).Elif(value > target,
+                    If(fall < target,
+                        value.eq(target),
+                    ).Else(
+                        value.eq(fall),
+                    ),
+                ),
+            ),
+        ]
+
+
+class SlewRateLimiterBank(Module):
+    """Multiple slew rate limiters sharing their settings
+
+    All the :class:`SlewRateLimiter` share the same `update` strobe, steps and bounds, for instance
+    to ramp the duty cycles of all the channels of a :class:`hmmc.output.pwm.PwmBank` together.
+
+    :param n_channels: number of channels
+    :type n_channels: int
+    :param limiter_parameters: pass additional parameters when instanciating the
+      :class:`SlewRateLimiter`
+
+    :inputs:
+        - **setpoint** (*list(FixedPointSignal(bits_sign))*) - target values
+        - **update** ( :class:`migen.fhdl.structure.Signal` ) - see :class:`SlewRateLimiter`
+        - **rise_step** ( :class:`migen.fhdl.structure.Signal` (step_resolution)) - see
+          :class:`SlewRateLimiter`
+        - **fall_step** ( :class:`migen.fhdl.structure.Signal` (step_resolution)) - see
+          :class:`SlewRateLimiter`
+        - **minimum** ( :class:`hmmc.math.fixedpoint.FixedPointSignal` (bits_sign)) - see
+          :class:`SlewRateLimiter`
+        - **maximum** ( :class:`hmmc.math.fixedpoint.FixedPointSignal` (bits_sign)) - see
+          :class:`SlewRateLimiter`
+        - **load** ( :class:`migen.fhdl.structure.Signal` ) - see :class:`SlewRateLimiter`
+
+    :outputs:
+        - **output** (*list(FixedPointSignal(bits_sign))*) - limited values
+        - **done** ( :class:`migen.fhdl.structure.Signal` ) - '1' when all the channels are done
+        - **channels** (*list(SlewRateLimiter)*) - the SlewRateLimiter instances
+    """
+    def __init__(self, n_channels, **limiter_parameters):
+        self.channels = []
+        for n in range(n_channels):
+            limiter = SlewRateLimiter(**limiter_parameters)
+            setattr(self.submodules, f"limiter_{n}", limiter)
+            self.channels.append(limiter)
+
+        first = self.channels[0]
+        self.update = Signal()
+        self.rise_step = Signal.like(first.rise_step, reset=first.rise_step.reset)
+        self.fall_step = Signal.like(first.fall_step, reset=first.fall_step.reset)
+        self.minimum = FixedPointSignal((first.minimum.nbits, first.minimum.signed),
+            first.minimum.radix_nbits, reset=first.minimum.reset)
+        self.maximum = FixedPointSignal((first.maximum.nbits, first.maximum.signed),
+            first.maximum.radix_nbits, reset=first.maximum.reset)
+        self.load = Signal()
+        self.setpoint = [limiter.setpoint for limiter in self.channels]
+        self.output = [limiter.output for limiter in self.channels]
+        self.done = Signal()
+
+        # # #
+
+        for limiter in self.channels:
+            self.comb += [
+                limiter.update.eq(self.update),
+                limiter.rise_step.eq(self.rise_step),
+                limiter.fall_step.eq(self.fall_step),
+                limiter.minimum.eq(self.minimum),
+                limiter.maximum.eq(self.maximum),
+                limiter.load.eq(self.load),
+            ]
+        dones = Cat(*[limiter.done for limiter in self.channels])
+        self.comb += self.done.eq(dones == 2**n_channels - 1)
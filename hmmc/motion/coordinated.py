@@ -0,0 +1,160 @@
+from migen import Module, Signal, If, Cat
+from migen.genlib.fifo import SyncFIFO
+from hmmc.motion.generator import MotionGeneratorAxis
+
+
+class CoordinatedMotion(Module):
+    """Coordinated linear interpolation of several axes
+
+    A single master :class:`hmmc.motion.generator.MotionGeneratorAxis` generates steps along the
+    path, with its speed and acceleration profile. Each line divides `line_length` master steps
+    between the axes, with a Bresenham DDA per axis: an axis with a displacement `line_delta` steps
+    on `line_delta` of the `line_length` master steps, evenly spread, so that all the axes start on
+    the first master step of the line and finish on the last one, without rounding drift. Only the
+    master has speed and acceleration accumulators, each axis only has an error accumulator and a
+    position counter.
+
+    The lines are independent from the master commands: the master target positions are the
+    cumulated line lengths. When a line ends, the next line starts on the next master step, so
+    consecutive lines are followed without stopping if the master does not stop.
+
+    `line_length` must be at least the largest \\|`line_delta`\\|, as an axis steps at most once per
+    master step. The maximum \\|`line_delta`\\| gives the fastest move, the euclidian length gives
+    a master speed equal to the speed along the path.
+
+    :param n_axes: number of axes
+    :type n_axes: int
+    :param w_position: size of the positions, lengths and displacements
+    :type w_position: int
+    :param line_depth: number of queued lines, 0 or >= 2, as a :class:`migen.genlib.fifo.SyncFIFO`
+                       can't have a depth of 1. If 0, a line is only accepted during the last step
+                       of the previous one
+    :type line_depth: int
+    :param generator_parameters: pass additional parameters when instanciating the master
+      :class:`hmmc.motion.generator.MotionGeneratorAxis`, such as `fifo_depth` or `w_jerk`
+
+    :inputs:
+        - **line_valid** (*Signal()*) - set to '1' when other line_* signals are valid
+        - **line_length** (*Signal(w_position)*) - number of master steps of the line
+        - **line_delta** (*list(Signal((w_position, True)))*) - displacement of each axis
+        - **line_underrun_clear** (*Signal()*) - clears `line_underrun`
+        - **master** (*MotionGeneratorAxis*) - cmd_* inputs of the master, to move along the path.
+          The master must only move forward
+
+    :outputs:
+        - **line_ready** (*Signal()*) - line flow control
+        - **line_level** (*Signal(max=line_depth + 1)*) - number of queued lines. Only if
+          line_depth > 0
+        - **idle** (*Signal()*) - '1' when no line is in progress or queued
+        - **line_underrun** (*Signal()*) - sticky, set if the master steps while no line is in
+          progress. Cleared by `line_underrun_clear`
+        - **position** (*list(Signal((w_position, True)))*) - position of each axis
+        - **up** (*list(Signal())*) - if '1', the position of the axis increased in this clock cycle
+        - **down** (*list(Signal())*) - if '1', the position of the axis decreased in this clock
+          cycle
+    """
+    def __init__(self, n_axes, w_position=20, line_depth=0, **generator_parameters):
+        assert line_depth != 1, "line_depth must be 0 or >= 2, SyncFIFO can't have a depth of 1"
+        self.submodules.master = master = MotionGeneratorAxis(w_position, **generator_parameters)
+
+        # inputs
+        self.line_valid = Signal()
+        self.line_length = Signal(w_position)
+        self.line_delta = [Signal((w_position, True)) for _ in range(n_axes)]
+        self.line_underrun_clear = Signal()
+
+        # outputs
+        self.line_ready = Signal()
+        self.idle = Signal()
+        self.line_underrun = Signal()
+        self.position = [Signal((w_position, True)) for _ in range(n_axes)]
+        self.up = [Signal() for _ in range(n_axes)]
+        self.down = [Signal() for _ in range(n_axes)]
+
+        # # #
+
+        # next line
+        next_valid = Signal()
+        next_length = Signal(w_position)
+        next_delta = [Signal((w_position, True)) for _ in range(n_axes)]
+        load = Signal()
+        accept = Signal()  # the next line can be loaded
+        if line_depth:
+            self.line_level = Signal(max=line_depth + 1)
+            self.submodules.fifo = fifo = SyncFIFO(w_position * (n_axes + 1), line_depth)
+            self.comb += [
+                fifo.din.eq(Cat(self.line_length, *self.line_delta)),
+                fifo.we.eq(self.line_valid),
+                self.line_ready.eq(fifo.writable),
+                self.line_level.eq(fifo.level),
+                Cat(next_length, *next_delta).eq(fifo.dout),
+                next_valid.eq(fifo.readable),
+                fifo.re.eq(load),
+            ]
+        else:
+            self.comb += [
+                next_length.eq(self.line_length),
+                [d.eq(delta) for d, delta in zip(next_delta, self.line_delta)],
+                next_valid.eq(self.line_valid),
+                self.line_ready.eq(accept),
+            ]
+
+        # master steps left in the current line
+        remaining = Signal(w_position)
+        length = Signal(w_position)
+        step = Signal()
+        self.comb += [
+            step.eq(master.up & (remaining != 0)),
+            # the next line starts when the current one is finished, or during its last step
+            accept.eq((remaining == 0) | (step & (remaining == 1))),
+            load.eq(next_valid & accept),
+            self.idle.eq((remaining == 0) & ~next_valid),
+        ]
+        self.sync += [
+            If(load,
+                remaining.eq(next_length),
+                length.eq(next_length),
+            ).Elif(step,
+                remaining.eq(remaining - 1),
+            ),
+            If(self.line_underrun_clear,
+                self.line_underrun.eq(0),
+            ).Elif(master.up & (remaining == 0),
+                self.line_underrun.eq(1),
+            ),
+        ]
+
+        # Bresenham DDA of each axis
+        for n in range(n_axes):
+            magnitude = Signal(w_position)
+            direction = Signal()
+            error = Signal(w_position + 1)
+            error_next = Signal(w_position + 1)
+            axis_step = Signal()
+            self.comb += [
+                error_next.eq(error + magnitude),
+                axis_step.eq(step & (error_next >= length)),
+                self.up[n].eq(axis_step & direction),
+                self.down[n].eq(axis_step & ~direction),
+            ]
+            self.sync += [
+                If(load,
+                    # errors centered, for steps evenly spread around the ideal line
+                    error.eq(next_length >> 1),
+                    direction.eq(~next_delta[n][-1]),
+                    If(next_delta[n][-1],
+                        magnitude.eq(-next_delta[n]),
+                    ).Else(
+                        magnitude.eq(next_delta[n]),
+                    ),
+                ).Elif(axis_step,
+                    error.eq(error_next - length),
+                ).Elif(step,
+                    error.eq(error_next),
+                ),
+                If(self.up[n],
+                    self.position[n].eq(self.position[n] + 1),
+                ).Elif(self.down[n],
+                    self.position[n].eq(self.position[n] - 1),
+                ),
+            ]
@@ -1,29 +1,71 @@
-from migen import Module, Signal, If, Cat, C, Replicate
+from math import sqrt, ceil, floor
+from migen import Module, Signal, If, Cat, C, Replicate, Mux
+from migen.genlib.fifo import SyncFIFO
+from migen.fhdl.decorators import ResetInserter
 from hmmc.math.dsp import add_signed_detect_overflow
+from hmmc.math.slewrate import SlewRateLimiter
 
 
 class MotionGeneratorAxis(Module):
     """This module generates position and speed setpoints in realtime.
 
+    With `fifo_depth`, the commands are segments queued in a FIFO. When the target of a segment is
+    reached, the next segment is loaded in the same clock cycle and the speed is kept, so that
+    consecutive segments form a continuous path. `cmd_start_speed` is only applied when the axis was
+    stopped: initially, after the `cmd_last` segment, or after an underrun. Each segment must move
+    in the direction of the speed at its start, as the speed never changes sign.
+
+    With `w_jerk`, the acceleration is itself integrated from the jerk, for jerk limited (S-curve)
+    profiles: it moves towards `cmd_acceleration` by `cmd_jerk` per clock cycle, and stays there.
+    `acceleration` is then the MSBs of `acceleration_raw`, like `speed` and `speed_raw`. The
+    acceleration is continuous between commands, and is only set to 0 by `flush`.
+    :meth:`scurve_commands` computes the commands of a move.
+
     :param w_position: size of the position accumulator
     :type w_position: int
     :param w_speed: size of the speed accumulator
     :type w_speed: int
     :param w_acceleration: size of the acceleration state
     :type w_acceleration: int
+    :param fifo_depth: number of queued segments, 0 or >= 2, as a
+                       :class:`migen.genlib.fifo.SyncFIFO` can't have a depth of 1. If 0, a
+                       command is only accepted when `done`
+    :type fifo_depth: int
+    :param counter_resolution: size of the `transition_cycles` counter. Only if fifo_depth > 0
+    :type counter_resolution: int
+    :param w_jerk: size of the jerk state. If 0, the acceleration is constant during a command
+    :type w_jerk: int
 
     :inputs:
         - **cmd_valid** (*Signal()*) - set to '1' when other cmd_* signals are valid
         - **cmd_start_speed** (*Signal(w_speed)*) - internal state 'speed' set to this value when
-          cmd_valid & cmd_ready
+          cmd_valid & cmd_ready. With fifo_depth, only when the axis was stopped
         - **cmd_target_position** (*Signal(w_position)*) - position to reach (and stop to)
         - **cmd_acceleration** (*Signal(w_acceleration)*) - internal state 'acceleration' set to
           this value when cmd_valid & cmd_ready
-        - **flush** (*Signal()*) - when '1', set speed to 0 and target to actual position
+        - **cmd_jerk** (*Signal(w_jerk)*) - internal state 'jerk' set to this value when
+          cmd_valid & cmd_ready. Rate of change of the acceleration, unsigned. Only if w_jerk > 0
+        - **cmd_last** (*Signal()*) - '1' if the segment ends the path, so that stopping after it
+          is not an underrun. Only if fifo_depth > 0
+        - **flush** (*Signal()*) - when '1', set speed to 0 and target to actual position. Also
+          empties the FIFO
+        - **underrun_clear** (*Signal()*) - clears `underrun` and `transition_cycles`. Only if
+          fifo_depth > 0
 
     :outputs:
-        - **cmd_ready** (*Signal()*) - Used for command flow control. Identical to 'done'
+        - **cmd_ready** (*Signal()*) - Used for command flow control. Identical to 'done', or '1'
+          when the FIFO is not full
+        - **cmd_level** (*Signal(max=fifo_depth + 1)*) - number of queued segments. Only if
+          fifo_depth > 0
+        - **underrun** (*Signal()*) - sticky, set when the target of a segment which is not
+          `cmd_last` is reached while the FIFO is empty. Only if fifo_depth > 0
+        - **transition_cycles** (*Signal(counter_resolution)*) - clock cycles spent waiting for a
+          segment after an underrun, saturated. 0 while the segments are chained without gap. Only
+          if fifo_depth > 0
         - **acceleration** (*Signal(w_acceleration)*) - current acceleration
+        - **acceleration_raw** (*Signal((w_acceleration + w_jerk, True))*) - internal state. Only
+          if w_jerk > 0
+        - **jerk** (*Signal(w_jerk)*) - current jerk. Only if w_jerk > 0
         - **position** (*Signal((w_position, True))*) - internal state
         - **speed_raw** (*Signal((w_speed + w_acceleration, True))*) - internal state
         - **speed** (*Signal(w_speed)*) - internal state
@@ -32,14 +74,22 @@ class MotionGeneratorAxis(Module):
         - **done** (*Signal()*) - 'cmd_target_position' is reached, module at idle
     """
 
-    def __init__(self, w_position=20, w_speed=20, w_acceleration=20):
+    def __init__(self, w_position=20, w_speed=20, w_acceleration=20, fifo_depth=0,
+                 counter_resolution=16, w_jerk=0):
         assert w_acceleration <= w_speed  # can't saturate speed in one cycle
+        assert fifo_depth != 1, "fifo_depth must be 0 or >= 2, SyncFIFO can't have a depth of 1"
+        self.w_position = w_position
+        self.w_speed = w_speed
+        self.w_acceleration = w_acceleration
+        self.w_jerk = w_jerk
 
         # inputs
         self.cmd_valid = Signal()
         self.cmd_start_speed = Signal(w_speed)
         self.cmd_target_position = Signal(w_position)
         self.cmd_acceleration = Signal(w_acceleration)
+        if w_jerk:
+            self.cmd_jerk = Signal(w_jerk)
         self.flush = Signal()
 
         # input buffer
@@ -62,27 +112,136 @@ class MotionGeneratorAxis(Module):
         self.up = Signal()
         self.done = Signal()
 
+        # # #
+
+        # next command
+        next_start_speed = Signal(w_speed)
+        next_target_position = Signal(w_position)
+        next_acceleration = Signal((w_acceleration, True))
+        restart = Signal()  # load the next command, from the start speed
+        chain = Signal()  # load the next command in the same cycle, keeping the speed
+        if w_jerk:
+            next_jerk = Signal(w_jerk)
+            cmd_jerk = [self.cmd_jerk]
+            next_jerk_fields = [next_jerk]
+        else:
+            cmd_jerk = []
+            next_jerk_fields = []
+
+        if fifo_depth:
+            self.cmd_last = Signal()
+            self.underrun_clear = Signal()
+            self.cmd_level = Signal(max=fifo_depth + 1)
+            self.underrun = Signal()
+            self.transition_cycles = Signal(counter_resolution)
+
+            fifo = SyncFIFO(w_speed + w_position + w_acceleration + 1 + w_jerk, fifo_depth)
+            self.submodules.fifo = fifo = ResetInserter()(fifo)
+            next_last = Signal()
+            last = Signal(reset=1)  # the current segment ends the path
+            stopped = Signal(reset=1)  # done in the previous cycle
+            self.comb += [
+                fifo.reset.eq(self.flush),
+                fifo.din.eq(Cat(self.cmd_start_speed, self.cmd_target_position,
+                    self.cmd_acceleration, self.cmd_last, *cmd_jerk)),
+                fifo.we.eq(self.cmd_valid),
+                self.cmd_ready.eq(fifo.writable),
+                self.cmd_level.eq(fifo.level),
+                Cat(next_start_speed, next_target_position, next_acceleration, next_last,
+                    *next_jerk_fields).eq(fifo.dout),
+                restart.eq(self.done & fifo.readable & stopped),
+                chain.eq(self.done & fifo.readable & ~stopped),
+                fifo.re.eq(restart | chain),
+            ]
+            self.sync += [
+                stopped.eq(self.done & ~chain),
+                If(restart | chain,
+                    last.eq(next_last),
+                ),
+                If(self.underrun_clear,
+                    self.underrun.eq(0),
+                    self.transition_cycles.eq(0),
+                ).Elif(self.done & ~last & ~fifo.readable & ~self.flush,
+                    If(~stopped,
+                        self.underrun.eq(1),
+                    ),
+                    If(self.transition_cycles != 2**counter_resolution - 1,
+                        self.transition_cycles.eq(self.transition_cycles + 1),
+                    ),
+                ),
+                If(self.flush,
+                    last.eq(1),
+                ),
+            ]
+        else:
+            self.comb += [
+                next_start_speed.eq(self.cmd_start_speed),
+                next_target_position.eq(self.cmd_target_position),
+                next_acceleration.eq(self.cmd_acceleration),
+                restart.eq(self.done & self.cmd_valid),
+                self.cmd_ready.eq(self.done),
+            ]
+            if w_jerk:
+                self.comb += next_jerk.eq(self.cmd_jerk)
+
+        # acceleration of this clock cycle
+        step_acceleration = Signal((w_acceleration, True))
+
+        if w_jerk:
+            # the acceleration slews towards the acceleration of the command
+            self.jerk = jerk = Signal(w_jerk)
+            target_acceleration = Signal((w_acceleration, True))
+            self.submodules.jerk_limiter = limiter = SlewRateLimiter(
+                (w_acceleration + w_jerk, True), radix_nbits=0, step_resolution=w_jerk)
+            self.acceleration_raw = limiter.output
+            load = restart | chain
+            self.comb += [
+                If(self.flush,
+                    Signal.eq(limiter.setpoint, 0),
+                ).Else(
+                    Signal.eq(limiter.setpoint, Cat(C(0, w_jerk),
+                        Mux(load, next_acceleration, target_acceleration))),
+                ),
+                limiter.rise_step.eq(Mux(load, next_jerk, jerk)),
+                limiter.fall_step.eq(Mux(load, next_jerk, jerk)),
+                limiter.update.eq(~self.done | chain),
+                limiter.load.eq(self.flush),
+                acceleration.eq(limiter.output[w_jerk:]),
+                step_acceleration.eq(acceleration),
+            ]
+            load_acceleration = [
+                target_acceleration.eq(next_acceleration),
+                jerk.eq(next_jerk),
+            ]
+        else:
+            self.comb += step_acceleration.eq(Mux(chain, next_acceleration, acceleration))
+            load_acceleration = [acceleration.eq(next_acceleration)]
+
         self.sync += [
             If(self.flush,
                 target_position.eq(position),
                 speed_raw.eq(0),
-            ).Elif(~self.done,
+            ).Elif(~self.done | chain,
                 cnt.eq(self.addsat.C),
-                If(((speed == 1) & acceleration[-1]) | ((speed == Replicate(C(1), w_speed))
-                    & ~acceleration[-1]),
+                If(((speed == 1) & step_acceleration[-1]) | ((speed == Replicate(C(1), w_speed))
+                    & ~step_acceleration[-1]),
                     # make sure speed does not change sign on deceleration
                     speed_raw.eq(speed_raw),
                 ).Else(
                     # sign extend acceleration before adding it to speed
-                    speed_raw.eq(speed_raw + acceleration),
+                    speed_raw.eq(speed_raw + step_acceleration),
                     # speed_raw.eq(speed_raw +
                     #     Cat(acceleration, Replicate(acceleration[-1], w_speed))),
-                )
-            ).Elif(self.cmd_valid,  # load next motion command
-                speed_raw.eq(Cat(Replicate(self.cmd_start_speed[-1], w_acceleration),
-                                 self.cmd_start_speed)),
-                target_position.eq(self.cmd_target_position),
-                acceleration.eq(self.cmd_acceleration),
+                ),
+                If(chain,  # next segment, without stopping
+                    target_position.eq(next_target_position),
+                    *load_acceleration,
+                ),
+            ).Elif(restart,  # load next motion command
+                speed_raw.eq(Cat(Replicate(next_start_speed[-1], w_acceleration),
+                                 next_start_speed)),
+                target_position.eq(next_target_position),
+                *load_acceleration,
             ),
             If(self.addsat.overflow,
                 position.eq(position + 1),
@@ -96,7 +255,6 @@ class MotionGeneratorAxis(Module):
             self.down.eq(self.addsat.underflow),
             speed.eq(speed_raw[-w_speed:]),
             self.done.eq(position == target_position),
-            self.cmd_ready.eq(self.done),
         ]
 
     def perf_limits(self, fclk, resolution):
@@ -115,3 +273,105 @@ class MotionGeneratorAxis(Module):
         accel_max = accel_res * 2**self.w_acceleration
 
         return speed_res, speed_max, accel_res, accel_max
+
+    def scurve_commands(self, fclk, resolution, distance, max_speed, max_acceleration, max_jerk,
+                        start_position=0):
+        """Compute the commands of a jerk limited (S-curve) move
+
+        The move is split in up to 4 commands: acceleration up to the maximum acceleration, then
+        back to 0 while reaching the maximum speed and cruising, deceleration, then back to 0
+        acceleration. If the move is too short, the maximum speed is reduced.
+
+        As the commands end on position steps, the profile differs slightly from the computed one.
+        The ends of the commands are rounded towards a higher speed, the move starts and ends at a
+        creep speed of 1/64 of the maximum speed, and the deceleration is planned to end one step
+        before the target, so that the axis never stops before the target.
+
+        Queue the commands in order in a generator with `w_jerk` and `fifo_depth`, with `cmd_last`
+        set on the last one, so that the speed is continuous. Without FIFO, each command starts
+        from its start speed one clock cycle after the previous one is done.
+
+        :param fclk: clock frequency
+        :type fclk: float
+        :param resolution: distance increment of a single position step (ex: 1um)
+        :type resolution: float
+        :param distance: length of the move, negative to move backwards
+        :type distance: float
+        :param max_speed: maximum speed. Limited to the maximum of the generator
+        :type max_speed: float
+        :param max_acceleration: maximum acceleration. Limited to the maximum of the generator
+        :type max_acceleration: float
+        :param max_jerk: maximum jerk. Limited to the maximum of the generator
+        :type max_jerk: float
+        :param start_position: position at the start of the move, in steps
+        :type start_position: int
+
+        :returns: list of (cmd_target_position, cmd_start_speed, cmd_acceleration, cmd_jerk)
+                  signed command words. The units of the parameters are consistant with the one of
+                  parameter 'resolution' (ex: m->m/s, m/s², m/s³)
+        :rtype: list(tuple(int, int, int, int))
+        """
+        assert self.w_jerk, "jerk limited moves need w_jerk > 0"
+        speed_scale = 2**self.w_speed
+        acceleration_scale = 2**(self.w_speed + self.w_acceleration)
+        jerk_scale = 2**(self.w_speed + self.w_acceleration + self.w_jerk)
+
+        # in position steps and clock cycles
+        steps = round(abs(distance) / resolution)
+        v = min(max_speed / resolution / fclk, (2**(self.w_speed - 1) - 1) / speed_scale)
+        a = min(max_acceleration / resolution / fclk**2,
+                (2**(self.w_acceleration - 1) - 1) / acceleration_scale)
+        j = min(max_jerk / resolution / fclk**3, (2**self.w_jerk - 1) / jerk_scale)
+        creep_speed = v / 64
+        margin = 1
+        if steps == 0:
+            return []
+
+        def ramp(speed):
+            """Peak acceleration, durations of the jerk and constant acceleration phases from the
+            creep speed to `speed`, and distance travelled"""
+            delta = speed - creep_speed
+            if delta * j >= a**2:
+                t_j = a / j
+                t_a = delta / a - t_j
+            else:
+                t_j = sqrt(delta / j)
+                t_a = 0
+            return j * t_j, t_j, t_a, (speed + creep_speed) * (2 * t_j + t_a) / 2
+
+        if 2 * ramp(v)[3] + margin > steps:
+            # the maximum speed is not reached, find the highest speed by bisection
+            low, high = creep_speed, v
+            for _ in range(64):
+                v = (low + high) / 2
+                if 2 * ramp(v)[3] + margin > steps:
+                    high = v
+                else:
+                    low = v
+            v = low
+        a_peak, t_j, t_a, ramp_distance = ramp(v)
+        # speed and position after the increasing, then constant acceleration. The deceleration is
+        # symmetric
+        v1 = creep_speed + j * t_j**2 / 2
+        p1 = creep_speed * t_j + j * t_j**3 / 6
+        v2 = v1 + a_peak * t_a
+        p2 = p1 + v1 * t_a + a_peak * t_a**2 / 2
+        # rounded towards a longer acceleration and a shorter deceleration
+        ends = [ceil(p2), ceil(steps - margin - ramp_distance), floor(steps - margin - p1), steps]
+        accelerations = [a_peak, 0, -a_peak, 0]
+        speeds = [creep_speed, v2, v, v1]
+
+        sign = 1 if distance > 0 else -1
+        commands = []
+        previous_target = start_position
+        start_speed = None
+        for end, acceleration, speed in zip(ends, accelerations, speeds):
+            if start_speed is None:
+                start_speed = speed
+            target = start_position + sign * min(max(end, 0), steps)
+            if target != previous_target:
+                commands.append((target, round(sign * start_speed * speed_scale),
+                    round(sign * acceleration * acceleration_scale), round(j * jerk_scale)))
+                previous_target = target
+                start_speed = None
+        return commands
@@ -0,0 +1,183 @@
+"""
+Encoder emulation
+=================
+
+Generates the A/B/Z signals of an incremental encoder from the positions of an absolute encoder,
+to give a feedback to a controller which only accepts incremental encoders.
+"""
+
+from migen import Module, Signal, If, Cat
+from hmmc.output.stepdir import Quadrature
+
+
+class AbzEmulator(Module):
+    """Absolute to incremental (ABZ) encoder emulation
+
+    Each absolute position, such as the `position` of a :class:`hmmc.input.mitsubishi.ECNMEncoder`
+    or a :class:`hmmc.input.biss.BiSSMaster`, is scaled to `counts` quadrature counts per turn. The
+    difference with the previous position is then spread evenly over the time between two samples
+    by a DDA, so that the counts are output at a steady rate instead of bursts at each sample. The
+    counts are output by a paced :class:`hmmc.output.stepdir.Quadrature`, at most one edge every
+    `edge_spacing` clock ticks.
+
+    The output position is compared to the absolute position at each sample, so multi-count jumps
+    and counts which could not be output before the next sample are caught up, and no count is
+    lost. `z` is '1' while the output position is 0, once per turn, with `a` and `b` both '0'. The
+    quadrature state is kept across resets, so the first sample sets the output position, without
+    generating counts, to the count of the same group of 4 which matches the current `a` and `b`
+    state. The up to 3 counts of difference are output after the next sample.
+
+    :param resolution: resolution in bits of the single turn absolute position
+    :type resolution: int
+    :param counts_resolution: resolution in bits of `counts`
+    :type counts_resolution: int
+    :param default_counts: `counts` at reset
+    :type default_counts: int
+    :param interval_resolution: resolution in bits of the measured time between two samples, in
+                                clock ticks. Longer intervals are saturated
+    :type interval_resolution: int
+    :param edge_spacing: `edge_spacing` at reset, see :class:`hmmc.output.stepdir.Quadrature`
+    :type edge_spacing: int
+    :param depth: counts backlog depth, see :class:`hmmc.output.stepdir.Quadrature`
+    :type depth: int
+
+    :inputs:
+        - **position** ( :class:`migen.fhdl.structure.Signal` (resolution)) - single turn absolute
+          position
+        - **position_valid** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when a
+          new `position` is sampled
+        - **counts** ( :class:`migen.fhdl.structure.Signal` (counts_resolution)) - quadrature
+          counts per turn (4 times the number of lines). Must be a multiple of 4, so that the
+          `a` and `b` state at the index is the same every turn
+        - **edge_spacing** ( :class:`migen.fhdl.structure.Signal` ) - minimum time between two
+          edges, in clock ticks. Sets the maximum output frequency
+
+    :outputs:
+        - **a** ( :class:`migen.fhdl.structure.Signal` ) - Quadrature output a
+        - **b** ( :class:`migen.fhdl.structure.Signal` ) - Quadrature output b
+        - **z** ( :class:`migen.fhdl.structure.Signal` ) - index output, '1' during the count 0.
+          Follows `a` and `b` by 1 clk tick
+        - **output_position** ( :class:`migen.fhdl.structure.Signal` (counts_resolution)) - position
+          of the quadrature outputs, in counts
+        - **overflow** ( :class:`migen.fhdl.structure.Signal` ) - sticky, see
+          :class:`hmmc.output.stepdir.Quadrature`. Should never be set, as the DDA waits for the
+          backlog
+    """
+    def __init__(self, resolution=24, counts_resolution=16, default_counts=4096,
+                 interval_resolution=16, edge_spacing=1, depth=8):
+        # inputs
+        self.position = Signal(resolution)
+        self.position_valid = Signal()
+        self.counts = Signal(counts_resolution, reset=default_counts)
+
+        # outputs
+        self.z = Signal()
+        self.output_position = Signal(counts_resolution)
+
+        # # #
+
+        self.submodules.quadrature = quadrature = Quadrature(edge_spacing, depth)
+        self.edge_spacing = quadrature.edge_spacing
+        self.a = quadrature.a
+        self.b = quadrature.b
+        self.overflow = quadrature.overflow
+
+        # scaling
+        target = Signal(counts_resolution)
+        self.comb += target.eq((self.position * self.counts) >> resolution)
+
+        # time since the previous sample, the expected time until the next one
+        interval = Signal(interval_resolution)
+        self.sync += [
+            If(self.position_valid,
+                interval.eq(1),
+            ).Elif(interval != 2**interval_resolution - 1,
+                interval.eq(interval + 1),
+            ),
+        ]
+
+        # counts requested to the quadrature output, and error to the new target, in ]-counts/2,
+        # counts/2]
+        requested = Signal(counts_resolution)
+        error = Signal((counts_resolution + 2, True))
+        error_wrapped = Signal((counts_resolution + 2, True))
+        self.comb += [
+            error.eq(target - requested),
+            If(error > (self.counts >> 1),
+                error_wrapped.eq(error - self.counts),
+            ).Elif(error <= -(self.counts >> 1),
+                error_wrapped.eq(error + self.counts),
+            ).Else(
+                error_wrapped.eq(error),
+            ),
+        ]
+
+        # DDA: outputs `todo` counts over `interval` clock ticks
+        initialized = Signal()
+        todo = Signal(counts_resolution + 1)  # remaining counts
+        rate = Signal(counts_resolution + 1)  # counts to output during the interval
+        direction = Signal()
+        period = Signal(interval_resolution)
+        acc = Signal(max(counts_resolution + 1, interval_resolution) + 1)
+        emit = Signal()
+        ready = Signal()
+        self.comb += [
+            ready.eq((quadrature.backlog < depth) & (quadrature.backlog > -depth)),
+            emit.eq((todo != 0) & (acc >= period) & ready & ~self.position_valid),
+            quadrature.up.eq(emit & direction),
+            quadrature.down.eq(emit & ~direction),
+        ]
+        self.sync += [
+            If(self.position_valid,
+                initialized.eq(1),
+                acc.eq(interval >> 1),  # counts centered in the interval
+                period.eq(interval),
+                If(~initialized,
+                    # counts 0, 1, 2, 3 modulo 4 are output as (a, b) = 00, 10, 11, 01
+                    requested.eq(Cat(quadrature.a ^ quadrature.b, quadrature.b, target[2:])),
+                    todo.eq(0),
+                ).Elif(error_wrapped < 0,
+                    direction.eq(0),
+                    todo.eq(-error_wrapped),
+                    rate.eq(-error_wrapped),
+                ).Else(
+                    direction.eq(1),
+                    todo.eq(error_wrapped),
+                    rate.eq(error_wrapped),
+                ),
+            ).Else(
+                If(emit,
+                    todo.eq(todo - 1),
+                    acc.eq(acc - period + rate),
+                    If(direction,
+                        If(requested == self.counts - 1,
+                            requested.eq(0),
+                        ).Else(
+                            requested.eq(requested + 1),
+                        ),
+                    ).Else(
+                        If(requested == 0,
+                            requested.eq(self.counts - 1),
+                        ).Else(
+                            requested.eq(requested - 1),
+                        ),
+                    ),
+                ).Elif(acc < period,
+                    acc.eq(acc + rate),
+                ),
+            ),
+        ]
+
+        # position of the outputs: the requested counts which are not in the backlog anymore
+        output_position = Signal((counts_resolution + 2, True))
+        self.comb += [
+            output_position.eq(requested - quadrature.backlog),
+            If(output_position < 0,
+                self.output_position.eq(output_position + self.counts),
+            ).Elif(output_position >= self.counts,
+                self.output_position.eq(output_position - self.counts),
+            ).Else(
+                self.output_position.eq(output_position),
+            ),
+        ]
+        self.sync += self.z.eq(initialized & (self.output_position == 0))
@@ -1,4 +1,4 @@
-from migen import Module, Signal, Cat
+from migen import Module, Signal, Cat, If
 from hmmc.math.fixedpoint import FixedPointSignal
 
 
@@ -42,3 +42,147 @@ class DeltaSigmaFixedPoint(Module):
             self.comb += in_unsigned.eq(self.input + 2**(resolution - 1))
         else:
             self.sync += Cat(cnt, self.output).eq(cnt + self.input)
+
+
+class Lfsr(Module):
+    """Pseudo-random bit generator
+
+    Galois linear feedback shift register, with a maximal length sequence of 2**16 - 1 bits.
+
+    :param seed: initial state. Must not be 0
+    :type seed: int
+
+    :outputs:
+        - **output** ( :class:`migen.fhdl.structure.Signal` ) - pseudo-random bit, changes at each
+          clock cycle
+    """
+    def __init__(self, seed=1):
+        assert seed != 0
+        self.output = Signal()
+
+        # # #
+
+        state = Signal(16, reset=seed)
+        self.comb += self.output.eq(state[0])
+        self.sync += [
+            If(state[0],
+                state.eq((state >> 1) ^ 0xB400),  # x^16 + x^14 + x^13 + x^11 + 1
+            ).Else(
+                state.eq(state >> 1),
+            ),
+        ]
+
+
+class DeltaSigma2(Module):
+    """Second order Delta Sigma modulator
+
+    Drop-in replacement of :class:`DeltaSigma`: the quantization error is shaped by (1 - z^-1)^2
+    instead of (1 - z^-1), which pushes more of the noise to high frequencies, where it is removed
+    by the output filter, and breaks most of the idle tones of the first order modulator.
+
+    The input should stay within about 1/16 and 15/16 of its range. Beyond, the modulator
+    overloads: the error is saturated to keep it stable, and the output is less accurate.
+
+    :param resolution: resolution of the input data, in bits
+    :type resolution: int
+    :param dither: if True, add a pseudo-random LSB to the input. This breaks the remaining idle
+                   tones, and adds an average offset of half an LSB
+    :type dither: bool
+
+    :inputs:
+        - **input** ( :class:`migen.fhdl.structure.Signal` (resolution))) - digital value to convert
+          to pulse-density
+
+    :outputs:
+        - **output** ( :class:`migen.fhdl.structure.Signal` ) - pulse density modulated output
+    """
+    def __init__(self, resolution, dither=False):
+        self.input = Signal(resolution)
+        self.output = Signal()
+
+        # # #
+
+        error_max = 8 * 2**resolution
+        value = Signal((resolution + 7, True))
+        quantized = Signal()
+        error = Signal((resolution + 7, True))
+        error1 = Signal((resolution + 5, True))
+        error2 = Signal((resolution + 5, True))
+        if dither:
+            self.submodules.lfsr = lfsr = Lfsr()
+            self.comb += value.eq(self.input + lfsr.output + (error1 << 1) - error2)
+        else:
+            self.comb += value.eq(self.input + (error1 << 1) - error2)
+        self.comb += [
+            quantized.eq(value >= 2**(resolution - 1)),
+            error.eq(value - (quantized << resolution)),
+        ]
+        self.sync += [
+            self.output.eq(quantized),
+            error2.eq(error1),
+            If(error >= error_max,
+                error1.eq(error_max - 1),
+            ).Elif(error < -error_max,
+                error1.eq(-error_max),
+            ).Else(
+                error1.eq(error),
+            ),
+        ]
+
+
+class DeltaSigmaMash(Module):
+    """MASH Delta Sigma modulator
+
+    Cascade of `order` first order accumulators, whose carries are recombined so that the
+    quantization error is shaped by (1 - z^-1)**order. The modulator is unconditionally stable, but
+    the output is multi-level, from -(2**(order - 1) - 1) to 2**(order - 1): it is meant to be
+    added to an integer, such as the duty cycle of a :class:`hmmc.output.pwm.Pwm`, or to drive a
+    multi-level DAC. MASH 1-1-1 (`order` = 3) is the usual choice.
+
+    :param resolution: resolution of the input data, in bits
+    :type resolution: int
+    :param order: number of accumulators
+    :type order: int
+    :param dither: if True, add a pseudo-random LSB to the input. This breaks the idle tones, and
+                   adds an average offset of half an LSB
+    :type dither: bool
+
+    :inputs:
+        - **input** ( :class:`migen.fhdl.structure.Signal` (resolution))) - digital value to
+          modulate. The average of `output` is `input` / 2**resolution
+
+    :outputs:
+        - **output** ( :class:`migen.fhdl.structure.Signal` (min=-(2**(order - 1) - 1),
+          max=2**(order - 1) + 1)) - modulated output
+    """
+    def __init__(self, resolution, order=3, dither=False):
+        self.input = Signal(resolution)
+        self.output = Signal(min=-(2**(order - 1) - 1), max=2**(order - 1) + 1)
+
+        # # #
+
+        # accumulators, each one integrating the content of the previous one
+        stage_input = Signal(resolution + 1)
+        if dither:
+            self.submodules.lfsr = lfsr = Lfsr()
+            self.comb += stage_input.eq(self.input + lfsr.output)
+        else:
+            self.comb += stage_input.eq(self.input)
+        carries = []
+        for _ in range(order):
+            acc = Signal(resolution)
+            total = Signal(resolution + 2)
+            self.comb += total.eq(acc + stage_input)
+            self.sync += acc.eq(total[:resolution])
+            carries.append(total[resolution:])
+            stage_input = total[:resolution]
+
+        # recombination: each stage adds the derivative of the next ones
+        combined = carries[-1]
+        for carry in reversed(carries[:-1]):
+            previous = Signal.like(combined)
+            self.sync += previous.eq(combined)
+            stage = Signal((len(combined) + 2, True))
+            self.comb += stage.eq(carry + combined - previous)
+            combined = stage
+        self.sync += self.output.eq(combined)
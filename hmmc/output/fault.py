@@ -0,0 +1,102 @@
+"""
+Fault shutdown
+==============
+
+Aggregates hardware fault inputs, such as gate driver faults or overcurrent comparators, into a
+single `kill` signal which forces the power stage outputs off without any CPU intervention.
+"""
+
+from migen import Module, Signal, If
+from migen.genlib.cdc import MultiReg
+
+
+class FaultManager(Module):
+    """Fault aggregation, with latching, masking and per-source counters
+
+    `kill` is '1' while an unmasked fault input is '1', and for latching sources, until `clear`.
+    Connect it to the `kill` input of :class:`hmmc.output.pwm.Pwm`,
+    :class:`hmmc.output.pwm.PwmBank`, :class:`hmmc.output.pwm.PwmHighRes`,
+    :class:`hmmc.output.pwm.DeadTime`, :class:`hmmc.output.pwm.DeadTimeComplementary`,
+    :class:`hmmc.output.pwm.BootstrapRefresh` or :class:`hmmc.output.pushpull.PushPull`, which
+    gate their outputs combinationally.
+
+    The fault inputs are resynchronized by `sync_stages` flip-flops, so `kill` and the gated outputs
+    are '0' `latency` = `sync_stages` clock cycles after a fault input is set. With
+    `sync_stages=0`, the inputs must be synchronous to the clock, and the outputs are gated in the
+    same clock cycle.
+
+    The rising edges of each fault input are counted, including masked sources, so that a source
+    can be monitored before being enabled.
+
+    :param n_sources: number of fault inputs
+    :type n_sources: int
+    :param counter_resolution: resolution in bits of the fault counters. The counters saturate
+    :type counter_resolution: int
+    :param sync_stages: number of resynchronization flip-flops of the fault inputs
+    :type sync_stages: int
+
+    :inputs:
+        - **fault** ( :class:`migen.fhdl.structure.Signal` (n_sources)) - fault inputs, '1' when in
+          fault
+        - **mask** ( :class:`migen.fhdl.structure.Signal` (n_sources)) - '1' to ignore a source. No
+          source is masked at reset
+        - **latching** ( :class:`migen.fhdl.structure.Signal` (n_sources)) - '1' if a fault of the
+          source keeps `kill` set until `clear`. Otherwise, `kill` is only set while the fault is
+          present, such as for cycle by cycle current limitation. All sources latch at reset
+        - **clear** ( :class:`migen.fhdl.structure.Signal` ) - clears the latched faults which are
+          not present anymore
+        - **clear_counters** ( :class:`migen.fhdl.structure.Signal` ) - sets all the fault counters
+          to 0
+
+    :outputs:
+        - **kill** ( :class:`migen.fhdl.structure.Signal` ) - '1' to force the outputs off
+        - **active** ( :class:`migen.fhdl.structure.Signal` (n_sources)) - unmasked faults present
+        - **latched** ( :class:`migen.fhdl.structure.Signal` (n_sources)) - latched faults
+        - **count** (*list(Signal(counter_resolution))*) - number of faults of each source
+    """
+    def __init__(self, n_sources, counter_resolution=16, sync_stages=2):
+        self.latency = sync_stages
+
+        # inputs
+        self.fault = Signal(n_sources)
+        self.mask = Signal(n_sources)
+        self.latching = Signal(n_sources, reset=2**n_sources - 1)
+        self.clear = Signal()
+        self.clear_counters = Signal()
+
+        # outputs
+        self.kill = Signal()
+        self.active = Signal(n_sources)
+        self.latched = Signal(n_sources)
+        self.count = [Signal(counter_resolution) for _ in range(n_sources)]
+
+        # # #
+
+        if sync_stages:
+            fault = Signal(n_sources)
+            self.specials += MultiReg(self.fault, fault, n=sync_stages)
+        else:
+            fault = self.fault
+
+        self.comb += [
+            self.active.eq(fault & ~self.mask),
+            self.kill.eq((self.active != 0) | (self.latched != 0)),
+        ]
+        self.sync += [
+            If(self.clear,
+                self.latched.eq(self.active & self.latching),
+            ).Else(
+                self.latched.eq(self.latched | (self.active & self.latching)),
+            ),
+        ]
+
+        prev_fault = Signal(n_sources)
+        self.sync += prev_fault.eq(fault)
+        for n, count in enumerate(self.count):
+            self.sync += [
+                If(self.clear_counters,
+                    count.eq(0),
+                ).Elif(fault[n] & ~prev_fault[n] & (count != 2**counter_resolution - 1),
+                    count.eq(count + 1),
+                ),
+            ]
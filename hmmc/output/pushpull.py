@@ -1,5 +1,6 @@
 from migen import Module, Signal, If
-from hmmc.output.pwm import Pwm
+from hmmc.output.pwm import PwmBank
+from hmmc.math.slewrate import SlewRateLimiter
 
 
 class PushPull(Module):
@@ -10,6 +11,8 @@ class PushPull(Module):
 
     :inputs:
       - **duty_cycle** (*Signal()*): duty cycle. Set to 0 to (period-1)
+      - **kill** (*Signal()*): forces both outputs to '0' combinationally, typically from
+        :class:`hmmc.output.fault.FaultManager`
 
     :outputs:
       - **out_l** (*Signal()*): pwm output phase
@@ -24,28 +27,32 @@ class PushPull(Module):
 
         # inputs
         self.duty_cycle = Signal(max=period)
+        self.kill = Signal()
 
         # # #
 
-        pwm_l = Pwm(self.duty_cycle.nbits)
-        pwm_h = Pwm(self.duty_cycle.nbits, phase=period)
-        self.submodules += pwm_l, pwm_h
+        # both phases share the same counter, the high side is shifted by half a cycle
+        self.submodules.pwm = pwm = PwmBank(2, self.duty_cycle.nbits, phase_offsets=True)
         self.comb += [
-            pwm_l.center_mode.eq(1),
-            pwm_h.center_mode.eq(1),
-            pwm_l.period.eq(period),
-            pwm_h.period.eq(period),
-            pwm_l.duty_cycle.eq(self.duty_cycle),
-            pwm_h.duty_cycle.eq(self.duty_cycle),
-            self.out_l.eq(pwm_l.output),
-            self.out_h.eq(pwm_h.output),
-            self.cycle_update.eq(pwm_l.cycle_update),
+            pwm.center_mode.eq(1),
+            pwm.period.eq(period),
+            pwm.phase[1].eq(period),
+            pwm.kill.eq(self.kill),
+            pwm.duty_cycle[0].eq(self.duty_cycle),
+            pwm.duty_cycle[1].eq(self.duty_cycle),
+            self.out_l.eq(pwm.output[0]),
+            self.out_h.eq(pwm.output[1]),
+            self.cycle_update.eq(pwm.cycle_update[0]),
         ]
 
 
 class SoftStart(Module):
     """Gradually update a PWM generator duty cycle
 
+    A :class:`hmmc.math.slewrate.SlewRateLimiter` with steps of 1, updated every (1 + predivisor)
+    PWM cycles. Use the :class:`hmmc.math.slewrate.SlewRateLimiter` directly for larger steps,
+    different rise and fall rates, or other setpoints.
+
     :param predivisor: change the duty cycle at the maximum every (1 + predivisor) PWM cycles
     :type predivisor: int
     :param max_duty_cycle: Maximum duty cycle the module can handle
@@ -75,20 +82,20 @@ class SoftStart(Module):
         # # #
 
         prediv_cnt = Signal(max=predivisor, reset=predivisor - 1)
+        nbits = len(self.duty_cycle_setpoint)
+        self.submodules.limiter = limiter = SlewRateLimiter(nbits, radix_nbits=0)
 
         self.comb += [
-            self.done.eq(self.duty_cycle_setpoint == self.duty_cycle_output),
+            limiter.setpoint.eq(self.duty_cycle_setpoint),
+            limiter.update.eq(self.cycle_update & (prediv_cnt == 0)),
+            self.duty_cycle_output.eq(limiter.output),
+            self.done.eq(limiter.done),
         ]
 
         self.sync += [
             If(self.cycle_update,
                 If(prediv_cnt == 0,
                     prediv_cnt.eq(prediv_cnt.reset),
-                    If(self.duty_cycle_output > self.duty_cycle_setpoint,
-                        self.duty_cycle_output.eq(self.duty_cycle_output - 1),
-                    ).Elif(self.duty_cycle_output < self.duty_cycle_setpoint,
-                        self.duty_cycle_output.eq(self.duty_cycle_output + 1),
-                    ),
                 ).Else(
                     prediv_cnt.eq(prediv_cnt - 1),
                 ),
@@ -1,6 +1,8 @@
-from migen import Module, Signal, If, NextState, NextValue, FSM
+from migen import Module, Signal, If, NextState, NextValue, FSM, CEInserter, Mux, Cat, Array, \
+    Replicate
 from migen.genlib.misc import WaitTimer as MigenWaitTimer
 from migen.fhdl.structure import _Value
+from hmmc.output.deltasigma import DeltaSigma
 
 
 class WaitTimer(Module):
@@ -35,6 +37,8 @@ class DeadTimeComplementary(Module):
         - **in_l** ( :class:`migen.fhdl.structure.Signal` ): controls `out_l`
         - **deadtime** ( :class:`migen.fhdl.structure.Signal` (resolution)): deadtime duration is
           'deadtime' + 1 clk cycle.
+        - **kill** ( :class:`migen.fhdl.structure.Signal` ): forces both outputs to '0'
+          combinationally, typically from :class:`hmmc.output.fault.FaultManager`
 
     :outputs:
         - **out_h** ( :class:`migen.fhdl.structure.Signal` ): is '1' if `in_h & ~in_l` and deadtime
@@ -46,9 +50,19 @@ class DeadTimeComplementary(Module):
         self.in_h = Signal()
         self.in_l = Signal()
         self.deadtime = Signal(resolution, reset=default_deadtime)
+        self.kill = Signal()
         self.out_h = Signal()
         self.out_l = Signal()
 
+        # # #
+
+        out_h = Signal()
+        out_l = Signal()
+        self.comb += [
+            self.out_h.eq(out_h & ~self.kill),
+            self.out_l.eq(out_l & ~self.kill),
+        ]
+
         self.submodules.wait = wait = WaitTimer(self.deadtime)
         self.submodules.fsm = fsm = FSM("HIZ")
         fsm.act("HIZ",
@@ -64,13 +78,13 @@ class DeadTimeComplementary(Module):
             ),
         )
         fsm.act("HI",
-            self.out_h.eq(1),
+            out_h.eq(1),
             If(~(self.in_h & ~self.in_l),
                 NextState("HIZ"),
             ),
         )
         fsm.act("LO",
-            self.out_l.eq(1),
+            out_l.eq(1),
             If(~(~self.in_h & self.in_l),
                 NextState("HIZ"),
             ),
@@ -90,6 +104,8 @@ class DeadTime(Module):
         - **input** ( :class:`migen.fhdl.structure.Signal` ): typically from Pwm().output
         - **deadtime** ( :class:`migen.fhdl.structure.Signal` (resolution)): deadtime duration is
           'deadtime' + 1 clk cycle.
+        - **kill** ( :class:`migen.fhdl.structure.Signal` ): forces both outputs to '0'
+          combinationally, typically from :class:`hmmc.output.fault.FaultManager`
 
     :outputs:
         - **out_h** ( :class:`migen.fhdl.structure.Signal` ): is '1' when input == '1' and deadtime
@@ -100,6 +116,7 @@ class DeadTime(Module):
     def __init__(self, resolution: int, default_deadtime=0):
         self.input = Signal()
         self.deadtime = Signal(resolution)
+        self.kill = Signal()
         self.out_h = Signal()
         self.out_l = Signal()
 
@@ -109,8 +126,8 @@ class DeadTime(Module):
         cnt = Signal(resolution, reset=2**resolution - 1)
 
         self.comb += [
-            self.out_h.eq((prev_in == self.input) & (cnt == 0) & self.input),
-            self.out_l.eq((prev_in == self.input) & (cnt == 0) & (~self.input)),
+            self.out_h.eq((prev_in == self.input) & (cnt == 0) & self.input & ~self.kill),
+            self.out_l.eq((prev_in == self.input) & (cnt == 0) & (~self.input) & ~self.kill),
         ]
 
         self.sync += [
@@ -209,16 +226,40 @@ class BootstrapRefresh(Module):
     Recharging the bootstrap capacitor regularly is necessary to avoid this.
     This module ensures that the bottom FET is driven ON regularly, regardless of the complementary
     inputs.
+
+    :param min_pulse: minimum duration of the output states, in clk cycles
+    :type min_pulse: int
+    :param refresh_period: maximum time without `out_l` set, in clk cycles
+    :type refresh_period: int
+
+    :inputs:
+        - **in_l** ( :class:`migen.fhdl.structure.Signal` ): low side command
+        - **in_h** ( :class:`migen.fhdl.structure.Signal` ): high side command
+        - **kill** ( :class:`migen.fhdl.structure.Signal` ): forces both outputs to '0'
+          combinationally, typically from :class:`hmmc.output.fault.FaultManager`. The bootstrap
+          is refreshed when `kill` is released
+
+    :outputs:
+        - **out_l** ( :class:`migen.fhdl.structure.Signal` ): low side output
+        - **out_h** ( :class:`migen.fhdl.structure.Signal` ): high side output
     """
     def __init__(self, min_pulse: int, refresh_period: int):
         assert refresh_period > min_pulse
         self.in_l = Signal()
         self.in_h = Signal()
+        self.kill = Signal()
         self.out_l = Signal()
         self.out_h = Signal()
 
         # # #
 
+        out_l = Signal()
+        out_h = Signal()
+        self.comb += [
+            self.out_l.eq(out_l & ~self.kill),
+            self.out_h.eq(out_h & ~self.kill),
+        ]
+
         cnt_l = Signal(max=refresh_period, reset=refresh_period - 1)
         cnt_min = Signal(max=min_pulse, reset=min_pulse - 1)
 
@@ -231,7 +272,9 @@ class BootstrapRefresh(Module):
         ]
         self.submodules.fsm = fsm = FSM(reset_state="Z")
         fsm.act("Z",
-            If(wait_refresh.done,
+            If(self.kill,
+                # stay off, the bootstrap is refreshed when kill is released
+            ).Elif(wait_refresh.done,
                 NextState("L"),
                 wait_min.wait.eq(0),  # refresh min wait timer
             ).Else(
@@ -245,8 +288,10 @@ class BootstrapRefresh(Module):
             ),
         )
         fsm.act("L",
-            self.out_l.eq(1),
-            If(wait_min.done,
+            out_l.eq(1),
+            If(self.kill,
+                NextState("Z"),
+            ).Elif(wait_min.done,
                 If(~self.in_l & self.in_h,
                     NextState("H"),
                     wait_min.wait.eq(0),  # refresh min wait timer
@@ -256,8 +301,10 @@ class BootstrapRefresh(Module):
             ),
         )
         fsm.act("H",
-            self.out_h.eq(1),
-            If(wait_min.done,
+            out_h.eq(1),
+            If(self.kill,
+                NextState("Z"),
+            ).Elif(wait_min.done,
                 If(wait_refresh.done | (self.in_l & ~self.in_h),
                     NextState("L"),
                     wait_min.wait.eq(0),  # refresh min wait timer
@@ -268,11 +315,129 @@ class BootstrapRefresh(Module):
         )
 
 
+class PwmCounter(Module):
+    """PWM counter
+
+    Counts from 0 to `period`, then restarts from 0 (edge-aligned mode) or counts back down to 0
+    (center-aligned mode). Used by :class:`Pwm` and :class:`PwmBank`.
+
+    With `shadow`, `period` and `center_mode` are shadow registers: they are copied to the active
+    registers at the start of the next cycle (counter at 0) after a `load` request. Several counters
+    sharing the same `load` signal are updated during the same PWM cycle.
+
+    Trigger outputs are set when the counter reaches programmable values, for instance to start ADC
+    conversions or position captures at a defined point of the PWM cycle.
+
+    :param resolution: size of the counter in bits
+    :type resolution: int
+    :param phase: counter value at reset
+    :type phase: int
+    :param shadow: if True, `period` and `center_mode` are applied on `load`
+    :type shadow: bool
+    :param n_triggers: number of programmable triggers
+    :type n_triggers: int
+
+    :inputs:
+        - **period** ( :class:`migen.fhdl.structure.Signal` (resolution))): maximum counter value
+        - **center_mode** ( :class:`migen.fhdl.structure.Signal` ): if '1', the counter will count
+          up and down
+        - **load** ( :class:`migen.fhdl.structure.Signal` ): request to load the shadow registers
+          at the start of the next cycle. Only if shadow is True
+        - **trigger_compare** (*list(Signal(resolution))*) - counter values of the triggers
+        - **trigger_edges** (*list(Signal(2))*) - trigger when the counter is incrementing (bit 0)
+          and/or decrementing (bit 1). Both at reset. In edge-aligned mode, the counter is always
+          incrementing
+
+    :outputs:
+        - **count** ( :class:`migen.fhdl.structure.Signal` (resolution))): counter value
+        - **up_cnt** ( :class:`migen.fhdl.structure.Signal` ): in center mode, '1' when the counter
+          is incrementing
+        - **active_period** ( :class:`migen.fhdl.structure.Signal` (resolution))): period in use
+        - **active_center_mode** ( :class:`migen.fhdl.structure.Signal` ): center mode in use
+        - **loading** ( :class:`migen.fhdl.structure.Signal` ): '1' for 1 clk tick when the shadow
+          registers are loaded. Only if shadow is True
+        - **top** ( :class:`migen.fhdl.structure.Signal` ): '1' for 1 clk tick when the counter is
+          at `period`
+        - **bottom** ( :class:`migen.fhdl.structure.Signal` ): '1' for 1 clk tick when the counter
+          is at 0
+        - **trigger** (*list(Signal())*) - '1' for 1 clk tick when the counter reaches
+          `trigger_compare`
+    """
+    def __init__(self, resolution: int, phase=0, shadow=False, n_triggers=0):
+        self.period = Signal(resolution)
+        self.center_mode = Signal()
+        self.trigger_compare = [Signal(resolution) for _ in range(n_triggers)]
+        self.trigger_edges = [Signal(2, reset=0b11) for _ in range(n_triggers)]
+
+        self.count = cnt = Signal(resolution, reset=phase)
+        self.up_cnt = Signal(reset=1)
+        self.top = Signal()
+        self.bottom = Signal()
+        self.trigger = [Signal() for _ in range(n_triggers)]
+
+        # # #
+
+        if shadow:
+            self.load = Signal()
+            self.loading = Signal()
+            self.active_period = Signal(resolution)
+            self.active_center_mode = Signal()
+            load_pending = Signal()
+            self.comb += self.loading.eq((load_pending | self.load) & (cnt == 0))
+            self.sync += [
+                If(self.loading,
+                    self.active_period.eq(self.period),
+                    self.active_center_mode.eq(self.center_mode),
+                    load_pending.eq(0),
+                ).Elif(self.load,
+                    load_pending.eq(1),
+                ),
+            ]
+        else:
+            self.active_period = self.period
+            self.active_center_mode = self.center_mode
+        period = self.active_period
+        center_mode = self.active_center_mode
+
+        self.sync += [
+            If(self.up_cnt,
+                # incrementing counter
+                If(cnt == period,
+                    If(center_mode,
+                        self.up_cnt.eq(0),
+                        cnt.eq(cnt - 1)
+                    ).Else(
+                        cnt.eq(0),
+                    )
+                ).Else(cnt.eq(cnt + 1)),
+            ).Else(
+                # decrementing counter
+                If(cnt == 0,
+                    cnt.eq(1),
+                    self.up_cnt.eq(1),
+                ).Else(cnt.eq(cnt - 1))
+            ),
+        ]
+
+        self.comb += [
+            self.top.eq(cnt == period),
+            self.bottom.eq(cnt == 0),
+        ]
+        for compare, edges, trigger in zip(self.trigger_compare, self.trigger_edges,
+                                           self.trigger):
+            self.comb += trigger.eq((cnt == compare)
+                & ((self.up_cnt & edges[0]) | (~self.up_cnt & edges[1])))
+
+
 class Pwm(Module):
     """Pulse-Width Modulator.
 
     Generates a rectangular wave of fixed period. '1'/'0' output ratio = duty_cycle/period
 
+    With `shadow`, `period`, `duty_cycle` and `center_mode` are all applied together at the start of
+    the next cycle after a `load` request. Connecting the same `load` signal to several Pwm
+    updates all of them atomically, for instance all the phases of a bridge.
+
     :param resolution: size of the counter in bits
     :type resolution: int
     :param sync_update: update the duty cycles once per cycle. Avoid multiple transitions during a
@@ -281,6 +446,10 @@ class Pwm(Module):
     :param phase: the pwm output can be delayed by `phase` clk cycles. This is useful to stagger
                   multiple Pwm outputs and reduce EMIs
     :type phase: int
+    :param shadow: if True, the settings are applied on `load`, see :class:`PwmCounter`
+    :type shadow: bool
+    :param n_triggers: number of programmable triggers, see :class:`PwmCounter`
+    :type n_triggers: int
 
     :inputs:
         - **period** ( :class:`migen.fhdl.structure.Signal` (resolution))): length of the entire PWM
@@ -290,6 +459,12 @@ class Pwm(Module):
           at 0 all the time.
         - **center_mode** ( :class:`migen.fhdl.structure.Signal` ): if '1', the PWM counter will
           count up and down
+        - **load** ( :class:`migen.fhdl.structure.Signal` ): load the settings at the start of the
+          next cycle. Only if shadow is True
+        - **trigger_compare** (*list(Signal(resolution))*) - see :class:`PwmCounter`
+        - **trigger_edges** (*list(Signal(2))*) - see :class:`PwmCounter`
+        - **kill** ( :class:`migen.fhdl.structure.Signal` ): forces `output` to '0'
+          combinationally, typically from :class:`hmmc.output.fault.FaultManager`
 
     :outputs:
         - **output** ( :class:`migen.fhdl.structure.Signal` ): PWM output
@@ -297,21 +472,35 @@ class Pwm(Module):
           is incrementing
         - **cycle_update** ( :class:`migen.fhdl.structure.Signal` ): '1' for 1 clk tick, once per
           PWM period
+        - **top** ( :class:`migen.fhdl.structure.Signal` ): see :class:`PwmCounter`
+        - **bottom** ( :class:`migen.fhdl.structure.Signal` ): see :class:`PwmCounter`
+        - **trigger** (*list(Signal())*) - see :class:`PwmCounter`
     """
-    def __init__(self, resolution: int, sync_update=False, phase=0):
-        self.period = Signal(resolution)
+    def __init__(self, resolution: int, sync_update=False, phase=0, shadow=False, n_triggers=0):
+        self.submodules.counter = counter = PwmCounter(resolution, phase, shadow, n_triggers)
+        self.period = counter.period
         self.duty_cycle = Signal(resolution)
-        self.center_mode = Signal()
+        self.center_mode = counter.center_mode
+        self.trigger_compare = counter.trigger_compare
+        self.trigger_edges = counter.trigger_edges
+        self.kill = Signal()
 
         self.output = Signal()
-        self.up_cnt = Signal(reset=1)
+        self.up_cnt = counter.up_cnt
         self.cycle_update = Signal()
+        self.top = counter.top
+        self.bottom = counter.bottom
+        self.trigger = counter.trigger
 
         # # #
 
-        cnt = Signal(resolution, reset=phase)  # internal counter
+        cnt = counter.count  # internal counter
 
-        if sync_update:
+        if shadow:
+            self.load = counter.load
+            duty_cycle = Signal(resolution)
+            self.sync += If(counter.loading, duty_cycle.eq(self.duty_cycle))
+        elif sync_update:
             # update the duty cycle once per cycle
             dc = self.duty_cycle
             duty_cycle = Signal(resolution)
@@ -321,26 +510,245 @@ class Pwm(Module):
 
         self.comb += [
             # Cycle sync pulse
-            self.cycle_update.eq((cnt == 0) | (self.center_mode & (cnt == duty_cycle))),
-            self.output.eq(duty_cycle > cnt),
+            self.cycle_update.eq((cnt == 0)
+                | (counter.active_center_mode & (cnt == duty_cycle))),
+            self.output.eq((duty_cycle > cnt) & ~self.kill),
         ]
 
-        self.sync += [
-            If(self.up_cnt,
-                # incrementing counter
-                If(cnt == self.period,
-                    If(self.center_mode,
-                        self.up_cnt.eq(0),
-                        cnt.eq(cnt - 1)
+
+class PwmBank(Module):
+    """Multiple Pulse-Width Modulators sharing a single counter
+
+    All the channels compare their duty cycle to the same :class:`PwmCounter`, so they are
+    perfectly aligned, and only one counter is needed for a whole bridge. Each channel behaves like
+    a :class:`Pwm` with the same `period` and `center_mode`.
+
+    With `phase_offsets`, each channel can be shifted within the PWM cycle by its own `phase`, for
+    interleaved multiphase converters. The phase is expressed in clock cycles within the PWM
+    cycle, which lasts `period` + 1 clock cycles in edge-aligned mode, and 2 * `period` in
+    center-aligned mode. For instance, `phase` = `period` gives 2 center-aligned channels in
+    opposition.
+
+    :param n_channels: number of PWM outputs
+    :type n_channels: int
+    :param resolution: size of the counter in bits
+    :type resolution: int
+    :param sync_update: update the duty cycles once per cycle, see :class:`Pwm`
+    :type sync_update: bool
+    :param phase_offsets: if True, add a `phase` input per channel
+    :type phase_offsets: bool
+    :param shadow: if True, all the settings are applied on `load`, see :class:`PwmCounter`
+    :type shadow: bool
+    :param n_triggers: number of programmable triggers, see :class:`PwmCounter`
+    :type n_triggers: int
+
+    :inputs:
+        - **period** ( :class:`migen.fhdl.structure.Signal` (resolution))): length of the entire PWM
+          cycle
+        - **center_mode** ( :class:`migen.fhdl.structure.Signal` ): if '1', the PWM counter will
+          count up and down
+        - **duty_cycle** (*list(Signal(resolution))*) - duty cycles, see :class:`Pwm`
+        - **phase** (*list(Signal(resolution + 1))*) - phase offsets, in clock cycles. Must be lower
+          than the PWM cycle length. Only if phase_offsets is True
+        - **load** ( :class:`migen.fhdl.structure.Signal` ): load the settings of all the channels
+          at the start of the next cycle. Only if shadow is True
+        - **trigger_compare** (*list(Signal(resolution))*) - see :class:`PwmCounter`
+        - **trigger_edges** (*list(Signal(2))*) - see :class:`PwmCounter`
+        - **kill** ( :class:`migen.fhdl.structure.Signal` ): forces all the outputs to '0'
+          combinationally, see :class:`Pwm`
+
+    :outputs:
+        - **output** (*list(Signal())*) - PWM outputs
+        - **cycle_update** (*list(Signal())*) - '1' for 1 clk tick, once per PWM period of each
+          channel, see :class:`Pwm`
+        - **up_cnt** ( :class:`migen.fhdl.structure.Signal` ): in center mode, '1' when the shared
+          counter is incrementing
+        - **top** ( :class:`migen.fhdl.structure.Signal` ): see :class:`PwmCounter`
+        - **bottom** ( :class:`migen.fhdl.structure.Signal` ): see :class:`PwmCounter`
+        - **trigger** (*list(Signal())*) - see :class:`PwmCounter`
+    """
+    def __init__(self, n_channels: int, resolution: int, sync_update=False, phase_offsets=False,
+                 shadow=False, n_triggers=0):
+        self.submodules.counter = counter = PwmCounter(resolution, shadow=shadow,
+            n_triggers=n_triggers)
+        self.period = counter.period
+        self.center_mode = counter.center_mode
+        self.duty_cycle = [Signal(resolution) for _ in range(n_channels)]
+        self.trigger_compare = counter.trigger_compare
+        self.trigger_edges = counter.trigger_edges
+        self.kill = Signal()
+
+        self.output = [Signal() for _ in range(n_channels)]
+        self.cycle_update = [Signal() for _ in range(n_channels)]
+        self.up_cnt = counter.up_cnt
+        self.top = counter.top
+        self.bottom = counter.bottom
+        self.trigger = counter.trigger
+
+        # # #
+
+        period = counter.active_period
+        center_mode = counter.active_center_mode
+        if shadow:
+            self.load = counter.load
+
+        if phase_offsets:
+            self.phase = [Signal(resolution + 1) for _ in range(n_channels)]
+            # position in the PWM cycle: the counter unfolded in center mode
+            position = Signal(resolution + 1)
+            cycle_length = Signal(resolution + 1)
+            self.comb += [
+                If(center_mode,
+                    cycle_length.eq(period << 1),
+                    If(self.up_cnt | (counter.count == 0),
+                        position.eq(counter.count),
                     ).Else(
-                        cnt.eq(0),
-                    )
-                ).Else(cnt.eq(cnt + 1)),
-            ).Else(
-                # decrementing counter
-                If(cnt == 0,
-                    cnt.eq(1),
-                    self.up_cnt.eq(1),
-                ).Else(cnt.eq(cnt - 1))
-            ),
+                        position.eq((period << 1) - counter.count),
+                    ),
+                ).Else(
+                    cycle_length.eq(period + 1),
+                    position.eq(counter.count),
+                ),
+            ]
+
+        for n in range(n_channels):
+            if phase_offsets:
+                # shifted position, folded back into a counter value
+                shifted = Signal(resolution + 2)
+                wrapped = Signal(resolution + 1)
+                cnt = Signal(resolution)
+                if shadow:
+                    phase = Signal(resolution + 1)
+                    self.sync += If(counter.loading, phase.eq(self.phase[n]))
+                else:
+                    phase = self.phase[n]
+                self.comb += [
+                    shifted.eq(position + phase),
+                    If(shifted >= cycle_length,
+                        wrapped.eq(shifted - cycle_length),
+                    ).Else(
+                        wrapped.eq(shifted),
+                    ),
+                    If(center_mode & (wrapped > period),
+                        cnt.eq(cycle_length - wrapped),
+                    ).Else(
+                        cnt.eq(wrapped),
+                    ),
+                ]
+            else:
+                cnt = counter.count
+
+            if shadow:
+                duty_cycle = Signal(resolution)
+                self.sync += If(counter.loading, duty_cycle.eq(self.duty_cycle[n]))
+            elif sync_update:
+                duty_cycle = Signal(resolution)
+                self.sync += If(self.cycle_update[n], duty_cycle.eq(self.duty_cycle[n]))
+            else:
+                duty_cycle = self.duty_cycle[n]
+
+            self.comb += [
+                self.cycle_update[n].eq((cnt == 0) | (center_mode & (cnt == duty_cycle))),
+                self.output[n].eq((duty_cycle > cnt) & ~self.kill),
+            ]
+
+
+class PwmHighRes(Module):
+    """Pulse-Width Modulator with a resolution finer than the clock period
+
+    `duty_cycle` has `extra_bits` more bits than the counter. These extra LSBs are rendered in one
+    of two ways:
+
+    - dithering (default): the extra LSBs are fed to a :class:`hmmc.output.deltasigma.DeltaSigma`
+      modulator, clocked once per PWM cycle, which adds 1 to the integer duty cycle of some
+      cycles. The average duty cycle over 2**extra_bits cycles has the full resolution, at the cost
+      of a 1 clock cycle jitter of the pulse width. No special hardware is needed
+    - serializer (`serializer=True`): each clock cycle is divided in 2**extra_bits time slots, and
+      `output` is a 2**extra_bits bits word to be sent by a serializer (DDR output for
+      `extra_bits` = 1, OSERDES...) clocked 2**extra_bits times faster. Every PWM cycle has the full
+      resolution, without jitter
+
+    The duty cycle is always updated at the start of a PWM cycle, when the counter is 0.
+
+    :param resolution: size of the counter in bits
+    :type resolution: int
+    :param extra_bits: number of extra LSBs of the duty cycle
+    :type extra_bits: int
+    :param serializer: if True, output a word per clock cycle for a serializer
+    :type serializer: bool
+
+    :inputs:
+        - **period** ( :class:`migen.fhdl.structure.Signal` (resolution))): length of the entire PWM
+          cycle, in clock cycles
+        - **duty_cycle** ( :class:`migen.fhdl.structure.Signal` (resolution + extra_bits))): length
+          of the '1' output state, in 2**-extra_bits clock cycles
+        - **center_mode** ( :class:`migen.fhdl.structure.Signal` ): if '1', the PWM counter will
+          count up and down
+        - **kill** ( :class:`migen.fhdl.structure.Signal` ): forces `output` to '0'
+          combinationally, typically from :class:`hmmc.output.fault.FaultManager`
+
+    :outputs:
+        - **output** ( :class:`migen.fhdl.structure.Signal` (1 or 2**extra_bits)): PWM output. In
+          serializer mode, `output[0]` is the first time slot
+        - **up_cnt** ( :class:`migen.fhdl.structure.Signal` ): in center mode, '1' when the counter
+          is incrementing
+        - **cycle_update** ( :class:`migen.fhdl.structure.Signal` ): '1' for 1 clk tick, once per
+          PWM period, when the duty cycle is updated
+    """
+    def __init__(self, resolution: int, extra_bits: int, serializer=False):
+        self.submodules.counter = counter = PwmCounter(resolution)
+        self.period = counter.period
+        self.duty_cycle = Signal(resolution + extra_bits)
+        self.center_mode = counter.center_mode
+        self.kill = Signal()
+
+        ratio = 2**extra_bits
+        self.output = Signal(ratio if serializer else 1)
+        self.up_cnt = counter.up_cnt
+        self.cycle_update = Signal()
+
+        # # #
+
+        cnt = counter.count
+        duty_int = Signal(resolution + 1)  # duty cycle of the current PWM cycle
+        duty_int_next = Signal(resolution + 1)
+        duty_int_latched = Signal(resolution + 1)
+        self.comb += [
+            self.cycle_update.eq(cnt == 0),
+            duty_int.eq(Mux(self.cycle_update, duty_int_next, duty_int_latched)),
         ]
+        self.sync += If(self.cycle_update, duty_int_latched.eq(duty_int_next))
+
+        if serializer:
+            duty_frac = Signal(extra_bits)
+            duty_frac_latched = Signal(extra_bits)
+            self.comb += [
+                duty_int_next.eq(self.duty_cycle[extra_bits:]),
+                duty_frac.eq(Mux(self.cycle_update, self.duty_cycle[:extra_bits],
+                    duty_frac_latched)),
+            ]
+            self.sync += If(self.cycle_update, duty_frac_latched.eq(self.duty_cycle[:extra_bits]))
+            # time slots of the clock cycle where the output switches
+            first_slots = Signal(ratio)
+            last_slots = Signal(ratio)
+            self.comb += [
+                first_slots.eq(Array([2**n - 1 for n in range(ratio)])[duty_frac]),
+                last_slots.eq(Cat(*reversed([first_slots[i] for i in range(ratio)]))),
+                If(duty_int > cnt,
+                    self.output.eq(Replicate(~self.kill, ratio)),
+                ).Elif(duty_int == cnt,
+                    # the pulse ends during this clock cycle, or starts if the counter decrements
+                    self.output.eq(Mux(self.up_cnt, first_slots, last_slots)
+                        & Replicate(~self.kill, ratio)),
+                ).Else(
+                    self.output.eq(0),
+                ),
+            ]
+        else:
+            self.submodules.dither = dither = CEInserter()(DeltaSigma(extra_bits))
+            self.comb += [
+                dither.ce.eq(self.cycle_update),
+                dither.input.eq(self.duty_cycle[:extra_bits]),
+                duty_int_next.eq(self.duty_cycle[extra_bits:] + dither.output),
+                self.output.eq((duty_int > cnt) & ~self.kill),
+            ]
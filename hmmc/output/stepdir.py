@@ -1,27 +1,118 @@
-from migen import Module, Signal, If, NextState, NextValue, FSM, Case, Cat
+from migen import Module, Signal, If, NextState, NextValue, FSM, Case, Cat, Array, Memory
 from migen.fhdl.bitcontainer import bits_for
 
 
+class PendingSteps(Module):
+    """Signed counter of the steps waiting to be output
+
+    Requests opposite to the pending steps cancel them. A request which would exceed `depth` is
+    lost: `overflow` is set and `lost_count` is incremented, until `lost_clear`.
+
+    :param depth: maximum number of pending steps
+    :type depth: int
+    :param lost_resolution: resolution in bits of the lost steps counter
+    :type lost_resolution: int
+
+    :inputs:
+        - **up** (*Signal()*) - when '1', add a step up
+        - **down** (*Signal()*) - when '1', add a step down
+        - **consume** (*Signal()*) - when '1', the first pending step is output and removed
+        - **lost_clear** (*Signal()*) - when '1', reset `overflow` and `lost_count`
+    :outputs:
+        - **pending** (*Signal(min=-depth, max=depth + 1)*) - pending steps, positive when up
+        - **overflow** (*Signal()*) - sticky, '1' when a step has been lost
+        - **lost_count** (*Signal(lost_resolution)*) - saturating count of the lost steps
+    """
+    def __init__(self, depth=8, lost_resolution=16):
+        # inputs
+        self.up = Signal()
+        self.down = Signal()
+        self.consume = Signal()
+        self.lost_clear = Signal()
+
+        # outputs
+        self.pending = Signal(min=-depth, max=depth + 1)
+        self.overflow = Signal()
+        self.lost_count = Signal(lost_resolution)
+
+        # # #
+
+        pending_next = Signal(min=-depth - 2, max=depth + 3)
+        lost_count_next = Signal(lost_resolution + 1)
+        lost = Signal()
+        self.comb += [
+            pending_next.eq(self.pending + (self.up & ~self.down) - (self.down & ~self.up)
+                - (self.consume & (self.pending > 0)) + (self.consume & (self.pending < 0))),
+            lost.eq((pending_next > depth) | (pending_next < -depth)),
+            lost_count_next.eq(self.lost_count + 1),
+        ]
+        self.sync += [
+            If(pending_next > depth,
+                self.pending.eq(depth),
+            ).Elif(pending_next < -depth,
+                self.pending.eq(-depth),
+            ).Else(
+                self.pending.eq(pending_next),
+            ),
+            If(self.lost_clear,
+                self.overflow.eq(0),
+                self.lost_count.eq(0),
+            ).Elif(lost,
+                self.overflow.eq(1),
+                If(~lost_count_next[-1],  # saturate
+                    self.lost_count.eq(lost_count_next),
+                ),
+            ),
+        ]
+
+
 class Quadrature(Module):
     """transforms up/down signals into Quadrature outputs
 
+    Without `edge_spacing`, each `up` or `down` changes the outputs immediately.
+
+    With `edge_spacing`, the requests are queued in a :class:`PendingSteps` backlog, and output at
+    most one edge every `edge_spacing` clock ticks, the maximum count frequency of the receiver.
+    Bursts of requests are absorbed by the backlog, up to `depth` counts. A request which would
+    exceed `depth` is lost: `overflow` is set and `lost_count` is incremented, until `lost_clear`.
+
     .. note::
 
-        There is no timing check. Normally, if up and down are followed closely, if ever a short
-        pulse isn't registered by the receiver, the position should remain unchanged. However, there
-        is an extra sensitivity to noise because of that.
+        Without `edge_spacing`, there is no timing check. Normally, if up and down are followed
+        closely, if ever a short pulse isn't registered by the receiver, the position should remain
+        unchanged. However, there is an extra sensitivity to noise because of that.
         Also, if multiple up or down are too close to each other, the output will change too quickly
         for the receiver to register them properly.
 
+    :param edge_spacing: if not None, minimum duration, in clock ticks, between two edges. 0 behaves
+                         as 1
+    :type edge_spacing: int
+    :param depth: maximum number of pending counts. Only if edge_spacing is not None
+    :type depth: int
+    :param lost_resolution: resolution in bits of the lost counts counter. Only if edge_spacing is
+                            not None
+    :type lost_resolution: int
+
     :inputs:
-        - **up** (*Signal()*) - when '1', generate a pulse on `.step` with `.dir` == '1'
-        - **down** (*Signal()*) - when '1', generate a pulse on `.step` with `.dir` == '0'
+        - **up** (*Signal()*) - when '1', count up
+        - **down** (*Signal()*) - when '1', count down
+        - **edge_spacing** (*Signal(bits_for(edge_spacing))*) - initialized at param
+          `edge_spacing` but can be dynamically configured externally. Only if edge_spacing is not
+          None
+        - **lost_clear** (*Signal()*) - when '1', reset `overflow` and `lost_count`. Only if
+          edge_spacing is not None
 
     :outputs:
         - **a** (*Signal()*) - Quadrature output a
         - **b** (*Signal()*) - Quadrature output b
+        - **backlog** (*Signal(min=-depth, max=depth + 1)*) - counts not output yet, positive when
+          up. Only if edge_spacing is not None
+        - **overflow** (*Signal()*) - sticky, '1' when a count has been lost. Only if edge_spacing
+          is not None
+        - **lost_count** (*Signal(lost_resolution)*) - saturating count of the lost counts. Only
+          if edge_spacing is not None
     """
-    def __init__(self):
+    def __init__(self, edge_spacing=None, depth=8, lost_resolution=16):
         # inputs
         self.up = Signal()
         self.down = Signal()
@@ -37,18 +128,47 @@ class Quadrature(Module):
             self.a.eq(quad[0]),
             self.b.eq(quad[1]),
         ]
-        self.sync += Case(Cat(quad, self.down, self.up),
-                    {
-                        # ↑_↓_quad
-                        0b1_0_00: quad.eq(0b01),
-                        0b1_0_01: quad.eq(0b11),
-                        0b1_0_10: quad.eq(0b00),
-                        0b1_0_11: quad.eq(0b10),
-                        0b0_1_00: quad.eq(0b10),
-                        0b0_1_01: quad.eq(0b00),
-                        0b0_1_10: quad.eq(0b11),
-                        0b0_1_11: quad.eq(0b01),
-        })
+        if edge_spacing is not None:
+            self.edge_spacing = Signal(bits_for(edge_spacing), reset=edge_spacing)
+            self.submodules.queue = queue = PendingSteps(depth, lost_resolution)
+            self.lost_clear = queue.lost_clear
+            self.backlog = queue.pending
+            self.overflow = queue.overflow
+            self.lost_count = queue.lost_count
+
+            timer = Signal(len(self.edge_spacing))
+            self.comb += [
+                queue.up.eq(self.up),
+                queue.down.eq(self.down),
+                queue.consume.eq((timer == 0) & (self.backlog != 0)),
+            ]
+            self.sync += [
+                If(timer != 0,
+                    timer.eq(timer - 1),
+                ).Elif(queue.consume,
+                    If(self.edge_spacing != 0,
+                        timer.eq(self.edge_spacing - 1),
+                    ),
+                    If(self.backlog > 0,
+                        quad.eq(Cat(~quad[1], quad[0])),
+                    ).Else(
+                        quad.eq(Cat(quad[1], ~quad[0])),
+                    ),
+                ),
+            ]
+        else:
+            self.sync += Case(Cat(quad, self.down, self.up),
+                        {
+                            # ↑_↓_quad
+                            0b1_0_00: quad.eq(0b01),
+                            0b1_0_01: quad.eq(0b11),
+                            0b1_0_10: quad.eq(0b00),
+                            0b1_0_11: quad.eq(0b10),
+                            0b0_1_00: quad.eq(0b10),
+                            0b0_1_01: quad.eq(0b00),
+                            0b0_1_10: quad.eq(0b11),
+                            0b0_1_11: quad.eq(0b01),
+            })
 
         # self.sync += [
         #     If(self.up & ~self.down,
@@ -78,32 +198,50 @@ class Quadrature(Module):
 class StepDir(Module):
     """transforms up/down signals into Step/Dir outputs
 
-    .. note::
+    Each `up` or `down` request is queued in a signed counter of pending steps, then emitted as a
+    `step` pulse of `pulse_duration` clock ticks followed by at least `pulse_duration` clock ticks
+    low. When the direction changes, `dir` is set `turnaround_duration` clock ticks before the
+    rising edge of `step`. The next pulse starts as soon as the low time of the previous one ends,
+    so the maximum step rate is fclk / (2 * pulse_duration).
 
-        This module will keep timings for up to +3/-4 'in flight' pulses. If the up/down period is
-        lower than period = (3 + pulse_duration * 2 + turnaround_duration), step loss is expected.
-        Make sure the period between 3 consecutive up or 3 consecutive down pulses are >= 3 * period
+    Up to `depth` steps in the same direction can be pending in a :class:`PendingSteps`, which
+    absorbs bursts of requests faster than the maximum step rate. Requests opposite to the pending
+    steps cancel them. A request which would exceed `depth` is lost: `overflow` is set and
+    `lost_count` is incremented, until `lost_clear`.
 
-    :param pulse_duration: duration, in clock ticks, of a STEP pulse
+    :param pulse_duration: duration, in clock ticks, of a STEP pulse, and minimum duration between
+                           STEP pulses. 0 behaves as 1
     :type pulse_duration: int
-    :param turnaround_duration: duration, in clock ticks, between DIR changing and a STEP pulse
+    :param turnaround_duration: duration, in clock ticks, between DIR changing and a STEP pulse.
+                                0 behaves as 1
     :type turnaround_duration: int
+    :param depth: maximum number of pending steps
+    :type depth: int
+    :param lost_resolution: resolution in bits of the lost steps counter
+    :type lost_resolution: int
 
     :inputs:
         - **up** (*Signal()*) - when '1', generate a pulse on `.step` with `.dir` == '1'
         - **down** (*Signal()*) - when '1', generate a pulse on `.step` with `.dir` == '0'
-        - **pulse_duration** (*Signal(ceil(log2(pulse_duration)))*) - initialized at
+        - **pulse_duration** (*Signal(bits_for(pulse_duration))*) - initialized at
           param `pulse_duration` but can be dynamically configured externally.
-        - **turnaround_duration** (*Signal(ceil(log2(turnaround_duration)))*) - initialized at
+        - **turnaround_duration** (*Signal(bits_for(turnaround_duration))*) - initialized at
           param `turnaround_duration` but can be dynamically configured externally.
+        - **lost_clear** (*Signal()*) - when '1', reset `overflow` and `lost_count`
     :outputs:
         - **step** (*Signal()*)
         - **dir** (*Signal()*)
+        - **pending** (*Signal(min=-depth, max=depth + 1)*) - steps not started yet, positive
+          when up
+        - **overflow** (*Signal()*) - sticky, '1' when a step has been lost
+        - **lost_count** (*Signal(lost_resolution)*) - saturating count of the lost steps
     """
-    def __init__(self, pulse_duration, turnaround_duration):
+    def __init__(self, pulse_duration, turnaround_duration, depth=8, lost_resolution=16):
         # inputs
         self.up = Signal()
         self.down = Signal()
+        self.pulse_duration = Signal(bits_for(pulse_duration), reset=pulse_duration)
+        self.turnaround_duration = Signal(bits_for(turnaround_duration), reset=turnaround_duration)
 
         # outputs
         self.step = Signal()
@@ -111,80 +249,250 @@ class StepDir(Module):
 
         # # #
 
-        pulse_count = Signal(bits_for(pulse_duration), reset=pulse_duration)
-        self.pulse_duration = Signal(bits_for(pulse_duration), reset=pulse_duration)
-        pulse_wait = Signal()
-        pulse_done = Signal()
-        self.comb += pulse_done.eq(pulse_count == 0)
-        self.sync += [
-            If(pulse_wait,
-                If(~pulse_done, pulse_count.eq(pulse_count - 1))
-            ).Else(pulse_count.eq(self.pulse_duration)),
+        self.submodules.queue = queue = PendingSteps(depth, lost_resolution)
+        self.lost_clear = queue.lost_clear
+        self.pending = queue.pending
+        self.overflow = queue.overflow
+        self.lost_count = queue.lost_count
+        self.comb += [
+            queue.up.eq(self.up),
+            queue.down.eq(self.down),
         ]
 
-        turnaround_count = Signal(bits_for(turnaround_duration), reset=turnaround_duration)
-        self.turnaround_duration = Signal(bits_for(turnaround_duration), reset=turnaround_duration)
-        turnaround_wait = Signal()
-        turnaround_done = Signal()
-        self.comb += turnaround_done.eq(turnaround_count == 0)
-        self.sync += [
-            If(turnaround_wait,
-                If(~turnaround_done, turnaround_count.eq(turnaround_count - 1))
-            ).Else(turnaround_count.eq(self.turnaround_duration)),
+        # single timer for the high, low and turnaround durations. It is loaded with duration - 1,
+        # so that the next state starts in the same cycle as the timer expires
+        timer = Signal(max(len(self.pulse_duration), len(self.turnaround_duration)))
+        timer_done = Signal()
+        pulse_load = Signal(len(timer))
+        turnaround_load = Signal(len(timer))
+        self.comb += [
+            timer_done.eq(timer == 0),
+            If(self.pulse_duration != 0,
+                pulse_load.eq(self.pulse_duration - 1),
+            ),
+            If(self.turnaround_duration != 0,
+                turnaround_load.eq(self.turnaround_duration - 1),
+            ),
         ]
 
-        pulses = Signal((3, True))  # up to +3/-4 pulses can be in flight
-        step_done = Signal()
-        self.sync += [
-            Case(Cat(step_done, self.dir, self.down, self.up),
-                {
-                    # ↑_↓_dir_step_done
-                    0b0_0_0_1: pulses.eq(pulses + 1),  # neg step done
-                    0b0_0_1_1: pulses.eq(pulses - 1),  # pos step done
-                    0b1_0_0_1: pulses.eq(pulses + 2),  # neg step done, up
-                    0b1_0_1_1: pulses.eq(pulses),  # pos step done, up
-                    0b0_1_0_1: pulses.eq(pulses),  # neg step done, down
-                    0b0_1_1_1: pulses.eq(pulses - 2),  # pos step done, down
-                    0b1_0_0_0: pulses.eq(pulses + 1),  # up
-                    0b0_1_0_0: pulses.eq(pulses - 1),  # down
-                    0b1_0_1_0: pulses.eq(pulses + 1),  # up
-                    0b0_1_1_0: pulses.eq(pulses - 1),  # down
-            }),
+        # pulse generation
+        want = Signal()
+        want_dir = Signal()
+        next_pulse = Signal()  # the previous pulse or turnaround is over
+        start = Signal()  # a pulse starts, and is removed from the pending steps
+        self.comb += [
+            queue.consume.eq(start),
+            want.eq(self.pending != 0),
+            want_dir.eq(self.pending > 0),
+            start.eq(next_pulse & want & (self.dir == want_dir)),
         ]
 
-        self.submodules.fsm = fsm = FSM("IDLE")
-        fsm.act("IDLE",
-            pulse_wait.eq(1),
-            If((pulses < 0) & pulse_done,
-                pulse_wait.eq(0),
-                If(self.dir,
-                    NextValue(self.dir, ~self.dir),
+        def begin():
+            return [
+                If(start,
+                    NextValue(self.step, 1),
+                    NextValue(timer, pulse_load),
+                    NextState("HIGH"),
+                ).Elif(want,
+                    NextValue(self.dir, want_dir),
+                    NextValue(timer, turnaround_load),
                     NextState("TURNAROUND"),
                 ).Else(
-                    NextState("STEP_PULSE"),
-                ),
-            ).Elif((pulses > 0) & pulse_done,
-                pulse_wait.eq(0),
-                If(~self.dir,
-                    NextValue(self.dir, ~self.dir),
-                    NextState("TURNAROUND"),
-                ).Else(
-                    NextState("STEP_PULSE"),
+                    NextState("IDLE"),
                 ),
+            ]
+
+        self.submodules.fsm = fsm = FSM("IDLE")
+        fsm.act("IDLE",
+            next_pulse.eq(1),
+            *begin(),
+        )
+        fsm.act("HIGH",
+            If(~timer_done,
+                NextValue(timer, timer - 1),
+            ).Else(
+                NextValue(self.step, 0),
+                NextValue(timer, pulse_load),
+                NextState("LOW"),
             ),
         )
-        fsm.act("TURNAROUND",
-            turnaround_wait.eq(1),
-            If(turnaround_done,
-                NextState("IDLE"),
-            )
+        fsm.act("LOW",
+            next_pulse.eq(timer_done),
+            If(~timer_done,
+                NextValue(timer, timer - 1),
+            ).Else(
+                *begin(),
+            ),
         )
-        fsm.act("STEP_PULSE",
-            self.step.eq(1),
-            pulse_wait.eq(~pulse_done),
-            If(pulse_done,
-                NextValue(self.step, 0),
-                NextState("IDLE"),
-                step_done.eq(1),
-            )
+        fsm.act("TURNAROUND",
+            next_pulse.eq(timer_done),
+            If(~timer_done,
+                NextValue(timer, timer - 1),
+            ).Else(
+                *begin(),
+            ),
         )
+
+
+class StepDirBank(Module):
+    """Multiple Step/Dir or Quadrature outputs sharing their timing logic
+
+    Behaves like `n_axes` :class:`StepDir`, with a single set of `pulse_duration` and
+    `turnaround_duration` registers. The per-axis timing state is kept in a register file (a
+    :class:`migen.fhdl.specials.Memory`, typically mapped to LUT RAM), and a single engine serves
+    one axis per clock cycle: only the pending steps counters and the outputs are flip-flops.
+
+    Each axis outputs either Step/Dir or, when its `quadrature` input is '1', a Quadrature signal on
+    the same pins: `step` carries A and `dir` carries B, and each step is one quadrature edge, at
+    least `pulse_duration` clock ticks after the previous one.
+
+    .. note::
+
+        As each axis is served every `n_axes` clock ticks, the durations are rounded up to a
+        multiple of `n_axes` clock ticks, and a step starts up to `n_axes` clock ticks after its
+        request.
+
+    :param n_axes: number of axes
+    :type n_axes: int
+    :param pulse_duration: see :class:`StepDir`
+    :type pulse_duration: int
+    :param turnaround_duration: see :class:`StepDir`
+    :type turnaround_duration: int
+    :param depth: maximum number of pending steps per axis
+    :type depth: int
+    :param lost_resolution: resolution in bits of the lost steps counters
+    :type lost_resolution: int
+
+    :inputs:
+        - **up** (*list(Signal())*) - when '1', queue a step up on the axis
+        - **down** (*list(Signal())*) - when '1', queue a step down on the axis
+        - **quadrature** (*list(Signal())*) - when '1', the axis outputs a Quadrature signal
+        - **pulse_duration** (*Signal(bits_for(pulse_duration))*) - shared by all the axes
+        - **turnaround_duration** (*Signal(bits_for(turnaround_duration))*) - shared by all the
+          axes
+        - **lost_clear** (*list(Signal())*) - when '1', reset `overflow` and `lost_count` of the
+          axis
+    :outputs:
+        - **step** (*list(Signal())*) - step, or Quadrature A
+        - **dir** (*list(Signal())*) - dir, or Quadrature B
+        - **pending** (*list(Signal(min=-depth, max=depth + 1))*) - steps not started yet
+        - **overflow** (*list(Signal())*) - sticky, '1' when a step of the axis has been lost
+        - **lost_count** (*list(Signal(lost_resolution))*) - saturating count of the lost steps of
+          the axis
+    """
+    def __init__(self, n_axes, pulse_duration, turnaround_duration, depth=8, lost_resolution=16):
+        # inputs
+        self.up = [Signal() for _ in range(n_axes)]
+        self.down = [Signal() for _ in range(n_axes)]
+        self.quadrature = [Signal() for _ in range(n_axes)]
+        self.pulse_duration = Signal(bits_for(pulse_duration), reset=pulse_duration)
+        self.turnaround_duration = Signal(bits_for(turnaround_duration), reset=turnaround_duration)
+
+        # outputs
+        self.step = [Signal() for _ in range(n_axes)]
+        self.dir = [Signal() for _ in range(n_axes)]
+
+        # # #
+
+        # pending steps
+        queues = [PendingSteps(depth, lost_resolution) for _ in range(n_axes)]
+        self.submodules += queues
+        self.lost_clear = [queue.lost_clear for queue in queues]
+        self.pending = [queue.pending for queue in queues]
+        self.overflow = [queue.overflow for queue in queues]
+        self.lost_count = [queue.lost_count for queue in queues]
+        for n, queue in enumerate(queues):
+            self.comb += [
+                queue.up.eq(self.up[n]),
+                queue.down.eq(self.down[n]),
+            ]
+
+        # shared timebase. A deadline is compared to it by the sign of the difference, so its
+        # range must cover the longest duration, plus the time to come back to the axis
+        duration_bits = max(len(self.pulse_duration), len(self.turnaround_duration))
+        timestamp = Signal(max(duration_bits, bits_for(n_axes)) + 2)
+        self.sync += timestamp.eq(timestamp + 1)
+
+        # register file: state, deadline
+        # state 0: idle, 1: step high, 2: step low, 3: dir turnaround
+        self.specials.regfile = regfile = Memory(2 + len(timestamp), max(n_axes, 2))
+        self.specials.port = port = regfile.get_port(write_capable=True, async_read=True)
+        state = Signal(2)
+        deadline = Signal(len(timestamp))
+        state_next = Signal(2)
+        deadline_next = Signal(len(timestamp))
+
+        # engine: serves one axis per clock cycle
+        sel = Signal(max=max(n_axes, 2))
+        self.sync += If(sel == n_axes - 1, sel.eq(0)).Else(sel.eq(sel + 1))
+
+        pending = Signal(min=-depth, max=depth + 1)
+        quadrature = Signal()
+        step = Signal()
+        direction = Signal()
+        step_next = Signal()
+        dir_next = Signal()
+        remaining = Signal(len(timestamp))
+        expired = Signal()
+        want = Signal()
+        want_dir = Signal()
+        start = Signal()  # the first pending step of the selected axis is started
+        self.comb += [
+            port.adr.eq(sel),
+            Cat(state, deadline).eq(port.dat_r),
+            port.dat_w.eq(Cat(state_next, deadline_next)),
+            port.we.eq(1),
+            pending.eq(Array(self.pending)[sel]),
+            quadrature.eq(Array(self.quadrature)[sel]),
+            step.eq(Array(self.step)[sel]),
+            direction.eq(Array(self.dir)[sel]),
+            remaining.eq(deadline - timestamp),
+            expired.eq((state == 0) | (remaining == 0) | remaining[-1]),
+            want.eq(pending != 0),
+            want_dir.eq(pending > 0),
+
+            state_next.eq(state),
+            deadline_next.eq(deadline),
+            step_next.eq(step),
+            dir_next.eq(direction),
+            If(~expired,
+                # waiting
+            ).Elif(quadrature,
+                If(want,
+                    start.eq(1),
+                    state_next.eq(2),
+                    deadline_next.eq(timestamp + self.pulse_duration),
+                    If(want_dir,
+                        step_next.eq(~direction),
+                        dir_next.eq(step),
+                    ).Else(
+                        step_next.eq(direction),
+                        dir_next.eq(~step),
+                    ),
+                ).Else(
+                    state_next.eq(0),
+                ),
+            ).Elif(state == 1,
+                step_next.eq(0),
+                state_next.eq(2),
+                deadline_next.eq(timestamp + self.pulse_duration),
+            ).Elif(want & (direction == want_dir),
+                start.eq(1),
+                step_next.eq(1),
+                state_next.eq(1),
+                deadline_next.eq(timestamp + self.pulse_duration),
+            ).Elif(want,
+                dir_next.eq(want_dir),
+                state_next.eq(3),
+                deadline_next.eq(timestamp + self.turnaround_duration),
+            ).Else(
+                state_next.eq(0),
+            ),
+        ]
+        self.sync += [
+            Array(self.step)[sel].eq(step_next),
+            Array(self.dir)[sel].eq(dir_next),
+        ]
+
+        for n, queue in enumerate(queues):
+            self.comb += queue.consume.eq(start & (sel == n))
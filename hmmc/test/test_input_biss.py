@@ -0,0 +1,131 @@
+import unittest
+import inspect
+from collections import deque
+from migen import run_simulation, passive
+from hmmc.input.biss import BiSSMaster
+
+
+def biss_crc(bits):
+    crc = 0
+    for bit in bits:
+        feedback = ((crc >> 5) & 1) ^ bit
+        crc = ((crc << 1) & 0x3F) ^ (0x03 if feedback else 0)
+    return crc ^ 0x3F
+
+
+def to_bits(value, n):
+    return [(value >> i) & 1 for i in reversed(range(n))]
+
+
+class TestBiSSMaster(unittest.TestCase):
+    fclk = 50e6
+
+    @passive
+    def encoder(self, dut, positions, delay, ssi=False, gray=False, busy_bits=3,
+                n_error=1, bogus_crc=False):
+        """Encoder model: shifts a bit out on each rising edge of MA.
+
+        The line delay is split evenly between MA and SLO.
+        """
+        ma_line = deque([1] * (delay // 2 + 1))
+        slo_line = deque([1] * (delay - delay // 2 + 1))
+        frame = []
+        ready = True
+        ma_prev = 1
+        high_cnt = 0
+        slo = 1
+        while True:
+            ma_line.append((yield dut.ma))
+            ma = ma_line.popleft()
+            if ma_prev and not ma and ready:
+                ready = False
+                # first falling edge: latch the position
+                position = positions.pop(0) if positions else 0
+                if ssi:
+                    if gray:
+                        position ^= position >> 1
+                    frame = to_bits(position, 24) + [0]
+                else:
+                    data = to_bits(position, 24) + [n_error, 1]
+                    crc = biss_crc(data) ^ (1 if bogus_crc else 0)
+                    frame = [0] + [0] * busy_bits + [1, 0] + data + to_bits(crc, 6) + [0]
+                    slo_pending = True  # the acknowledge is sent on the second rising edge
+            if not ma_prev and ma and frame:
+                if not ssi and slo_pending:
+                    slo_pending = False
+                else:
+                    slo = frame.pop(0)
+            high_cnt = high_cnt + 1 if ma else 0
+            if not ready and not frame and high_cnt > 100:
+                # timeout / monoflop: MA edges are ignored until MA has been high long enough
+                ready = True
+                slo = 1
+            ma_prev = ma
+            slo_line.append(slo)
+            yield dut.slo.eq(slo_line.popleft())
+            yield
+
+    def check(self, dut, positions, count, timeout):
+        self.positions = []
+        self.errors = 0
+        while len(self.positions) + self.errors < count:
+            self.assertGreater(timeout, 0, msg="Timeout waiting for position_valid")
+            timeout -= 1
+            if (yield dut.position_valid):
+                self.positions.append((yield dut.position))
+            if (yield dut.error):
+                self.errors += 1
+            yield
+
+    def test_input_biss(self):
+        for delay in [0, 7, 23]:
+            positions = [0x123456, 0xABCDEF, 0x000001]
+            dut = BiSSMaster(self.fclk, idle_time=1e-6)
+            run_simulation(dut, [
+                self.encoder(dut, list(positions), delay),
+                self.check(dut, positions, 3, 10000)],
+                vcd_name=inspect.stack()[0][3] + f"_{delay}.vcd")
+            self.assertEqual(self.positions, positions)
+            self.assertEqual(self.errors, 0)
+
+    def measure_delay(self, dut):
+        while not (yield dut.position_valid):
+            yield
+        self.line_delay = (yield dut.line_delay)
+
+    def test_input_biss_line_delay(self):
+        measures = []
+        for delay in [0, 5, 30]:
+            dut = BiSSMaster(self.fclk, idle_time=1e-6)
+            run_simulation(dut, [self.encoder(dut, [42], delay), self.measure_delay(dut)],
+                vcd_name=inspect.stack()[0][3] + f"_{delay}.vcd")
+            measures.append(self.line_delay - delay)
+        # the measured delay follows the line delay, with a constant offset
+        self.assertEqual(len(set(measures)), 1)
+
+    def test_input_biss_errors(self):
+        for parameters in [dict(bogus_crc=True), dict(n_error=0)]:
+            dut = BiSSMaster(self.fclk, idle_time=1e-6)
+            run_simulation(dut, [
+                self.encoder(dut, [0x123456] * 2, 3, **parameters),
+                self.check(dut, [], 2, 10000)],
+                vcd_name=inspect.stack()[0][3] + ".vcd")
+            self.assertEqual(self.positions, [])
+            self.assertEqual(self.errors, 2)
+
+    def set_delay(self, dut, delay):
+        yield dut.delay.eq(delay)
+
+    def test_input_biss_ssi(self):
+        # measure the line delay in BiSS mode first
+        dut = BiSSMaster(self.fclk, idle_time=1e-6)
+        run_simulation(dut, [self.encoder(dut, [42], 14), self.measure_delay(dut)])
+        for gray in [False, True]:
+            positions = [0x123456, 0xABCDEF, 0x000001]
+            dut = BiSSMaster(self.fclk, ssi=True, gray=gray, idle_time=3e-6)
+            run_simulation(dut, [
+                self.encoder(dut, list(positions), 14, ssi=True, gray=gray),
+                self.set_delay(dut, self.line_delay),
+                self.check(dut, positions, 3, 10000)],
+                vcd_name=inspect.stack()[0][3] + f"_{gray}.vcd")
+            self.assertEqual(self.positions, positions)
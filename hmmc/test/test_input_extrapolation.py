@@ -0,0 +1,88 @@
+import unittest
+import inspect
+from migen import Module, run_simulation, passive
+from hmmc.input.quadrature import QEI
+from hmmc.input.extrapolation import PositionExtrapolator
+
+
+class QEIExtrapolated(Module):
+    def __init__(self):
+        self.submodules.qei = qei = QEI(16)
+        self.submodules.extrapolator = extrapolator = PositionExtrapolator(16, output_fraction=8)
+        self.comb += [
+            extrapolator.position.eq(qei.position),
+            extrapolator.position_valid.eq(qei.position_valid),
+            extrapolator.position_timestamp.eq(qei.position_timestamp),
+            extrapolator.target.eq(qei.timestamp),
+        ]
+
+
+class TestPositionExtrapolator(unittest.TestCase):
+    sequence = [0b00, 0b01, 0b11, 0b10]
+
+    @passive
+    def move(self, dut, pause):
+        state = 0
+        while True:
+            for _ in range(pause):
+                yield
+            state = (state + 1) % 4
+            yield dut.qei.a.eq(self.sequence[state] & 1)
+            yield dut.qei.b.eq(self.sequence[state] >> 1)
+
+    def check(self, dut, pause):
+        # wait for the velocity estimation to settle
+        for _ in range(10 * pause):
+            yield
+        self.assertEqual((yield dut.extrapolator.velocity), 2**16 // pause)
+        fractions = set()
+        positions = []
+        for _ in range(3 * pause):
+            positions.append((yield dut.qei.position))
+            if len(positions) > dut.extrapolator.latency:
+                position = positions.pop(0)
+                output = (yield dut.extrapolator.output)
+                # the extrapolated position is less than one increment ahead of the counted
+                # position
+                self.assertEqual(output >> 8, position)
+                fractions.add(output & 0xFF)
+            yield
+        # interpolated between the increments
+        self.assertGreater(len(fractions), pause // 2)
+        self.assertGreater(max(fractions), 0xF0)
+
+    def test_input_extrapolation_qei(self):
+        pause = 50
+        dut = QEIExtrapolated()
+        run_simulation(dut, [self.move(dut, pause), self.check(dut, pause)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def samples(self, dut, period, velocity, count):
+        timestamp = 0
+        for n in range(count):
+            yield dut.position.eq(int(velocity * timestamp))
+            yield dut.position_timestamp.eq(timestamp)
+            yield dut.position_valid.eq(1)
+            yield dut.target.eq(timestamp)
+            yield
+            yield dut.position_valid.eq(0)
+            for _ in range(period - 1):
+                timestamp += 1
+                yield dut.target.eq(timestamp)
+                yield
+            timestamp += 1
+        # samples stop: the extrapolation is limited by the horizon
+        for _ in range(3 * period):
+            timestamp += 1
+            yield dut.target.eq(timestamp)
+            yield
+        last = int(velocity * (timestamp - 4 * period))
+        self.assertAlmostEqual((yield dut.output), last + velocity * 100, delta=2)
+
+    def test_input_extrapolation_samples(self):
+        dut = PositionExtrapolator(24)
+        run_simulation(dut, [self.set_horizon(dut, 100), self.samples(dut, 400, 3.7, 10)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def set_horizon(self, dut, horizon):
+        yield dut.horizon.eq(horizon)
@@ -0,0 +1,121 @@
+import unittest
+import inspect
+from migen import run_simulation, passive
+from hmmc.input.hall import HallDecoder
+
+
+class TestHallDecoder(unittest.TestCase):
+    codes = [0b001, 0b011, 0b010, 0b110, 0b100, 0b101]  # u = bit 0, v = bit 1, w = bit 2
+
+    @passive
+    def motor(self, dut):
+        """Motor model: outputs the Hall code of `self.motor_angle` (electrical turn), which moves
+        by `self.speed` turn per clock cycle"""
+        while True:
+            self.motor_angle = (self.motor_angle + self.speed) % 1
+            code = self.codes[int(self.motor_angle * 6)]
+            yield dut.u.eq(code & 1)
+            yield dut.v.eq((code >> 1) & 1)
+            yield dut.w.eq(code >> 2)
+            yield
+
+    def angle_error(self, dut):
+        angle = (yield dut.angle) / 2**dut.angle.nbits
+        return (angle - self.motor_angle + 0.5) % 1 - 0.5
+
+    def interpolation_test(self, dut, speed):
+        self.speed = speed
+        # sectors of 500 clock cycles, and 2 transitions to start the interpolation
+        for _ in range(4 * 500):
+            yield
+        errors = []
+        for _ in range(2 * 500):
+            errors.append((yield from self.angle_error(dut)))
+            yield
+        for error in errors:
+            self.assertLess(abs(error), 0.005)
+        self.assertEqual((yield dut.direction), 1 if speed < 0 else 0)
+        self.assertEqual((yield dut.period), 499)
+        self.assertEqual((yield dut.hall_error), 0)
+
+    def test_input_hall_interpolation(self):
+        for speed in [1 / 3000, -1 / 3000]:
+            self.motor_angle = 0.3
+            self.speed = 0
+            dut = HallDecoder()
+            run_simulation(dut, [self.motor(dut), self.interpolation_test(dut, speed)],
+                vcd_name=inspect.stack()[0][3] + f"_{speed}.vcd")
+
+    def deceleration_test(self, dut):
+        self.speed = 1 / 600
+        for _ in range(5 * 100):
+            yield
+        self.assertNotEqual((yield dut.velocity), 0)
+        # the motor stops: the angle waits at the end of the sector
+        self.speed = 0
+        sector = (yield dut.sector)
+        for _ in range(200):
+            yield
+        self.assertEqual((yield dut.sector), sector)
+        end = ((sector + 1) / 6 * 2**10 - 1) % 2**10
+        self.assertAlmostEqual((yield dut.angle), end, delta=1)
+        # timeout
+        for _ in range(2**12):
+            yield
+        self.assertEqual((yield dut.stopped), 1)
+        self.assertEqual((yield dut.velocity), 0)
+        # the direction changes: no interpolation until the next transition
+        self.speed = -1 / 600
+        while (yield dut.sector) == sector:
+            yield
+        yield
+        self.assertEqual((yield dut.direction), 1)
+        self.assertEqual((yield dut.velocity), 0)
+        self.assertAlmostEqual((yield dut.angle), sector / 6 * 2**10 - 1, delta=1)
+
+    def test_input_hall_deceleration(self):
+        self.motor_angle = 0.05
+        self.speed = 0
+        dut = HallDecoder(timer_resolution=12)
+        run_simulation(dut, [self.motor(dut), self.deceleration_test(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def error_test(self, dut):
+        errors = 0
+        yield dut.u.eq(1)
+        yield dut.filter_length.eq(3)
+        for _ in range(10):
+            yield
+        sector = (yield dut.sector)
+        # glitches are filtered
+        yield dut.w.eq(1)
+        yield
+        yield dut.w.eq(0)
+        for _ in range(10):
+            errors += (yield dut.hall_error)
+            yield
+        self.assertEqual(errors, 0)
+        self.assertEqual((yield dut.sector), sector)
+        # invalid code
+        yield dut.u.eq(1)
+        yield dut.v.eq(1)
+        yield dut.w.eq(1)
+        for _ in range(10):
+            errors += (yield dut.hall_error)
+            yield
+        self.assertGreater(errors, 0)
+        self.assertEqual((yield dut.sector), sector)
+        # skipped sector: the angle is set to the middle of the new sector
+        code = self.codes[(sector + 2) % 6]
+        yield dut.u.eq(code & 1)
+        yield dut.v.eq((code >> 1) & 1)
+        yield dut.w.eq(code >> 2)
+        for _ in range(10):
+            yield
+        self.assertEqual((yield dut.sector), (sector + 2) % 6)
+        self.assertEqual((yield dut.velocity), 0)
+        self.assertAlmostEqual((yield dut.angle), ((sector + 2.5) % 6) / 6 * 2**10, delta=1)
+
+    def test_input_hall_error(self):
+        dut = HallDecoder()
+        run_simulation(dut, [self.error_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
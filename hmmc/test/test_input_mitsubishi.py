@@ -1,6 +1,6 @@
 import unittest
 import inspect
-from hmmc.input.mitsubishi import ECNMEncoder
+from hmmc.input.mitsubishi import ECNMEncoder, ECNMEncoderSerial, ECNMEncoderBank
 from migen import run_simulation, passive
 
 
@@ -130,3 +130,147 @@ class TestMitsubishi(unittest.TestCase):
             self.encoder_timeout(dut, timeout),
             self.assert_critical_error(dut, timeout)],
             vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def timestamp_check(self, dut, count, timeout):
+        tx_idle = 1
+        request_end = None
+        while count:
+            self.assertGreater(timeout, 0, msg="Timeout waiting for position_valid")
+            timeout -= 1
+            if (yield dut.tx_idle) and not tx_idle:
+                request_end = (yield dut.timestamp) - 1
+            tx_idle = (yield dut.tx_idle)
+            if (yield dut.position_valid):
+                # the position is latched by the encoder at the end of the request
+                self.assertEqual((yield dut.position_timestamp), request_end)
+                count -= 1
+            yield
+
+    def test_input_mitsubishi_timestamp(self):
+        fclk = 5e6
+        dut = ECNMEncoder(fclk)
+        cmd_response = {0x32: self.known_good_frame}
+        timeout = int(fclk / dut.baudrate) * 10 * (9 + 5) * 3
+        run_simulation(dut, [
+            self.encoder(dut, fclk, cmd_response),
+            self.timestamp_check(dut, 3, timeout)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+
+class SerialEncoderModel:
+    """bit-level model of the encoder side of the link"""
+    def uart_receive_byte(self, tx, div):
+        """wait for a start bit on tx, and return the received byte"""
+        while (yield tx):
+            yield
+        for _ in range(div + div // 2):
+            yield
+        value = 0
+        for i in range(8):
+            value |= (yield tx) << i
+            for _ in range(div):
+                yield
+        return value
+
+    def uart_send_byte(self, rx, div, value):
+        for bit in [0] + [(value >> i) & 1 for i in range(8)] + [1]:
+            yield rx.eq(bit)
+            for _ in range(div):
+                yield
+
+    @passive
+    def encoder(self, tx, rx, txe, div, response, turnaround):
+        yield rx.eq(1)
+        while True:
+            cmd = yield from self.uart_receive_byte(tx, div)
+            self.assertEqual(cmd, ECNMEncoder.cmd)
+            for _ in range(turnaround):
+                yield
+            for byte in response:
+                self.assertEqual((yield txe), 0)
+                yield from self.uart_send_byte(rx, div, byte)
+
+
+class TestMitsubishiSerial(unittest.TestCase, SerialEncoderModel):
+    known_good_frame = TestMitsubishi.known_good_frame
+
+    def check_positions(self, dut, value, count, timeout):
+        valid = 0
+        while valid < count:
+            self.assertGreater(timeout, 0, msg="Timeout waiting for position_valid")
+            timeout -= 1
+            self.assertEqual((yield dut.error), 0)
+            if (yield dut.position_valid):
+                self.assertEqual((yield dut.position), value)
+                valid += 1
+            yield
+        yield
+        self.update_period = (yield dut.update_period)
+        self.latency = (yield dut.latency)
+
+    def test_input_mitsubishi_serial_back_to_back(self):
+        fclk = 25e6
+        div = int(fclk / ECNMEncoder.baudrate)
+        turnaround = 3 * div
+        frame_bits = 10 * (1 + len(self.known_good_frame))
+        dut = ECNMEncoderSerial(fclk)
+        run_simulation(dut, [
+            self.encoder(dut.serial_tx, dut.serial_rx, dut.serial_txe, div,
+                self.known_good_frame, turnaround),
+            self.check_positions(dut, 0x46C880, 5, 5 * (frame_bits + 30) * div)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+        # next request is sent right after the checksum byte, plus a 2 bits guard time
+        self.assertLess(self.update_period, frame_bits * div + turnaround + 4 * div)
+        self.assertLess(self.latency, self.update_period)
+        self.assertGreater(self.latency, (frame_bits - 10) * div)
+
+
+class TestMitsubishiBank(unittest.TestCase, SerialEncoderModel):
+    def frame(self, position, bogus_cs=False):
+        frame = [0x32, 0x21, position & 0xFF, (position >> 8) & 0xFF, position >> 16,
+                 0x71, 0xCC, 0x80]
+        cs = 0
+        for byte in frame:
+            cs ^= byte
+        return frame + [cs ^ (1 if bogus_cs else 0)]
+
+    def check_vectors(self, dut, positions, errors, count, timeout, broadcast):
+        yield dut.broadcast.eq(broadcast)
+        yield dut.stagger.eq(200)
+        vectors = 0
+        while vectors < count:
+            self.assertGreater(timeout, 0, msg="Timeout waiting for vector_valid")
+            timeout -= 1
+            yield dut.trigger.eq(1 if timeout % 2000 == 0 else 0)
+            if (yield dut.vector_valid):
+                self.assertEqual((yield dut.vector_error), errors)
+                timestamps = []
+                for i, position in enumerate(positions):
+                    if not errors & (1 << i):
+                        self.assertEqual((yield dut.position[i]), position)
+                    timestamps.append((yield dut.position_timestamp[i]))
+                self.timestamps = timestamps
+                vectors += 1
+            yield
+
+    def bank_test(self, broadcast):
+        fclk = 25e6
+        div = int(fclk / ECNMEncoder.baudrate)
+        positions = [0x123456, 0xABCDEF, 0x000001]
+        frames = [self.frame(positions[0]), self.frame(positions[1]),
+                  self.frame(positions[2], bogus_cs=True)]
+        dut = ECNMEncoderBank(3, fclk)
+        generators = [self.encoder(dut.serial_tx[i], dut.serial_rx[i], dut.serial_txe[i], div,
+            frames[i], (i + 1) * div) for i in range(3)]
+        run_simulation(dut, generators + [
+            self.check_vectors(dut, positions, 0b100, 3, 20000, broadcast)],
+            vcd_name=inspect.stack()[0][3] + f"_{broadcast}.vcd")
+
+    def test_input_mitsubishi_bank_broadcast(self):
+        self.bank_test(1)
+        # all axes are requested during the same clock cycle
+        self.assertEqual(len(set(self.timestamps[0:2])), 1)
+
+    def test_input_mitsubishi_bank_staggered(self):
+        self.bank_test(0)
+        self.assertEqual(len(set(self.timestamps[0:2])), 2)
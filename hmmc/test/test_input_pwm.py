@@ -0,0 +1,90 @@
+import unittest
+import inspect
+from migen import run_simulation, passive
+from hmmc.input.pwm import PwmCapture, PwmCaptureBank
+
+
+class TestPwmCapture(unittest.TestCase):
+    @passive
+    def pwm(self, signal, high, period, cycles=None):
+        """PWM generator, with `high` and `period` lists used in turn"""
+        n = 0
+        while cycles is None or n < cycles:
+            yield signal.eq(1)
+            for _ in range(high[n % len(high)]):
+                yield
+            yield signal.eq(0)
+            for _ in range(period[n % len(period)] - high[n % len(high)]):
+                yield
+            n += 1
+        while True:
+            yield
+
+    def measure(self, dut, count):
+        measures = []
+        while len(measures) < count:
+            if (yield dut.valid):
+                measures.append(((yield dut.high_time), (yield dut.period), (yield dut.duty)))
+            yield
+        return measures
+
+    def capture_test(self, dut):
+        measures = yield from self.measure(dut, 3)
+        for high_time, period, duty in measures:
+            self.assertEqual(high_time, 30)
+            self.assertEqual(period, 100)
+            self.assertEqual(duty, (30 << 16) // 100)
+
+    def test_input_pwm_capture(self):
+        dut = PwmCapture()
+        run_simulation(dut, [self.pwm(dut.input, [30], [100]), self.capture_test(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def average_test(self, dut):
+        yield dut.average.eq(2)
+        measures = yield from self.measure(dut, 3)
+        # the first window may be incomplete
+        for high_time, period, duty in measures[1:]:
+            self.assertEqual(high_time, 25)
+            self.assertEqual(period, 99)
+            self.assertEqual(duty, (100 << 16) // 396)
+
+    def test_input_pwm_average(self):
+        dut = PwmCapture()
+        run_simulation(dut, [self.pwm(dut.input, [20, 30, 25, 25], [98, 100, 99, 99]),
+            self.average_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def timeout_test(self, dut):
+        yield dut.timeout.eq(500)
+        measures = yield from self.measure(dut, 2)
+        self.assertEqual(measures[-1][2], (40 << 16) // 100)
+        # the signal stays high
+        while not (yield dut.timeout_error):
+            yield
+        yield
+        self.assertEqual((yield dut.duty), 2**16)
+
+    def test_input_pwm_timeout(self):
+        dut = PwmCapture()
+        run_simulation(dut, [self.pwm(dut.input, [40, 40, 40, 2000], [100, 100, 100, 2000], 4),
+            self.timeout_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def bank_test(self, dut):
+        measures = [[] for _ in range(3)]
+        while any(len(m) < 2 for m in measures):
+            for n in range(3):
+                if (yield dut.valid[n]):
+                    measures[n].append(((yield dut.high_time[n]), (yield dut.period[n])))
+            yield
+        self.assertEqual(measures[0][-1], (10, 50))
+        self.assertEqual(measures[1][-1], (35, 70))
+        self.assertEqual(measures[2][-1], (60, 80))
+
+    def test_input_pwm_bank(self):
+        dut = PwmCaptureBank(3)
+        run_simulation(dut, [
+            self.pwm(dut.input[0], [10], [50]),
+            self.pwm(dut.input[1], [35], [70]),
+            self.pwm(dut.input[2], [60], [80]),
+            self.bank_test(dut),
+        ], vcd_name=inspect.stack()[0][3] + ".vcd")
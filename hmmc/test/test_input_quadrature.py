@@ -0,0 +1,298 @@
+import unittest
+import inspect
+from migen import run_simulation, passive
+from hmmc.input.quadrature import QEI, QEIBank, MTVelocity
+
+
+class TestQEI(unittest.TestCase):
+    sequence = [0b00, 0b01, 0b11, 0b10]  # a = bit 0, b = bit 1
+
+    def move(self, dut, steps, pause):
+        """Generate `steps` quadrature increments (decrements if negative), `pause` cycles apart"""
+        for _ in range(abs(steps)):
+            self.state = (self.state + (1 if steps > 0 else -1)) % 4
+            ab = self.sequence[self.state]
+            yield dut.a.eq(ab & 1)
+            yield dut.b.eq(ab >> 1)
+            for _ in range(pause):
+                yield
+
+    def position_test(self, dut):
+        self.state = 0
+        yield from self.move(dut, 10, 3)
+        yield from self.move(dut, -3, 5)
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.position), 7)
+        yield from self.move(dut, -9, 1)
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.position), 2**dut.position.nbits - 2)
+
+    def test_input_quadrature_position(self):
+        dut = QEI(8)
+        run_simulation(dut, [self.position_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    @passive
+    def edge_timestamp_check(self, dut):
+        while True:
+            if (yield dut.edge):
+                timestamp = (yield dut.timestamp)
+                yield
+                self.assertEqual((yield dut.edge_timestamp), timestamp)
+            yield
+
+    def velocity_test(self, dut, steps, pause, window):
+        self.state = 0
+        yield dut.velocity_window.eq(window)
+        yield dut.velocity_trigger.eq(1)  # restart the window
+        yield
+        yield dut.velocity_trigger.eq(0)
+        yield from self.move(dut, steps, pause)
+
+    @passive
+    def velocity_check(self, dut):
+        self.measures = []
+        while True:
+            if (yield dut.velocity_valid):
+                self.measures.append(((yield dut.velocity_count), (yield dut.velocity_period)))
+            yield
+
+    def test_input_quadrature_velocity(self):
+        for pause, sign in [(7, 1), (13, -1)]:
+            window = 100
+            dut = QEI(16, velocity=True)
+            run_simulation(dut, [
+                self.velocity_test(dut, sign * 60, pause, window),
+                self.velocity_check(dut),
+                self.edge_timestamp_check(dut)],
+                vcd_name=inspect.stack()[0][3] + f"_{pause}.vcd")
+            measures = self.measures[2:-1]
+            self.assertGreater(len(measures), 2)
+            for count, period in measures:
+                self.assertEqual(count * sign * pause, period)
+                self.assertGreaterEqual(count * sign, window // pause - 1)
+
+    def glitch_test(self, dut, length):
+        self.state = 0
+        yield dut.filter_length.eq(length)
+        yield from self.move(dut, 4, length + 1)
+        # glitches shorter than the filter length are ignored
+        for _ in range(3):
+            yield dut.a.eq(1)
+            for _ in range(length - 1):
+                yield
+            yield dut.a.eq(0)
+            yield
+        for _ in range(length + 5):
+            yield
+        self.assertEqual((yield dut.position), 4)
+        self.assertEqual((yield dut.illegal_count), 0)
+
+    def test_input_quadrature_glitch_filter(self):
+        length = 5
+        dut = QEI(8)
+        run_simulation(dut, [self.glitch_test(dut, length)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def move_ddr(self, dut, steps):
+        """Generate `steps` quadrature increments, one per sample (2 per clock cycle)"""
+        samples = []
+        for _ in range(abs(steps)):
+            self.state = (self.state + (1 if steps > 0 else -1)) % 4
+            samples.append(self.sequence[self.state])
+        for s0, s1 in zip(samples[0::2], samples[1::2]):
+            yield dut.a.eq((s0 & 1) | (s1 & 1) << 1)
+            yield dut.b.eq((s0 >> 1) | (s1 >> 1) << 1)
+            yield
+
+    def ddr_test(self, dut):
+        self.state = 0
+        yield from self.move_ddr(dut, 40)
+        yield from self.move_ddr(dut, -18)
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.position), 22)
+        self.assertEqual((yield dut.illegal_count), 0)
+        # a and b change simultaneously: illegal transitions, position unchanged
+        yield dut.a.eq(0b10)
+        yield dut.b.eq(0b10)
+        yield
+        yield dut.a.eq(0b00)
+        yield dut.b.eq(0b00)
+        yield
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.position), 22)
+        self.assertEqual((yield dut.illegal_count), 3)
+
+    def test_input_quadrature_ddr(self):
+        dut = QEI(8, ddr=True)
+        run_simulation(dut, [self.ddr_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def index_test(self, dut):
+        self.state = 0
+        yield from self.move(dut, 9, 3)
+        yield dut.i.eq(1)
+        yield from self.move(dut, 4, 3)
+        yield dut.i.eq(0)
+        yield from self.move(dut, 6, 3)
+        for _ in range(5):
+            yield
+        # a & b & i are all '1' at position 10 (state 2, 0b11)
+        self.assertEqual((yield dut.index_position), 10)
+        self.assertEqual(self.index_captures, 1)
+
+    @passive
+    def count_index_captures(self, dut):
+        self.index_captures = 0
+        while True:
+            self.index_captures += (yield dut.index_capture)
+            yield
+
+    def test_input_quadrature_index(self):
+        dut = QEI(8, used_index=True)
+        run_simulation(dut, [self.index_test(dut), self.count_index_captures(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+
+class TestQEIBank(unittest.TestCase):
+    sequence = TestQEI.sequence
+
+    def move(self, dut, axis, steps):
+        for _ in range(abs(steps)):
+            self.state[axis] = (self.state[axis] + (1 if steps > 0 else -1)) % 4
+            ab = self.sequence[self.state[axis]]
+            yield dut.a[axis].eq(ab & 1)
+            yield dut.b[axis].eq(ab >> 1)
+            for _ in range(3):
+                yield
+
+    def snapshot_test(self, dut):
+        self.state = [0, 0, 0]
+        yield from self.move(dut, 0, 5)
+        yield from self.move(dut, 1, -3)
+        yield from self.move(dut, 2, 7)
+        for _ in range(5):
+            yield
+        yield dut.snapshot.eq(1)
+        yield
+        yield dut.snapshot.eq(0)
+        timestamp = (yield dut.qei_0.timestamp)
+        yield
+        self.assertEqual((yield dut.snapshot_valid), 1)
+        self.assertEqual((yield dut.snapshot_timestamp), timestamp)
+        positions = []
+        edge_timestamps = []
+        for position, edge_timestamp in zip(dut.position, dut.edge_timestamp):
+            positions.append((yield position))
+            edge_timestamps.append((yield edge_timestamp))
+        self.assertEqual(positions, [5, 2**dut.position[1].nbits - 3, 7])
+        self.assertGreater(edge_timestamps[2], edge_timestamps[1])
+        self.assertGreater(edge_timestamps[1], edge_timestamps[0])
+        self.assertGreater(timestamp, edge_timestamps[2])
+        # latched values do not move until the next snapshot
+        yield from self.move(dut, 0, 5)
+        self.assertEqual((yield dut.position[0]), 5)
+        yield dut.snapshot_trigger.eq(1)
+        yield
+        yield dut.snapshot_trigger.eq(0)
+        yield
+        self.assertEqual((yield dut.position[0]), 10)
+
+    def test_input_quadrature_bank(self):
+        dut = QEIBank(3, 8)
+        run_simulation(dut, [self.snapshot_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def snapshot(self, dut):
+        yield dut.snapshot_trigger.eq(1)
+        yield
+        yield dut.snapshot_trigger.eq(0)
+        yield
+
+    def index_test(self, dut):
+        self.state = [0, 0, 0]
+        yield from self.move(dut, 0, 3)
+        # a & b & i are all '1' at position 10 (state 2, 0b11)
+        yield from self.move(dut, 1, 9)
+        yield dut.i[1].eq(1)
+        yield from self.move(dut, 1, 4)
+        yield dut.i[1].eq(0)
+        yield from self.move(dut, 1, 6)
+        for _ in range(5):
+            yield
+        yield from self.snapshot(dut)
+        self.assertEqual((yield dut.position[1]), 19)
+        self.assertEqual((yield dut.index_position[1]), 10)
+        for n, captured in enumerate(dut.index_captured):
+            self.assertEqual((yield captured), n == 1)
+        # the latched index position holds until the next snapshot, at 18 going backwards
+        yield dut.i[1].eq(1)
+        yield from self.move(dut, 1, -3)
+        yield dut.i[1].eq(0)
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.axes[1].index_position), 18)
+        self.assertEqual((yield dut.index_position[1]), 10)
+        self.assertEqual((yield dut.index_captured[1]), 1)
+        yield from self.snapshot(dut)
+        self.assertEqual((yield dut.index_position[1]), 18)
+        self.assertEqual((yield dut.index_captured[1]), 1)
+        # no index mark since the previous snapshot
+        yield from self.move(dut, 1, 2)
+        yield from self.snapshot(dut)
+        self.assertEqual((yield dut.position[1]), 18)
+        self.assertEqual((yield dut.index_position[1]), 18)
+        self.assertEqual((yield dut.index_captured[1]), 0)
+
+    def index_snapshot_test(self, dut, delay):
+        self.state = [0, 0, 0]
+        yield from self.move(dut, 0, 1)
+        yield dut.i[0].eq(1)
+        # index mark at position 2, with a snapshot `delay` clock cycles after the edge
+        yield dut.a[0].eq(1)
+        yield dut.b[0].eq(1)
+        for _ in range(delay):
+            yield
+        yield from self.snapshot(dut)
+        captured = (yield dut.index_captured[0])
+        # the index is reported by the snapshot which latches its position
+        self.assertEqual((yield dut.index_position[0]), 2 if captured else 0)
+        for _ in range(10):
+            yield
+        yield from self.snapshot(dut)
+        # and only once
+        self.assertEqual(captured + (yield dut.index_captured[0]), 1)
+        self.assertEqual((yield dut.index_position[0]), 2)
+
+    def test_input_quadrature_bank_index_snapshot(self):
+        # delays around the index capture
+        for delay in range(8):
+            with self.subTest(delay=delay):
+                dut = QEIBank(1, 8, used_index=True)
+                run_simulation(dut, [self.index_snapshot_test(dut, delay)],
+                    vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def test_input_quadrature_bank_index(self):
+        dut = QEIBank(3, 8, used_index=True)
+        run_simulation(dut, [self.index_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+
+class TestMTVelocity(unittest.TestCase):
+    def full_window_test(self, dut, delta):
+        yield dut.window.eq(15)
+        yield dut.delta.eq(delta)
+        counts = []
+        for _ in range(100):
+            yield
+            if (yield dut.valid):
+                counts.append((yield dut.count))
+        # 16 clock cycles per window, `delta` edges per clock cycle
+        self.assertEqual(counts[-3:], [16 * delta] * 3)
+
+    def test_input_quadrature_mt_full_window(self):
+        for delta in [2, -2]:
+            with self.subTest(delta=delta):
+                dut = MTVelocity(4, 16)
+                run_simulation(dut, [self.full_window_test(dut, delta)],
+                    vcd_name=inspect.stack()[0][3] + ".vcd")
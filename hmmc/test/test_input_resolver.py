@@ -0,0 +1,63 @@
+import unittest
+import inspect
+from math import sin, cos, pi
+from migen import run_simulation, passive
+from hmmc.input.resolver import ResolverRDC
+
+
+class TestResolverRDC(unittest.TestCase):
+    fclk = 1e6
+    carrier_frequency = 20e3
+    amplitude = 0.7
+
+    @passive
+    def resolver(self, dut, speed):
+        """Resolver model: the windings output the carrier modulated by sin/cos of the angle
+
+        :param speed: shaft speed, in turn per clock cycle
+        """
+        mid = 2**15
+        angle = 0.1
+        while True:
+            carrier = (yield dut.carrier) / 2**15
+            theta = 2 * pi * angle
+            yield dut.sin.eq(round(mid + self.amplitude * (mid - 1) * carrier * sin(theta)))
+            yield dut.cos.eq(round(mid + self.amplitude * (mid - 1) * carrier * cos(theta)))
+            yield dut.input_valid.eq(1)
+            self.shaft_angle = angle % 1
+            angle += speed
+            yield
+
+    def tracking_test(self, dut, speed, updates):
+        # demodulated amplitude: mean of |sin| over a period
+        amplitude = self.amplitude * 2**15 * 2 / pi
+        kp, ki = dut.loop_gains(1000, amplitude)
+        yield dut.kp.eq(kp)
+        yield dut.ki.eq(ki)
+        errors = []
+        velocities = []
+        while len(errors) < updates:
+            if (yield dut.angle_valid):
+                yield
+                angle = (yield dut.angle) / 2**16
+                error = (angle - self.shaft_angle + 0.5) % 1 - 0.5
+                errors.append(error)
+                velocities.append((yield dut.velocity) / 2**32)
+            yield
+        # settled
+        for error in errors[-20:]:
+            self.assertLess(abs(error), 2e-3)
+        expected = speed * self.fclk / dut.update_rate
+        velocity = sum(velocities[-20:]) / 20
+        self.assertAlmostEqual(velocity, expected, delta=abs(expected) * 0.03 + 1e-5)
+
+    def test_input_resolver_static(self):
+        dut = ResolverRDC(self.fclk, self.carrier_frequency)
+        run_simulation(dut, [self.resolver(dut, 0), self.tracking_test(dut, 0, 60)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def test_input_resolver_tracking(self):
+        for speed in [20 / self.fclk, -35 / self.fclk]:  # turn per second
+            dut = ResolverRDC(self.fclk, self.carrier_frequency)
+            run_simulation(dut, [self.resolver(dut, speed), self.tracking_test(dut, speed, 60)],
+                vcd_name=inspect.stack()[0][3] + f"_{speed}.vcd")
@@ -50,3 +50,21 @@ class TestSigmaDelta(unittest.TestCase):
                     self.sigmadelta_gen_input(dut, 0, resolution, value),
                     self.sigmadelta_check_value(dut, 0, value, tolerance, settling_time)],
                     vcd_name=inspect.stack()[0][3] + f"_d{damping}_{value}.vcd")
+
+    def clk_sync_test(self, dut):
+        for _ in range(7):
+            yield
+        yield dut.clk_sync.eq(1)
+        yield
+        yield dut.clk_sync.eq(0)
+        yield
+        # the clock restarts from the start of its low half-period
+        clk = []
+        for _ in range(16):
+            clk.append((yield dut.clk_out))
+            yield
+        self.assertEqual(clk, [0] * 5 + [1] * 5 + [0] * 5 + [1])
+
+    def test_input_sigmadelta_clk_sync(self):
+        dut = SigmaDelta(channels=1, fout=2.5E6, fclk=20E6, damping_coef=0.1)
+        run_simulation(dut, [self.clk_sync_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
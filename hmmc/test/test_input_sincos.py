@@ -0,0 +1,82 @@
+import unittest
+import inspect
+from math import sin, cos, pi
+from migen import run_simulation
+from hmmc.input.sincos import SinCosInterpolator
+
+
+class TestSinCosInterpolator(unittest.TestCase):
+    def sample(self, angle, amplitude=0.8, offsets=(0, 0), gains=(1, 1), phase=0):
+        """Encoder model, with offset, gain and phase errors"""
+        mid = 2**15
+        s = mid + offsets[0] + gains[0] * amplitude * (mid - 1) * sin(angle)
+        c = mid + offsets[1] + gains[1] * amplitude * (mid - 1) * cos(angle + phase)
+        return round(s), round(c)
+
+    def interpolator_test(self, dut, angles, errors, correction):
+        for name, value in correction.items():
+            yield getattr(dut, name).eq(value)
+        positions = []
+        for angle in angles + [0] * 30:
+            s, c = self.sample(angle, **errors)
+            yield dut.sin.eq(s)
+            yield dut.cos.eq(c)
+            yield dut.input_valid.eq(1)
+            yield
+            if (yield dut.position_valid):
+                positions.append((yield dut.position))
+                self.assertEqual((yield dut.signal_error), 0)
+        self.assertGreaterEqual(len(positions), len(angles))
+        for angle, position in zip(angles, positions):
+            # position is an unsigned 16.16 number of periods
+            expected = round(angle / (2 * pi) * 2**16) % 2**32
+            error = (position - expected + 2**31) % 2**32 - 2**31
+            self.assertLessEqual(abs(error), self.tolerance, msg=f"angle={angle}")
+
+    def angles(self):
+        # 2.5 periods forward then 3 periods backward
+        forward = [n * 2 * pi / 40 for n in range(100)]
+        return forward + [forward[-1] - n * 2 * pi / 37 for n in range(1, 111)]
+
+    def test_input_sincos(self):
+        self.tolerance = 4
+        dut = SinCosInterpolator()
+        run_simulation(dut, [self.interpolator_test(dut, self.angles(), {}, {})],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def test_input_sincos_correction(self):
+        phase = 0.1
+        errors = dict(offsets=(1500, -700), gains=(0.7, 1.2), phase=phase)
+        gain_one = 2**14
+        correction = dict(
+            sin_offset=1500,
+            cos_offset=-700,
+            sin_gain=round(gain_one / 0.7),
+            cos_gain=round(gain_one / 1.2 / cos(phase)),
+            phase=round(gain_one * -sin(phase)),
+        )
+        self.tolerance = 8
+        dut = SinCosInterpolator()
+        run_simulation(dut, [self.interpolator_test(dut, self.angles(), errors, correction)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+        # without the correction, the error is much larger
+        with self.assertRaises(AssertionError):
+            dut = SinCosInterpolator()
+            run_simulation(dut, [self.interpolator_test(dut, self.angles(), errors, {})])
+
+    def test_input_sincos_signal_error(self):
+        dut = SinCosInterpolator()
+
+        def tb(dut):
+            yield dut.min_magnitude.eq(round(0.5 * 2**15 * dut.cordic.gain))
+            errors = 0
+            for _ in range(40):
+                s, c = self.sample(1, amplitude=0.3)
+                yield dut.sin.eq(s)
+                yield dut.cos.eq(c)
+                yield dut.input_valid.eq(1)
+                yield
+                errors += (yield dut.signal_error)
+            self.assertGreater(errors, 10)
+
+        run_simulation(dut, [tb(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
@@ -0,0 +1,145 @@
+import unittest
+import inspect
+from migen import Module, run_simulation, passive
+from hmmc.input.stepdir import StepDirDecoder
+from hmmc.output.stepdir import StepDir
+
+
+class TestStepDirDecoder(unittest.TestCase):
+    def steps(self, dut, n, high=2, low=2, setup=4):
+        """Generate `n` steps up (down if negative)"""
+        if (yield dut.dir) != (n > 0):
+            yield dut.dir.eq(n > 0)
+            for _ in range(setup):
+                yield
+        for _ in range(abs(n)):
+            yield dut.step.eq(1)
+            for _ in range(high):
+                yield
+            yield dut.step.eq(0)
+            for _ in range(low):
+                yield
+
+    def position_test(self, dut):
+        yield dut.dir_setup.eq(3)
+        yield from self.steps(dut, 10)
+        yield from self.steps(dut, -3)
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.position), 7)
+        yield from self.steps(dut, -9, high=1, low=1)
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.position), 2**32 - 2)
+        self.assertEqual((yield dut.lost_count), 0)
+
+    def test_input_stepdir_position(self):
+        dut = StepDirDecoder()
+        run_simulation(dut, [self.position_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def violation_test(self, dut):
+        yield dut.dir_setup.eq(3)
+        yield dut.filter_length.eq(2)
+        yield from self.steps(dut, 5)
+        # dir changes 1 clock cycle before the step edge: counted with the previous direction
+        yield from self.steps(dut, -1, setup=1)
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.position), 6)
+        self.assertEqual((yield dut.lost_count), 1)
+        # the next steps respect the setup time
+        yield from self.steps(dut, -2)
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.position), 4)
+        self.assertEqual((yield dut.lost_count), 1)
+        # dir changes on the step edge, and back to up
+        yield from self.steps(dut, 1, setup=0)
+        yield from self.steps(dut, -1, setup=1)
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.position), 4)
+        self.assertEqual((yield dut.lost_count), 3)
+        # short step pulse
+        yield from self.steps(dut, -1, high=1)
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.position), 4)
+        self.assertEqual((yield dut.lost_count), 4)
+        yield dut.lost_clear.eq(1)
+        yield
+        yield dut.lost_clear.eq(0)
+        yield
+        self.assertEqual((yield dut.lost_count), 0)
+
+    def test_input_stepdir_violation(self):
+        dut = StepDirDecoder()
+        run_simulation(dut, [self.violation_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def gearing_test(self, dut):
+        yield dut.gear.eq(round(2.5 * 2**8))
+        yield from self.steps(dut, 5)
+        yield from self.steps(dut, -1)
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.position), 10)
+        yield dut.gear.eq(round(0.25 * 2**8))
+        yield from self.steps(dut, 7)
+        for _ in range(5):
+            yield
+        self.assertEqual((yield dut.position), 11)
+
+    def test_input_stepdir_gearing(self):
+        dut = StepDirDecoder(gearing=True)
+        run_simulation(dut, [self.gearing_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    @passive
+    def rate_check(self, dut):
+        self.measures = []
+        while True:
+            if (yield dut.rate_valid):
+                self.measures.append(((yield dut.rate_count), (yield dut.rate_period)))
+            yield
+
+    def rate_test(self, dut):
+        yield dut.rate_window.eq(99)
+        yield dut.rate_trigger.eq(1)  # restart the window
+        yield
+        yield dut.rate_trigger.eq(0)
+        yield from self.steps(dut, 30, high=3, low=7)
+        count, period = self.measures[-1]
+        self.assertGreater(count, 0)
+        self.assertEqual(period, count * 10)
+
+    def test_input_stepdir_rate(self):
+        dut = StepDirDecoder()
+        run_simulation(dut, [self.rate_check(dut), self.rate_test(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def loopback_test(self, dut, moves):
+        for move in moves:
+            for _ in range(abs(move)):
+                yield (dut.output.up if move > 0 else dut.output.down).eq(1)
+                yield
+                yield dut.output.up.eq(0)
+                yield dut.output.down.eq(0)
+                for _ in range(15):
+                    yield
+        for _ in range(20):
+            yield
+        self.assertEqual((yield dut.input.position), sum(moves) % 2**32)
+        self.assertEqual((yield dut.input.lost_count), 0)
+
+    def test_input_stepdir_loopback(self):
+        class Loopback(Module):
+            def __init__(self):
+                self.submodules.output = output = StepDir(3, 4)
+                self.submodules.input = StepDirDecoder(default_filter=2, default_setup=3)
+                self.comb += [
+                    self.input.step.eq(output.step),
+                    self.input.dir.eq(output.dir),
+                ]
+
+        dut = Loopback()
+        run_simulation(dut, [self.loopback_test(dut, [10, -4, 7, -20])],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
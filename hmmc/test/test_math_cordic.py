@@ -0,0 +1,33 @@
+import unittest
+import inspect
+from math import sin, cos, pi, atan2, hypot
+from migen import run_simulation
+from hmmc.math.cordic import Atan2Cordic
+
+
+class TestMathCordic(unittest.TestCase):
+    def atan2_test(self, dut, vectors):
+        results = []
+        for x, y in vectors + [(0, 0)] * dut.latency:
+            yield dut.x.eq(x)
+            yield dut.y.eq(y)
+            yield dut.input_valid.eq(1)
+            yield
+            if (yield dut.output_valid):
+                results.append(((yield dut.angle), (yield dut.magnitude)))
+        self.assertEqual(len(results), len(vectors))
+        for (x, y), (angle, magnitude) in zip(vectors, results):
+            expected = atan2(y, x) / (2 * pi) * 2**dut.angle.nbits
+            error = (angle - expected + 2**(dut.angle.nbits - 1)) % 2**dut.angle.nbits \
+                - 2**(dut.angle.nbits - 1)
+            self.assertLessEqual(abs(error), 2, msg=f"x={x}, y={y}")
+            self.assertAlmostEqual(magnitude, hypot(x, y) * dut.gain, delta=4)
+
+    def test_math_cordic_atan2(self):
+        dut = Atan2Cordic(16, 16)
+        amplitude = 2**15 - 1
+        vectors = [(round(amplitude * 0.9 * cos(a * pi / 17)),
+                    round(amplitude * 0.9 * sin(a * pi / 17))) for a in range(34)]
+        vectors += [(-2**15, 0), (-2**15, -2**15), (0, 2**15 - 1), (0, -2**15), (1000, -1)]
+        run_simulation(dut, [self.atan2_test(dut, vectors)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
@@ -2,7 +2,7 @@ import unittest
 import inspect
 from migen.fhdl.verilog import convert
 from migen import Module, Signal, run_simulation
-from hmmc.math.dsp import add_signed_detect_overflow, MulFixedPoint
+from hmmc.math.dsp import add_signed_detect_overflow, MulFixedPoint, DivSequential
 from hmmc.math.fixedpoint import FloatFixedConverter, FixedPointSignal
 from hmmc.utils.verilator import ModuleVerilog, VerilatorBuilder
 
@@ -148,3 +148,26 @@ class TestMathDspMul(unittest.TestCase):
             return_code="    return 0;"))
         builder.add_source("top.v")
         builder.cmake("test_utils_verilator", True)
+
+
+class TestMathDspDivSequential(unittest.TestCase):
+    def div_test(self, dut, values):
+        for dividend, divisor in values:
+            yield dut.dividend.eq(dividend)
+            yield dut.divisor.eq(divisor)
+            yield dut.start.eq(1)
+            yield
+            yield dut.start.eq(0)
+            while not (yield dut.done):
+                yield
+            if divisor:
+                self.assertEqual((yield dut.quotient), dividend // divisor)
+                self.assertEqual((yield dut.remainder), dividend % divisor)
+            else:
+                self.assertEqual((yield dut.quotient), 2**dut.quotient.nbits - 1)
+            self.assertEqual((yield dut.busy), 0)
+
+    def test_math_dsp_div_sequential(self):
+        dut = DivSequential(16, 8)
+        values = [(1000, 7), (65535, 255), (12, 13), (0, 5), (40000, 1), (123, 0)]
+        run_simulation(dut, [self.div_test(dut, values)], vcd_name=inspect.stack()[0][3] + ".vcd")
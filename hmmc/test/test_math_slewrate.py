@@ -0,0 +1,77 @@
+import unittest
+import inspect
+from migen import run_simulation
+from hmmc.math.slewrate import SlewRateLimiter, SlewRateLimiterBank
+
+
+class TestSlewRateLimiter(unittest.TestCase):
+    def updates_to_done(self, dut, limit=1000):
+        """Send update strobes until `done`, and return their count"""
+        updates = 0
+        while not (yield dut.done):
+            self.assertLess(updates, limit)
+            yield dut.update.eq(1)
+            yield
+            yield dut.update.eq(0)
+            yield
+            updates += 1
+        return updates
+
+    def ramp_test(self, dut):
+        yield dut.rise_step.eq(1000)
+        yield dut.fall_step.eq(3000)
+        yield dut.setpoint.eq(0.5)
+        yield
+        self.assertEqual((yield from self.updates_to_done(dut)), 17)  # ceil(16384 / 1000)
+        self.assertEqual((yield dut.output), 2**14)
+        yield dut.setpoint.eq(-0.25)
+        yield
+        self.assertEqual((yield dut.output), 2**14)
+        self.assertEqual((yield from self.updates_to_done(dut)), 9)  # ceil(24576 / 3000)
+        self.assertEqual((yield dut.output), -2**13)
+
+    def test_math_slewrate_ramp(self):
+        dut = SlewRateLimiter((16, True))
+        run_simulation(dut, [self.ramp_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def saturation_test(self, dut):
+        yield dut.rise_step.eq(100)
+        yield dut.maximum.eq(1000)
+        yield dut.minimum.eq(200)
+        yield dut.setpoint.eq(4000)
+        yield
+        # the output starts from the minimum
+        self.assertEqual((yield from self.updates_to_done(dut)), 8)
+        self.assertEqual((yield dut.output), 1000)
+        # the output is saturated without delay
+        yield dut.maximum.eq(600)
+        yield
+        yield
+        self.assertEqual((yield dut.output), 600)
+        self.assertEqual((yield dut.done), 1)
+        # load jumps to the saturated setpoint
+        yield dut.setpoint.eq(0)
+        yield dut.load.eq(1)
+        yield
+        yield dut.load.eq(0)
+        yield
+        self.assertEqual((yield dut.output), 200)
+
+    def test_math_slewrate_saturation(self):
+        dut = SlewRateLimiter(12)
+        run_simulation(dut, [self.saturation_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def bank_test(self, dut):
+        yield dut.rise_step.eq(10)
+        yield dut.fall_step.eq(10)
+        for n, setpoint in enumerate([50, 100, 25]):
+            yield dut.setpoint[n].eq(setpoint)
+        yield
+        # done when the largest change is done
+        self.assertEqual((yield from self.updates_to_done(dut)), 10)
+        for n, setpoint in enumerate([50, 100, 25]):
+            self.assertEqual((yield dut.output[n]), setpoint)
+
+    def test_math_slewrate_bank(self):
+        dut = SlewRateLimiterBank(3, bits_sign=8, radix_nbits=0)
+        run_simulation(dut, [self.bank_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
@@ -0,0 +1,113 @@
+import unittest
+import inspect
+from migen import run_simulation, passive
+from hmmc.motion.coordinated import CoordinatedMotion
+
+
+class TestCoordinatedMotion(unittest.TestCase):
+    lines = [
+        (100, [100, -37, 0, 64, -100, 1]),
+        (60, [-20, 60, 5, -60, 0, 59]),
+    ]
+
+    @passive
+    def monitor(self, dut):
+        """Positions of the axes after each master step"""
+        self.steps = []
+        positions = [0] * len(dut.position)
+        while True:
+            master_step = (yield dut.master.up)
+            for n in range(len(positions)):
+                up, down = (yield dut.up[n]), (yield dut.down[n])
+                self.assertFalse((up or down) and not master_step, msg="step without master step")
+                positions[n] += up - down
+            if master_step:
+                self.steps.append(list(positions))
+            yield
+
+    def push_lines(self, dut):
+        for length, deltas in self.lines:
+            yield dut.line_length.eq(length)
+            for signal, delta in zip(dut.line_delta, deltas):
+                yield signal.eq(delta)
+            yield dut.line_valid.eq(1)
+            yield
+            while not (yield dut.line_ready):
+                yield
+        yield dut.line_valid.eq(0)
+
+    def push_master(self, dut, segments):
+        master = dut.master
+        for n, (target_position, start_speed, acceleration) in enumerate(segments):
+            yield master.cmd_target_position.eq(target_position)
+            yield master.cmd_start_speed.eq(start_speed)
+            yield master.cmd_acceleration.eq(acceleration)
+            yield master.cmd_last.eq(n == len(segments) - 1)
+            yield master.cmd_valid.eq(1)
+            yield
+            while not (yield master.cmd_ready):
+                yield
+        yield master.cmd_valid.eq(0)
+
+    def coordinated_test(self, dut):
+        yield from self.push_lines(dut)
+        # accelerate, then constant speed through the end of the first line
+        yield from self.push_master(dut, [(80, 2**12, 2**14), (160, 0, 0)])
+        while not (yield dut.idle) or not (yield dut.master.done):
+            yield
+        for _ in range(10):
+            yield
+        self.assertEqual(len(self.steps), 160)
+        self.assertEqual((yield dut.line_underrun), 0)
+        # every axis follows the straight line of each segment within half a step
+        start = [0] * len(dut.position)
+        k0 = 0
+        for length, deltas in self.lines:
+            for k in range(1, length + 1):
+                for n, delta in enumerate(deltas):
+                    position = self.steps[k0 + k - 1][n] - start[n]
+                    self.assertLessEqual(abs(position - delta * k / length), 0.5)
+            # all the axes finish on the last master step of the line
+            start = [s + d for s, d in zip(start, deltas)]
+            self.assertEqual(self.steps[k0 + length - 1], start)
+            k0 += length
+        for n, position in enumerate(start):
+            self.assertEqual((yield dut.position[n]), position)
+
+    def test_motion_coordinated(self):
+        dut = CoordinatedMotion(6, 16, line_depth=2, w_speed=16, w_acceleration=16, fifo_depth=2)
+        run_simulation(dut, [self.coordinated_test(dut), self.monitor(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def single_test(self, dut):
+        # without queue, the next line is accepted during the last step of the current line
+        yield dut.line_length.eq(10)
+        yield dut.line_delta[0].eq(-10)
+        yield dut.line_delta[1].eq(3)
+        yield dut.line_valid.eq(1)
+        yield
+        yield dut.line_valid.eq(0)
+        master = dut.master
+        yield master.cmd_target_position.eq(20)
+        yield master.cmd_start_speed.eq(2**14)
+        yield master.cmd_valid.eq(1)
+        yield
+        yield master.cmd_valid.eq(0)
+        while not (yield dut.line_ready):
+            yield
+        yield dut.line_length.eq(10)
+        yield dut.line_delta[0].eq(4)
+        yield dut.line_delta[1].eq(-10)
+        yield dut.line_valid.eq(1)
+        yield
+        yield dut.line_valid.eq(0)
+        while not (yield dut.master.done):
+            yield
+        yield
+        self.assertEqual((yield dut.position[0]), -6)
+        self.assertEqual((yield dut.position[1]), -7)
+        self.assertEqual((yield dut.line_underrun), 0)
+
+    def test_motion_coordinated_single(self):
+        dut = CoordinatedMotion(2, 16, w_speed=16, w_acceleration=16)
+        run_simulation(dut, [self.single_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
@@ -76,3 +76,164 @@ class TestMotionGeneratorAxis(unittest.TestCase):
                              self.check_pos_at_done(dut, [8, 16, 8, 0]),
                              self.extract_pulses(dut)],
             vcd_name=inspect.stack()[0][3] + ".vcd")
+
+
+class TestMotionGeneratorFifo(unittest.TestCase):
+    @passive
+    def extract_pulses(self, dut):
+        self.pulses = []
+        cnt = 0
+        while True:
+            if (yield dut.up):
+                self.pulses.append(cnt)
+            if (yield dut.down):
+                self.pulses.append(-cnt)
+            cnt += 1
+            yield
+
+    def push_segments(self, dut, segments, start_speed=1000):
+        for n, (target_position, acceleration) in enumerate(segments):
+            yield dut.cmd_start_speed.eq(start_speed)
+            yield dut.cmd_target_position.eq(target_position)
+            yield dut.cmd_acceleration.eq(acceleration)
+            yield dut.cmd_last.eq(n == len(segments) - 1)
+            yield dut.cmd_valid.eq(1)
+            yield
+            while not (yield dut.cmd_ready):
+                yield
+        yield dut.cmd_valid.eq(0)
+
+    def wait_stopped(self, dut, timeout=50000):
+        # done, and no segment left
+        for _ in range(10):
+            yield
+        while not ((yield dut.done) and (yield dut.cmd_level) == 0):
+            self.assertGreater(timeout, 0)
+            timeout -= 1
+            yield
+        for _ in range(10):
+            yield
+
+    def chain_test(self, dut, segments):
+        yield from self.push_segments(dut, segments)
+        yield from self.wait_stopped(dut)
+        self.assertEqual((yield dut.position), segments[-1][0])
+        self.assertEqual((yield dut.underrun), 0)
+        self.assertEqual((yield dut.transition_cycles), 0)
+
+    def test_motiongenerator_fifo_chain(self):
+        acc = 2**14
+        # one segment, then the same motion split in segments of 1 to 3 steps
+        reference = MotionGeneratorAxis(16, 16, 16, fifo_depth=4)
+        run_simulation(reference, [self.chain_test(reference, [(40, acc)]),
+            self.extract_pulses(reference)], vcd_name=inspect.stack()[0][3] + ".vcd")
+        reference_pulses = self.pulses
+        self.assertEqual(len(reference_pulses), 40)
+
+        targets = [1, 3, 4, 6, 9, 10, 13, 14, 16, 19, 20, 22, 25, 27, 28, 31, 33, 34, 37, 40]
+        dut = MotionGeneratorAxis(16, 16, 16, fifo_depth=4)
+        run_simulation(dut, [self.chain_test(dut, [(t, acc) for t in targets]),
+            self.extract_pulses(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+        # the speed is continuous: the steps happen in the same clock cycles
+        self.assertEqual(self.pulses, reference_pulses)
+
+    def profile_test(self, dut):
+        acc = 2**14
+        # accelerate, cruise then decelerate, over 3 segments
+        yield from self.push_segments(dut, [(50, acc), (150, 0), (200, -acc)])
+        yield from self.wait_stopped(dut)
+        self.assertEqual((yield dut.position), 200)
+        self.assertEqual((yield dut.transition_cycles), 0)
+        intervals = [b - a for a, b in zip(self.pulses, self.pulses[1:])]
+        # constant speed between position 50 and 150
+        self.assertLessEqual(max(intervals[50:149]) - min(intervals[50:149]), 1)
+        self.assertLess(intervals[55], intervals[5])
+        self.assertLess(intervals[55], intervals[-5])
+
+    def test_motiongenerator_fifo_profile(self):
+        dut = MotionGeneratorAxis(16, 16, 16, fifo_depth=2)
+        run_simulation(dut, [self.profile_test(dut), self.extract_pulses(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def underrun_test(self, dut):
+        yield dut.cmd_start_speed.eq(2**14)
+        yield dut.cmd_target_position.eq(10)
+        yield dut.cmd_valid.eq(1)
+        yield
+        yield dut.cmd_valid.eq(0)
+        yield from self.wait_stopped(dut)
+        # the path was not finished
+        self.assertEqual((yield dut.underrun), 1)
+        self.assertGreater((yield dut.transition_cycles), 0)
+        yield dut.underrun_clear.eq(1)
+        yield
+        yield dut.underrun_clear.eq(0)
+        yield
+        self.assertEqual((yield dut.underrun), 0)
+        # the axis restarts from the start speed of the next segment
+        yield from self.push_segments(dut, [(15, 0), (20, 0)], start_speed=2**14)
+        yield from self.wait_stopped(dut)
+        self.assertEqual((yield dut.position), 20)
+        self.assertEqual((yield dut.underrun), 0)
+        self.assertEqual(len(self.pulses), 20)
+
+    def test_motiongenerator_fifo_underrun(self):
+        dut = MotionGeneratorAxis(16, 16, 16, fifo_depth=4)
+        run_simulation(dut, [self.underrun_test(dut), self.extract_pulses(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+
+class TestMotionGeneratorSCurve(unittest.TestCase):
+    speed = 0.05  # steps per clock cycle
+    acceleration = 100 * 2**-24  # 100 LSB
+    jerk = 100 * 2**-32  # 100 LSB
+
+    @passive
+    def monitor(self, dut):
+        self.accelerations = []
+        self.speeds = []
+        while True:
+            self.accelerations.append((yield dut.acceleration))
+            self.speeds.append((yield dut.speed_raw) >> dut.w_acceleration)
+            yield
+
+    def move(self, dut, distance):
+        start_position = (yield dut.position)
+        commands = dut.scurve_commands(1, 1, distance, self.speed, self.acceleration, self.jerk,
+            start_position)
+        for n, (target_position, start_speed, acceleration, jerk) in enumerate(commands):
+            yield dut.cmd_target_position.eq(target_position)
+            yield dut.cmd_start_speed.eq(start_speed)
+            yield dut.cmd_acceleration.eq(acceleration)
+            yield dut.cmd_jerk.eq(jerk)
+            yield dut.cmd_last.eq(n == len(commands) - 1)
+            yield dut.cmd_valid.eq(1)
+            yield
+            while not (yield dut.cmd_ready):
+                yield
+        yield dut.cmd_valid.eq(0)
+        for _ in range(10):
+            yield
+        timeout = 50000
+        while not ((yield dut.done) and (yield dut.cmd_level) == 0):
+            self.assertGreater(timeout, 0)
+            timeout -= 1
+            yield
+        self.assertEqual((yield dut.position), start_position + distance)
+
+    def scurve_test(self, dut):
+        yield from self.move(dut, 600)
+        self.assertEqual(max(self.speeds), round(self.speed * 2**16))
+        yield from self.move(dut, -150)
+        self.assertLess(min(self.speeds), 0)
+        self.assertEqual((yield dut.underrun), 0)
+        # the acceleration is continuous and limited
+        self.assertEqual(max(self.accelerations), 100)
+        self.assertEqual(min(self.accelerations), -100)
+        changes = [abs(b - a) for a, b in zip(self.accelerations, self.accelerations[1:])]
+        self.assertEqual(max(changes), 1)
+
+    def test_motiongenerator_scurve(self):
+        dut = MotionGeneratorAxis(16, 16, 8, fifo_depth=8, w_jerk=8)
+        run_simulation(dut, [self.scurve_test(dut), self.monitor(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
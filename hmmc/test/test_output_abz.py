@@ -0,0 +1,111 @@
+import unittest
+import inspect
+from migen import run_simulation, passive
+from hmmc.output.abz import AbzEmulator
+
+
+class TestAbzEmulator(unittest.TestCase):
+    quad_codes = [0b00, 0b01, 0b11, 0b10]  # a = bit 0, b = bit 1
+
+    @passive
+    def encoder(self, dut, interval):
+        """Absolute encoder sampled every `interval` clock ticks, at `self.speed` turn per sample"""
+        self.angle = self.start_angle
+        while True:
+            yield dut.position.eq(int(self.angle * 2**16) % 2**16)
+            yield dut.position_valid.eq(1)
+            yield
+            yield dut.position_valid.eq(0)
+            for _ in range(interval - 1):
+                yield
+            self.angle = (self.angle + self.speed) % 1
+
+    @passive
+    def decode(self, dut):
+        """Quadrature decoder, with the index positions and the minimum time between edges"""
+        self.pos = 0
+        self.index = []
+        self.index_codes = set()
+        self.min_time = None
+        last = 0
+        last_z = 0
+        time = None
+        while True:
+            yield
+            code = (yield dut.a) | (yield dut.b) << 1
+            z = (yield dut.z)
+            if z:
+                # z follows a and b by 1 clk tick
+                self.index_codes.add(last)
+            if z and not last_z:
+                self.index.append(self.pos)
+            last_z = z
+            if time is not None:
+                time += 1
+            if code == last:
+                continue
+            delta = (self.quad_codes.index(code) - self.quad_codes.index(last)) % 4
+            self.assertIn(delta, [1, 3], msg="invalid transition")
+            self.pos += 1 if delta == 1 else -1
+            if time is not None and (self.min_time is None or time < self.min_time):
+                self.min_time = time
+            time = 0
+            last = code
+
+    def tracking_test(self, dut, interval):
+        self.speed = 0
+        for _ in range(3 * interval):
+            yield
+        start = self.pos
+        self.speed = 0.01
+        for _ in range(150 * interval):
+            yield
+        self.speed = -0.013
+        for _ in range(40 * interval):
+            yield
+        self.speed = 0
+        for _ in range(2 * interval):
+            yield
+        # net displacement: 1.5 - 0.52 turn
+        self.assertEqual(self.pos - start, round((1.5 - 0.52) * 400))
+        self.assertEqual((yield dut.output_position), int(self.angle * 2**16) * 400 >> 16)
+        # counts are spread over the sample interval: up to 6 counts per 100 clock ticks
+        self.assertGreaterEqual(self.min_time, 100 // 6)
+        # one index per turn, always at the same count
+        self.assertGreater(len(self.index), 0)
+        self.assertEqual(len(set(p % 400 for p in self.index)), 1)
+        # a and b are '0' at the index, whatever the start position
+        self.assertEqual(self.index_codes, {0b00})
+        self.assertEqual((yield dut.overflow), 0)
+
+    def test_output_abz_tracking(self):
+        # start positions of 39, 40, 41 and 42 counts
+        for start_angle in [0.1, 0.1025, 0.105, 0.1055]:
+            with self.subTest(start_angle=start_angle):
+                self.start_angle = start_angle
+                dut = AbzEmulator(16, default_counts=400)
+                run_simulation(dut, [self.encoder(dut, 100), self.decode(dut),
+                    self.tracking_test(dut, 100)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def jump_test(self, dut, interval):
+        self.speed = 0
+        for _ in range(3 * interval):
+            yield
+        start = self.pos
+        # jump of 100 counts, while the output is limited to 1 edge every 5 clock ticks
+        self.speed = 0.25
+        yield
+        for _ in range(interval):
+            yield
+        self.speed = 0
+        for _ in range(10 * interval):
+            yield
+        self.assertEqual(self.pos - start, 100)
+        self.assertEqual(self.min_time, 5)
+        self.assertEqual((yield dut.overflow), 0)
+
+    def test_output_abz_jump(self):
+        self.start_angle = 0.1
+        dut = AbzEmulator(16, default_counts=400, edge_spacing=5)
+        run_simulation(dut, [self.encoder(dut, 100), self.decode(dut), self.jump_test(dut, 100)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
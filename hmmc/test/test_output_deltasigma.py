@@ -1,7 +1,8 @@
 import unittest
 import inspect
-from math import floor
-from hmmc.output.deltasigma import DeltaSigma, DeltaSigmaFixedPoint
+import importlib.util
+from math import floor, sin, pi
+from hmmc.output.deltasigma import DeltaSigma, DeltaSigmaFixedPoint, DeltaSigma2, DeltaSigmaMash
 from migen import run_simulation, passive
 from random import random
 
@@ -66,3 +67,68 @@ class TestDeltaSigma(unittest.TestCase):
                 self.deltasigma_check_ratio(dut, self.s2r(value, resolution), 257),
                 self.deltasigma_check_pulse_duration(dut, self.s2r(value, resolution))],
                 vcd_name=inspect.stack()[0][3] + f"_{value}.vcd")
+
+
+class TestDeltaSigmaNoiseShaping(unittest.TestCase):
+    def average_test(self, dut, value, result):
+        yield dut.input.eq(value)
+        for _ in range(100):  # settling
+            yield
+        total = 0
+        for _ in range(4000):
+            total += (yield dut.output)
+            yield
+        result.append(total / 4000)
+
+    def check_average(self, modulator, **kwargs):
+        for value in [300, 2048, 3900]:
+            dut = modulator(12, **kwargs)
+            result = []
+            run_simulation(dut, [self.average_test(dut, value, result)],
+                vcd_name=inspect.stack()[1][3] + f"_{value}.vcd")
+            offset = 0.5 if kwargs.get("dither") else 0
+            self.assertAlmostEqual(result[0] * 2**12, value + offset, delta=2)
+
+    def test_output_deltasigma2(self):
+        self.check_average(DeltaSigma2)
+
+    def test_output_deltasigma2_dither(self):
+        self.check_average(DeltaSigma2, dither=True)
+
+    def test_output_deltasigma_mash(self):
+        self.check_average(DeltaSigmaMash)
+
+    def test_output_deltasigma_mash_dither(self):
+        self.check_average(DeltaSigmaMash, dither=True)
+
+    def sine_test(self, dut, samples, periods, amplitude, output):
+        for n in range(samples):
+            value = 2**11 + amplitude * 2**12 * sin(2 * pi * periods * n / samples)
+            yield dut.input.eq(int(value))
+            yield
+            output.append((yield dut.output))
+
+    def snr(self, output, periods, osr):
+        """In-band signal to noise ratio, in dB"""
+        import numpy as np
+
+        spectrum = np.abs(np.fft.rfft((output - np.mean(output)) * np.hanning(len(output))))**2
+        band = len(spectrum) // osr
+        signal = spectrum[periods - 2:periods + 3].sum()  # spread by the window
+        noise = spectrum[1:band].sum() - signal
+        return 10 * np.log10(signal / noise)
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "numpy not installed")
+    def test_output_deltasigma_snr(self):
+        samples = 8192
+        periods = 8
+        osr = 32
+        snr = {}
+        for name, modulator in [("1st order", DeltaSigma(12)), ("2nd order", DeltaSigma2(12)),
+                                ("MASH 1-1-1", DeltaSigmaMash(12))]:
+            output = []
+            run_simulation(modulator, [self.sine_test(modulator, samples, periods, 0.3, output)],
+                vcd_name=inspect.stack()[0][3] + f"_{name.replace(' ', '_')}.vcd")
+            snr[name] = self.snr(output[1:], periods, osr)
+        self.assertGreater(snr["2nd order"], snr["1st order"] + 10)
+        self.assertGreater(snr["MASH 1-1-1"], snr["2nd order"] + 10)
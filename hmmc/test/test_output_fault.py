@@ -0,0 +1,146 @@
+import unittest
+import inspect
+from migen import Module, run_simulation
+from hmmc.output.fault import FaultManager
+from hmmc.output.pwm import Pwm, PwmHighRes, DeadTime, DeadTimeComplementary, BootstrapRefresh
+from hmmc.output.pushpull import PushPull
+
+
+class OutputStages(Module):
+    """All the output stages, with the same commands, and their outputs"""
+    def __init__(self):
+        self.submodules.pwm = pwm = Pwm(8)
+        self.submodules.deadtime = deadtime = DeadTime(4)
+        self.submodules.complementary = complementary = DeadTimeComplementary(4, 3)
+        self.submodules.bootstrap = bootstrap = BootstrapRefresh(4, 50)
+        self.submodules.pushpull = pushpull = PushPull(20)
+        self.submodules.dither = dither = PwmHighRes(8, 2)
+        self.submodules.serializer = serializer = PwmHighRes(8, 2, serializer=True)
+        self.stages = [pwm, deadtime, complementary, bootstrap, pushpull, dither, serializer]
+        self.comb += [
+            pwm.period.eq(99),
+            pwm.duty_cycle.eq(60),
+            dither.period.eq(99),
+            dither.duty_cycle.eq(4 * 40 + 1),
+            serializer.period.eq(99),
+            serializer.duty_cycle.eq(4 * 40 + 1),
+            deadtime.input.eq(pwm.output),
+            deadtime.deadtime.eq(3),
+            complementary.in_h.eq(pwm.output),
+            complementary.in_l.eq(~pwm.output),
+            bootstrap.in_h.eq(pwm.output),
+            bootstrap.in_l.eq(~pwm.output),
+            pushpull.duty_cycle.eq(15),
+        ]
+        self.outputs = [pwm.output, deadtime.out_h, deadtime.out_l, complementary.out_h,
+            complementary.out_l, bootstrap.out_h, bootstrap.out_l, pushpull.out_h, pushpull.out_l,
+            dither.output, serializer.output]
+
+
+class FaultShutdown(Module):
+    """Output stages killed by a FaultManager, and reference output stages which are never killed"""
+    def __init__(self, sync_stages):
+        self.submodules.fault = fault = FaultManager(2, sync_stages=sync_stages)
+        self.submodules.killed = killed = OutputStages()
+        self.submodules.reference = OutputStages()
+        for stage in killed.stages:
+            self.comb += stage.kill.eq(fault.kill)
+
+
+class TestFaultManager(unittest.TestCase):
+    def fault_test(self, dut):
+        yield dut.mask.eq(0b10)
+        yield dut.latching.eq(0b01)
+        yield
+        # masked sources are counted, but do not kill
+        for _ in range(3):
+            yield dut.fault.eq(0b10)
+            yield
+            self.assertEqual((yield dut.kill), 0)
+            yield dut.fault.eq(0)
+            yield
+        self.assertEqual((yield dut.count[1]), 3)
+        # non latching source: kill only while in fault
+        yield dut.mask.eq(0)
+        yield dut.fault.eq(0b10)
+        yield
+        self.assertEqual((yield dut.kill), 1)
+        self.assertEqual((yield dut.active), 0b10)
+        yield dut.fault.eq(0)
+        yield
+        self.assertEqual((yield dut.kill), 0)
+        self.assertEqual((yield dut.latched), 0)
+        # latching source: kill until clear
+        yield dut.fault.eq(0b01)
+        yield
+        self.assertEqual((yield dut.kill), 1)
+        yield dut.fault.eq(0)
+        for _ in range(5):
+            yield
+            self.assertEqual((yield dut.kill), 1)
+            self.assertEqual((yield dut.latched), 0b01)
+        yield dut.clear.eq(1)
+        yield
+        yield dut.clear.eq(0)
+        yield
+        self.assertEqual((yield dut.kill), 0)
+        # clear has no effect while the fault is present
+        yield dut.fault.eq(0b01)
+        yield dut.clear.eq(1)
+        yield
+        yield dut.clear.eq(0)
+        yield dut.fault.eq(0)
+        yield
+        self.assertEqual((yield dut.kill), 1)
+        self.assertEqual((yield dut.count[0]), 2)
+        self.assertEqual((yield dut.count[1]), 4)
+        yield dut.clear_counters.eq(1)
+        yield
+        yield dut.clear_counters.eq(0)
+        yield
+        self.assertEqual((yield dut.count[0]), 0)
+        self.assertEqual((yield dut.count[1]), 0)
+
+    def test_output_fault_manager(self):
+        dut = FaultManager(2, sync_stages=0)
+        run_simulation(dut, [self.fault_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def latency_test(self, dut, fault_time):
+        outputs = list(zip(dut.killed.outputs, dut.reference.outputs))
+        for _ in range(fault_time):
+            yield
+            for killed, reference in outputs:
+                self.assertEqual((yield killed), (yield reference))
+        yield dut.fault.fault.eq(0b01)
+        yield
+        # the fault input is '1' from this clock cycle: the outputs are unchanged during `latency`
+        # clock cycles, then all '0'
+        for cycle in range(300):
+            if cycle < dut.fault.latency:
+                for killed, reference in outputs:
+                    self.assertEqual((yield killed), (yield reference))
+            else:
+                for killed, reference in outputs:
+                    self.assertEqual((yield killed), 0)
+            yield
+        yield dut.fault.fault.eq(0)
+        for _ in range(dut.fault.latency + 1):
+            yield
+        yield dut.fault.clear.eq(1)
+        yield
+        yield dut.fault.clear.eq(0)
+        yield
+        self.assertEqual((yield dut.fault.kill), 0)
+        # the bootstrap capacitor is refreshed first
+        yield
+        self.assertEqual((yield dut.killed.bootstrap.out_l), 1)
+
+    def test_output_fault_latency(self):
+        for sync_stages in [0, 2]:
+            # each output is '1' when the fault is set in one of the tests
+            for fault_time in [10, 70]:
+                with self.subTest(sync_stages=sync_stages, fault_time=fault_time):
+                    dut = FaultShutdown(sync_stages)
+                    self.assertEqual(dut.fault.latency, sync_stages)
+                    run_simulation(dut, [self.latency_test(dut, fault_time)],
+                        vcd_name=inspect.stack()[0][3] + ".vcd")
@@ -1,8 +1,9 @@
 import unittest
 import inspect
+import re
 from random import randint
 from migen import Module, Signal, passive, run_simulation
-from hmmc.output.stepdir import StepDir, Quadrature
+from hmmc.output.stepdir import StepDir, StepDirBank, Quadrature
 
 
 class TestOutputStepDir(unittest.TestCase):
@@ -101,3 +102,247 @@ class TestOutputStepDir(unittest.TestCase):
                                 self.count_pos(dut)],
                 vcd_name=inspect.stack()[0][3] + f"{i}.vcd")
             assert self.pos == sum(seq)
+
+    @passive
+    def record(self, dut):
+        self.trace = []
+        while True:
+            self.trace.append(((yield dut.step), (yield dut.dir)))
+            yield
+
+    def burst(self, dut, steps):
+        for step in steps:
+            yield (dut.up if step > 0 else dut.down).eq(1)
+            yield
+            yield dut.up.eq(0)
+            yield dut.down.eq(0)
+        for _ in range(200):
+            yield
+
+    def test_output_stepdir_timing(self):
+        dut = StepDir(3, 5, depth=16)
+
+        def bursts():
+            yield from self.burst(dut, [-1] * 10)
+            yield from self.burst(dut, [1] * 12)
+
+        run_simulation(dut, [bursts(), self.record(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+        step = "".join(str(s) for s, _ in self.trace).strip("0")
+        # pulses of 3 clock ticks, with 3 clock ticks between pulses
+        self.assertEqual(re.split("0{4,}", step), ["111000" * 9 + "111", "111000" * 11 + "111"])
+        # direction setup time
+        rises = [n for n in range(1, len(self.trace))
+                 if self.trace[n][0] and not self.trace[n - 1][0]]
+        changes = [n for n in range(1, len(self.trace))
+                   if self.trace[n][1] != self.trace[n - 1][1]]
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(min(r - changes[0] for r in rises if r > changes[0]), 5)
+        self.assertEqual(len(rises), 22)
+
+    def overflow_test(self, dut):
+        yield from self.burst(dut, [1] * 10)
+        self.assertEqual((yield dut.overflow), 1)
+        self.assertEqual(self.pos + (yield dut.lost_count), 10)
+        self.assertGreater((yield dut.lost_count), 0)
+        position = self.pos
+        yield dut.lost_clear.eq(1)
+        yield
+        yield dut.lost_clear.eq(0)
+        yield
+        self.assertEqual((yield dut.overflow), 0)
+        self.assertEqual((yield dut.lost_count), 0)
+        yield from self.burst(dut, [-1] * 4)
+        self.assertEqual((yield dut.overflow), 0)
+        self.assertEqual(self.pos, position - 4)
+
+    def test_output_stepdir_overflow(self):
+        dut = StepDir(2, 2, depth=4)
+        run_simulation(dut, [self.overflow_test(dut), self.count_pos(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+
+class TestQuadrature(unittest.TestCase):
+    quad_codes = [0b00, 0b01, 0b11, 0b10]  # a = bit 0, b = bit 1
+
+    @passive
+    def decode(self, dut):
+        """Quadrature decoder, with the minimum time between edges"""
+        self.pos = 0
+        self.min_time = None
+        last = 0
+        time = None
+        while True:
+            yield
+            code = (yield dut.a) | (yield dut.b) << 1
+            if time is not None:
+                time += 1
+            if code == last:
+                continue
+            delta = (self.quad_codes.index(code) - self.quad_codes.index(last)) % 4
+            self.assertIn(delta, [1, 3], msg="invalid transition")
+            self.pos += 1 if delta == 1 else -1
+            if time is not None and (self.min_time is None or time < self.min_time):
+                self.min_time = time
+            time = 0
+            last = code
+
+    def burst(self, dut, counts, pause=0):
+        for count in counts:
+            yield (dut.up if count > 0 else dut.down).eq(1)
+            yield
+            yield dut.up.eq(0)
+            yield dut.down.eq(0)
+            for _ in range(pause):
+                yield
+
+    def legacy_test(self, dut):
+        yield from self.burst(dut, [1] * 5 + [-1] * 2)
+        for _ in range(3):
+            yield
+        self.assertEqual(self.pos, 3)
+        self.assertEqual(self.min_time, 1)  # one edge per clock tick
+
+    def test_output_quadrature(self):
+        dut = Quadrature()
+        run_simulation(dut, [self.legacy_test(dut), self.decode(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def paced_test(self, dut):
+        # burst of counts faster than the maximum rate
+        yield from self.burst(dut, [1] * 12)
+        self.assertGreater((yield dut.backlog), 0)
+        yield from self.burst(dut, [-1] * 2, pause=20)
+        for _ in range(100):
+            yield
+        self.assertEqual(self.pos, 10)
+        self.assertEqual(self.min_time, 7)
+        self.assertEqual((yield dut.backlog), 0)
+        self.assertEqual((yield dut.overflow), 0)
+        # overflow
+        yield from self.burst(dut, [-1] * 30)
+        for _ in range(300):
+            yield
+        self.assertEqual((yield dut.overflow), 1)
+        self.assertEqual(self.pos - 10 - (yield dut.lost_count), -30)
+
+    def test_output_quadrature_paced(self):
+        dut = Quadrature(edge_spacing=7, depth=16)
+        run_simulation(dut, [self.paced_test(dut), self.decode(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+
+class TestStepDirBank(unittest.TestCase):
+    quad_codes = [0b00, 0b01, 0b11, 0b10]  # a = bit 0, b = bit 1
+
+    @passive
+    def count_pos(self, dut, n_axes):
+        """Step/Dir and Quadrature counters, with the minimum time between edges"""
+        self.pos = [0] * n_axes
+        self.min_time = [None] * n_axes
+        last = [(0, 0)] * n_axes
+        time = [None] * n_axes  # not measured before the first edge
+        while True:
+            yield
+            for n in range(n_axes):
+                step, direction = (yield dut.step[n]), (yield dut.dir[n])
+                if time[n] is not None:
+                    time[n] += 1
+                if (step, direction) == last[n]:
+                    continue
+                if time[n] is not None and (self.min_time[n] is None
+                                            or time[n] < self.min_time[n]):
+                    self.min_time[n] = time[n]
+                time[n] = 0
+                if (yield dut.quadrature[n]):
+                    old = self.quad_codes.index(last[n][0] | last[n][1] << 1)
+                    new = self.quad_codes.index(step | direction << 1)
+                    self.pos[n] += 1 if new == (old + 1) % 4 else -1
+                elif step and not last[n][0]:
+                    self.pos[n] += 1 if direction else -1
+                last[n] = (step, direction)
+
+    def moves(self, dut, moves):
+        yield dut.quadrature[2].eq(1)
+        yield
+        for cycle in range(max(len(m) for m in moves)):
+            for n, move in enumerate(moves):
+                step = move[cycle] if cycle < len(move) else 0
+                yield dut.up[n].eq(step > 0)
+                yield dut.down[n].eq(step < 0)
+            yield
+        for n in range(len(moves)):
+            yield dut.up[n].eq(0)
+            yield dut.down[n].eq(0)
+        for _ in range(500):
+            yield
+        for n, move in enumerate(moves):
+            self.assertEqual(self.pos[n], sum(move), msg=f"axis {n}")
+            self.assertEqual((yield dut.overflow[n]), 0)
+        # durations rounded up to multiples of 3 clock ticks
+        self.assertEqual(self.min_time, [6, 6, 6])
+
+    def test_output_stepdir_bank(self):
+        dut = StepDirBank(3, 5, 7)
+        moves = [
+            [1, 0] * 5 + [0] * 20 + [-1, 0, 0] * 3,
+            [-1] * 8,
+            [1, 0, 0] * 4 + [0] * 30 + [-1] * 6,
+        ]
+        run_simulation(dut, [self.moves(dut, moves), self.count_pos(dut, 3)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def overflow_test(self, dut):
+        # burst of 10 steps on axis 1, with 4 pending steps at most
+        yield dut.up[1].eq(1)
+        for _ in range(10):
+            yield
+        yield dut.up[1].eq(0)
+        for _ in range(500):
+            yield
+        lost = (yield dut.lost_count[1])
+        self.assertGreater(lost, 0)
+        self.assertEqual((yield dut.overflow[1]), 1)
+        self.assertEqual(self.pos[1], 10 - lost)
+        for n in [0, 2]:
+            self.assertEqual((yield dut.overflow[n]), 0)
+            self.assertEqual((yield dut.lost_count[n]), 0)
+        yield dut.lost_clear[1].eq(1)
+        yield
+        yield dut.lost_clear[1].eq(0)
+        yield
+        self.assertEqual((yield dut.overflow[1]), 0)
+        self.assertEqual((yield dut.lost_count[1]), 0)
+
+    def test_output_stepdir_bank_overflow(self):
+        dut = StepDirBank(3, 5, 7, depth=4)
+        run_simulation(dut, [self.overflow_test(dut), self.count_pos(dut, 3)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def single_axis(self, dut, steps):
+        for step in steps:
+            for up, down in [(dut.single.up, dut.single.down), (dut.bank.up[0], dut.bank.down[0])]:
+                yield up.eq(step > 0)
+                yield down.eq(step < 0)
+            for _ in range(3):
+                yield
+        for _ in range(50):
+            yield
+
+    @passive
+    def compare(self, dut):
+        while True:
+            self.assertEqual((yield dut.bank.step[0]), (yield dut.single.step))
+            self.assertEqual((yield dut.bank.dir[0]), (yield dut.single.dir))
+            yield
+
+    def test_output_stepdir_bank_single(self):
+        class Single(Module):
+            def __init__(self):
+                self.submodules.single = StepDir(4, 6)
+                self.submodules.bank = StepDirBank(1, 4, 6)
+
+        dut = Single()
+        steps = [1, 1, 0, 1, -1, -1, 0, 0, 0, 1, 1, 1, 1, 1, -1]
+        run_simulation(dut, [self.single_axis(dut, steps), self.compare(dut)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
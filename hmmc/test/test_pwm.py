@@ -1,9 +1,9 @@
 import unittest
 import inspect
 from math import ceil, log2
-from migen import run_simulation, passive
-from hmmc.output.pwm import Pwm, DeadTime, PulseGuard, DeadTimeComplementary, \
-    BootstrapRefresh
+from migen import Module, Signal, run_simulation, passive
+from hmmc.output.pwm import Pwm, PwmBank, PwmCounter, PwmHighRes, DeadTime, PulseGuard, \
+    DeadTimeComplementary, BootstrapRefresh
 
 
 class TestPwm(unittest.TestCase):
@@ -45,6 +45,234 @@ class TestPwm(unittest.TestCase):
         run_simulation(dut, [self.pwm_test(dut, 100, 20)], vcd_name=inspect.stack()[0][3] + ".vcd")
 
 
+class TestPwmBank(unittest.TestCase):
+    class BankVsPwm(Module):
+        """A PwmBank next to independent Pwm, which should generate the same outputs"""
+        def __init__(self, phases, period, center_mode, sync_update=False):
+            self.submodules.bank = bank = PwmBank(len(phases), 8, sync_update, phase_offsets=True)
+            self.pwms = [Pwm(8, sync_update, phase) for phase in phases]
+            self.submodules += self.pwms
+            self.comb += [
+                bank.period.eq(period),
+                bank.center_mode.eq(center_mode),
+            ]
+            for n, (pwm, phase) in enumerate(zip(self.pwms, phases)):
+                self.comb += [
+                    bank.phase[n].eq(phase),
+                    pwm.period.eq(period),
+                    pwm.center_mode.eq(center_mode),
+                    pwm.duty_cycle.eq(bank.duty_cycle[n]),
+                ]
+
+    def bank_test(self, dut, duty_cycles):
+        for n, dc in enumerate(duty_cycles):
+            yield dut.bank.duty_cycle[n].eq(dc)
+        for cnt in range(300):
+            for n, pwm in enumerate(dut.pwms):
+                self.assertEqual((yield dut.bank.output[n]), (yield pwm.output),
+                    msg=f"channel={n} cnt={cnt}")
+                self.assertEqual((yield dut.bank.cycle_update[n]), (yield pwm.cycle_update),
+                    msg=f"channel={n} cnt={cnt}")
+            yield
+
+    def test_pwm_bank_edge(self):
+        dut = self.BankVsPwm([0, 0, 33, 66], 99, 0)
+        run_simulation(dut, [self.bank_test(dut, [20, 50, 50, 50])],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def test_pwm_bank_center(self):
+        dut = self.BankVsPwm([0, 17, 34, 50], 50, 1, sync_update=True)
+        run_simulation(dut, [self.bank_test(dut, [10, 25, 25, 40])],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def interleaved_test(self, dut, period, phases, dc):
+        # channels are the same waveform, shifted by their phase
+        yield dut.period.eq(period)
+        for n, phase in enumerate(phases):
+            yield dut.phase[n].eq(phase)
+            yield dut.duty_cycle[n].eq(dc)
+        yield
+        outputs = [[] for _ in phases]
+        for _ in range(4 * (period + 1)):
+            for n in range(len(phases)):
+                outputs[n].append((yield dut.output[n]))
+            yield
+        for n, phase in enumerate(phases[1:], 1):
+            self.assertEqual(outputs[n][:-phase], outputs[0][phase:])
+
+    def test_pwm_bank_interleaved(self):
+        dut = PwmBank(3, 8, phase_offsets=True)
+        run_simulation(dut, [self.interleaved_test(dut, 59, [0, 20, 40], 15)],
+            vcd_name=inspect.stack()[0][3] + ".vcd")
+
+
+class TestPwmShadow(unittest.TestCase):
+    def high_times(self, pwm, cycles):
+        """High time of each PWM cycle, starting at the next cycle"""
+        while (yield pwm.counter.count) != 0:
+            yield
+        high = []
+        for _ in range(cycles):
+            high.append(0)
+            while True:
+                high[-1] += (yield pwm.output)
+                yield
+                if (yield pwm.counter.count) == 0:
+                    break
+        return high
+
+    def shadow_test(self, dut):
+        yield dut.period.eq(19)
+        yield dut.duty_cycle.eq(5)
+        yield dut.load.eq(1)
+        yield
+        yield dut.load.eq(0)
+        yield
+        self.assertEqual((yield from self.high_times(dut, 2)), [5, 5])
+        # not applied without load
+        yield dut.duty_cycle.eq(12)
+        yield dut.period.eq(29)
+        self.assertEqual((yield from self.high_times(dut, 2)), [5, 5])
+        # load in the middle of a cycle: applied at the start of the next one
+        for _ in range(7):
+            yield
+        yield dut.load.eq(1)
+        yield
+        yield dut.load.eq(0)
+        self.assertEqual((yield dut.counter.active_period), 19)
+        self.assertEqual((yield from self.high_times(dut, 2)), [12, 12])
+        self.assertEqual((yield dut.counter.active_period), 29)
+
+    def test_pwm_shadow(self):
+        dut = Pwm(8, shadow=True)
+        run_simulation(dut, [self.shadow_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def atomic_test(self, dut):
+        for pwm in dut.pwms:
+            yield pwm.period.eq(30)
+            yield pwm.center_mode.eq(1)
+            yield pwm.duty_cycle.eq(10)
+        yield dut.load.eq(1)
+        yield
+        yield dut.load.eq(0)
+        for _ in range(100):
+            yield
+        for n, pwm in enumerate(dut.pwms):
+            yield pwm.duty_cycle.eq(20 + n)
+        for _ in range(23):
+            yield
+        yield dut.load.eq(1)
+        yield
+        yield dut.load.eq(0)
+        # all the outputs switch to the new duty cycles during the same PWM cycle
+        while not (yield dut.pwms[0].counter.loading):
+            yield
+        for pwm in dut.pwms:
+            self.assertEqual((yield pwm.counter.loading), 1)
+        yield
+        for pwm in dut.pwms:
+            self.assertEqual((yield pwm.counter.active_center_mode), 1)
+        self.assertEqual((yield from self.high_times(dut.pwms[1], 1)), [2 * 21 - 1])
+
+    def test_pwm_shadow_atomic(self):
+        class Phases(Module):
+            def __init__(self):
+                self.load = Signal()
+                self.pwms = [Pwm(8, shadow=True) for _ in range(3)]
+                self.submodules += self.pwms
+                self.comb += [pwm.load.eq(self.load) for pwm in self.pwms]
+
+        dut = Phases()
+        run_simulation(dut, [self.atomic_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def trigger_test(self, dut, period, compare, edges):
+        yield dut.period.eq(period)
+        yield dut.center_mode.eq(1)
+        yield dut.trigger_compare[0].eq(compare)
+        yield dut.trigger_edges[0].eq(edges)
+        yield dut.load.eq(1)
+        yield
+        yield dut.load.eq(0)
+        yield
+        events = []
+        for _ in range(4 * period):
+            for name in ["top", "bottom"]:
+                if (yield getattr(dut, name)):
+                    events.append((name, (yield dut.count)))
+            if (yield dut.trigger[0]):
+                events.append(("trigger", (yield dut.count), (yield dut.up_cnt)))
+            yield
+        return events
+
+    def test_pwm_trigger(self):
+        dut = PwmCounter(8, shadow=True, n_triggers=1)
+        events = []
+
+        def gen():
+            events.extend((yield from self.trigger_test(dut, 10, 3, 0b01)))
+
+        run_simulation(dut, [gen()], vcd_name=inspect.stack()[0][3] + ".vcd")
+        self.assertEqual(events[:6], [("bottom", 0), ("trigger", 3, 1), ("top", 10),
+                                      ("bottom", 0), ("trigger", 3, 1), ("top", 10)])
+
+    def test_pwm_trigger_both_edges(self):
+        dut = PwmCounter(8, shadow=True, n_triggers=1)
+        events = []
+
+        def gen():
+            events.extend((yield from self.trigger_test(dut, 10, 3, 0b11)))
+
+        run_simulation(dut, [gen()], vcd_name=inspect.stack()[0][3] + ".vcd")
+        self.assertEqual(events[:5], [("bottom", 0), ("trigger", 3, 1), ("top", 10),
+                                      ("trigger", 3, 0), ("bottom", 0)])
+
+
+class TestPwmHighRes(unittest.TestCase):
+    def high_slots(self, dut, period, duty_cycle, center_mode, cycles):
+        """Count the '1' time slots of each PWM cycle"""
+        yield dut.period.eq(period)
+        yield dut.duty_cycle.eq(duty_cycle)
+        yield dut.center_mode.eq(center_mode)
+        while not (yield dut.cycle_update):  # wait for the settings to be applied
+            yield
+        yield
+        while not (yield dut.cycle_update):
+            yield
+        slots = []
+        for _ in range(cycles):
+            high = 0
+            for _ in range(2 * period if center_mode else period + 1):
+                high += bin((yield dut.output)).count("1")
+                yield
+            slots.append(high)
+        return slots
+
+    def dither_test(self, dut):
+        duty_cycle = 37 * 4 + 1  # 37.25 clock cycles
+        slots = yield from self.high_slots(dut, 99, duty_cycle, 0, 12)
+        self.assertEqual(sorted(set(slots)), [37, 38])  # 1 clock cycle of jitter
+        self.assertEqual(sum(slots[-8:]) * 4, duty_cycle * 8)  # but the average is exact
+        duty_cycle = 20 * 4 + 3
+        slots = yield from self.high_slots(dut, 99, duty_cycle, 0, 12)
+        self.assertEqual(sum(slots[-8:]) * 4, duty_cycle * 8)
+
+    def test_pwm_highres_dither(self):
+        dut = PwmHighRes(8, 2)
+        run_simulation(dut, [self.dither_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+    def serializer_test(self, dut):
+        duty_cycle = 37 * 4 + 1
+        slots = yield from self.high_slots(dut, 99, duty_cycle, 0, 3)
+        self.assertEqual(slots, [duty_cycle] * 3)  # every cycle has the full resolution
+        # center mode: the fractional part is added at both ends of the pulse
+        slots = yield from self.high_slots(dut, 99, duty_cycle, 1, 3)
+        self.assertEqual(slots, [(2 * 37 - 1) * 4 + 2] * 3)
+
+    def test_pwm_highres_serializer(self):
+        dut = PwmHighRes(8, 2, serializer=True)
+        run_simulation(dut, [self.serializer_test(dut)], vcd_name=inspect.stack()[0][3] + ".vcd")
+
+
 class TestDeadTime(unittest.TestCase):
     def deadtime_test_setup(self, dut, dt):
         yield dut.input.eq(0)
@@ -0,0 +1,51 @@
+import unittest
+import inspect
+from migen import Module, run_simulation, passive
+from hmmc.utils.uart import UartRx, UartTx
+
+
+class UartLoopback(Module):
+    def __init__(self, fclk, baudrate):
+        self.submodules.tx = UartTx(fclk, baudrate, setup=3, hold=2)
+        self.submodules.rx = UartRx(fclk, baudrate)
+        self.comb += self.rx.rx.eq(self.tx.tx)
+
+
+class TestUart(unittest.TestCase):
+    def send(self, dut, data):
+        for byte in data:
+            yield dut.tx.data.eq(byte)
+            yield dut.tx.valid.eq(1)
+            yield
+            while (yield dut.tx.ready) == 0:
+                yield
+            yield
+            yield dut.tx.valid.eq(0)
+        while (yield dut.tx.idle) == 0:
+            yield
+        for _ in range(20):
+            yield
+
+    @passive
+    def receive(self, dut):
+        self.received = []
+        while True:
+            self.assertEqual((yield dut.rx.error), 0)
+            if (yield dut.rx.valid):
+                self.received.append((yield dut.rx.data))
+            yield
+
+    @passive
+    def check_txe(self, dut):
+        while True:
+            if (yield dut.tx.tx) == 0:
+                self.assertEqual((yield dut.tx.txe), 1)
+            yield
+
+    def test_utils_uart_loopback(self):
+        data = [0x00, 0x55, 0xAA, 0xFF, 0x32, 0x80]
+        for fclk in [10e6, 25e6, 33e6]:
+            dut = UartLoopback(fclk, 2.5e6)
+            run_simulation(dut, [self.send(dut, data), self.receive(dut), self.check_txe(dut)],
+                vcd_name=inspect.stack()[0][3] + f"_{fclk}.vcd")
+            self.assertEqual(self.received, data)
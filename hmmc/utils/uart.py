@@ -0,0 +1,195 @@
+"""
+UART
+====
+
+Simple 8N1 UART, suitable for half-duplex RS485 links such as the ones found on serial encoders.
+"""
+
+from migen import Module, Signal, FSM, NextState, NextValue, If, Cat
+
+
+class UartTx(Module):
+    """UART transmitter with RS485 driver enable control
+
+    `txe` is asserted `setup` clock cycles before the start bit, and released `hold` clock cycles
+    after the end of the stop bit, so that the RS485 driver is only enabled while transmitting.
+
+    :param fclk: clock frequency of the design
+    :type fclk: int
+    :param baudrate: baudrate of the serial link
+    :type baudrate: int
+    :param setup: clock cycles between `txe` assertion and the start bit
+    :type setup: int
+    :param hold: clock cycles between the end of the stop bit and `txe` release
+    :type hold: int
+
+    :inputs:
+        - **data** ( :class:`migen.fhdl.structure.Signal` (8)) - byte to transmit
+        - **valid** ( :class:`migen.fhdl.structure.Signal` ) - `data` is valid
+
+    :outputs:
+        - **ready** ( :class:`migen.fhdl.structure.Signal` ) - `data` is accepted when
+          `valid & ready`
+        - **idle** ( :class:`migen.fhdl.structure.Signal` ) - '1' when not transmitting
+        - **tx** ( :class:`migen.fhdl.structure.Signal` ) - serial output
+        - **txe** ( :class:`migen.fhdl.structure.Signal` ) - RS485 driver enable
+    """
+    def __init__(self, fclk, baudrate, setup=1, hold=0):
+        div = round(fclk / baudrate)
+        assert div >= 2
+
+        # inputs
+        self.data = Signal(8)
+        self.valid = Signal()
+
+        # outputs
+        self.ready = Signal()
+        self.idle = Signal()
+        self.tx = Signal(reset=1)
+        self.txe = Signal()
+
+        # # #
+
+        shift = Signal(10, reset_less=True)  # start bit, data, stop bit
+        bit_cnt = Signal(max=11)
+        cnt = Signal(max=max(div, setup, hold) + 1)
+
+        self.submodules.fsm = fsm = FSM("IDLE")
+        fsm.act("IDLE",
+            self.ready.eq(1),
+            self.idle.eq(1),
+            If(self.valid,
+                NextValue(shift, Cat(0, self.data, 1)),
+                NextValue(bit_cnt, 10),
+                NextValue(cnt, setup),
+                NextState("SETUP"),
+            ),
+        )
+        fsm.act("SETUP",
+            self.txe.eq(1),
+            If(cnt == 0,
+                NextValue(cnt, div - 1),
+                NextValue(self.tx, shift[0]),
+                NextState("SEND"),
+            ).Else(
+                NextValue(cnt, cnt - 1),
+            ),
+        )
+        fsm.act("SEND",
+            self.txe.eq(1),
+            If(cnt == 0,
+                NextValue(cnt, div - 1),
+                NextValue(shift, shift[1:]),
+                NextValue(bit_cnt, bit_cnt - 1),
+                If(bit_cnt == 1,
+                    NextValue(self.tx, 1),
+                    NextValue(cnt, hold),
+                    NextState("HOLD"),
+                ).Else(
+                    NextValue(self.tx, shift[1]),
+                ),
+            ).Else(
+                NextValue(cnt, cnt - 1),
+            ),
+        )
+        fsm.act("HOLD",
+            self.txe.eq(1),
+            If(cnt == 0,
+                NextState("IDLE"),
+            ).Else(
+                NextValue(cnt, cnt - 1),
+            ),
+        )
+
+
+class UartRx(Module):
+    """Oversampling UART receiver
+
+    The input is resynchronized, then each bit is sampled by a majority vote over 3 consecutive
+    samples taken around the middle of the bit.
+
+    :param fclk: clock frequency of the design
+    :type fclk: int
+    :param baudrate: baudrate of the serial link
+    :type baudrate: int
+
+    :inputs:
+        - **rx** ( :class:`migen.fhdl.structure.Signal` ) - serial input
+
+    :outputs:
+        - **data** ( :class:`migen.fhdl.structure.Signal` (8)) - received byte
+        - **valid** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when a byte is
+          received
+        - **error** ( :class:`migen.fhdl.structure.Signal` ) - '1' for 1 clk tick when a framing
+          error is detected (invalid stop bit)
+        - **idle** ( :class:`migen.fhdl.structure.Signal` ) - '1' when not receiving
+    """
+    def __init__(self, fclk, baudrate):
+        div = round(fclk / baudrate)
+        assert div >= 4
+
+        # inputs
+        self.rx = Signal(reset=1)
+
+        # outputs
+        self.data = Signal(8)
+        self.valid = Signal()
+        self.error = Signal()
+        self.idle = Signal()
+
+        # # #
+
+        rx_f = Signal(4, reset=0b1111)  # 2 resynchronization stages, then 2 samples history
+        sample = Signal()  # majority vote on the last 3 samples
+        self.sync += rx_f.eq(Cat(self.rx, rx_f[0:-1]))
+        self.comb += sample.eq((rx_f[1] & rx_f[2]) | (rx_f[1] & rx_f[3]) | (rx_f[2] & rx_f[3]))
+
+        bit_cnt = Signal(max=9)
+        cnt = Signal(max=div)
+
+        self.submodules.fsm = fsm = FSM("IDLE")
+        fsm.act("IDLE",
+            self.idle.eq(1),
+            If(~rx_f[1],
+                # 1 sample after the middle of the start bit, so that the vote is centered
+                NextValue(cnt, div // 2),
+                NextState("START"),
+            ),
+        )
+        fsm.act("START",
+            If(cnt == 0,
+                NextValue(cnt, div - 1),
+                NextValue(bit_cnt, 8),
+                If(sample,
+                    NextState("IDLE"),  # glitch
+                ).Else(
+                    NextState("DATA"),
+                ),
+            ).Else(
+                NextValue(cnt, cnt - 1),
+            ),
+        )
+        fsm.act("DATA",
+            If(cnt == 0,
+                NextValue(cnt, div - 1),
+                NextValue(self.data, Cat(self.data[1:], sample)),
+                NextValue(bit_cnt, bit_cnt - 1),
+                If(bit_cnt == 1,
+                    NextState("STOP"),
+                ),
+            ).Else(
+                NextValue(cnt, cnt - 1),
+            ),
+        )
+        fsm.act("STOP",
+            If(cnt == 0,
+                If(sample,
+                    self.valid.eq(1),
+                ).Else(
+                    self.error.eq(1),
+                ),
+                NextState("IDLE"),
+            ).Else(
+                NextValue(cnt, cnt - 1),
+            ),
+        )